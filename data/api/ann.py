@@ -0,0 +1,145 @@
+import numpy as np
+
+from features import as_dense, similarities
+from scoring import top_n
+
+# Nearest-neighbour indexes over the content feature matrix (a dense array or
+# CompactFeatures). Similarity is the plain dot product, the same as
+# linear_kernel in ContentRecommender. Every
+# index answers search(queries, n, allowed=None) -> (indices, scores) for a
+# batch of queries, where allowed is an optional boolean mask over the items
+# (attribute filters; excluded items are never returned), and can be saved as
+# (params, arrays) with get_state / from_state.
+
+
+def masked_top_n(scores, n, allowed=None):
+    # top_n over the allowed columns only; rows with fewer allowed items than n
+    # are padded with -1 / -inf
+    if allowed is None:
+        return top_n(scores, n)
+    scores[:, ~allowed] = -np.inf
+    idx, top_scores = top_n(scores, n)
+    idx[~np.isfinite(top_scores)] = -1
+    return idx, top_scores
+
+
+class ExactIndex:
+    kind = 'exact'
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def get_state(self):
+        return {}, {}
+
+    @classmethod
+    def from_state(cls, vectors, params, arrays):
+        return cls(vectors)
+
+    def search(self, queries, n, allowed=None):
+        return masked_top_n(similarities(self.vectors, queries), n, allowed)
+
+
+def _unit_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+# Inverted file index: items are clustered with k-means and a query only scans
+# the n_probe lists whose centroids score highest. n_probe is the recall vs
+# latency knob; n_probe >= n_lists is an exact scan.
+class IVFIndex:
+    kind = 'ivf'
+
+    def __init__(self, vectors, n_lists=None, n_probe=8, n_iter=10, seed=0):
+        self.vectors = vectors
+        self.n_lists = min(n_lists or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        self.n_probe = n_probe
+
+        self.centroids, assignments = self._kmeans(as_dense(vectors), self.n_lists, n_iter, seed)
+
+        # List members as one permutation of the catalog rows plus offsets, so a
+        # probed list is a slice of item ids into the one feature matrix
+        self.list_items = np.argsort(assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def get_state(self):
+        params = {'n_lists': self.n_lists, 'n_probe': self.n_probe}
+        arrays = {
+            'centroids': self.centroids,
+            'list_items': self.list_items,
+            'list_offsets': self.list_offsets,
+        }
+        return params, arrays
+
+    @classmethod
+    def from_state(cls, vectors, params, arrays):
+        index = cls.__new__(cls)
+        index.vectors = vectors
+        index.n_lists = params['n_lists']
+        index.n_probe = params['n_probe']
+        index.centroids = arrays['centroids']
+        index.list_items = arrays['list_items']
+        index.list_offsets = arrays['list_offsets']
+        return index
+
+    @staticmethod
+    def _kmeans(vectors, k, n_iter, seed):
+        # Spherical k-means: centroids are kept at unit length, so assigning and
+        # probing by dot product picks the centroid with the highest cosine
+        rng = np.random.default_rng(seed)
+        centroids = _unit_rows(vectors[rng.choice(len(vectors), size=k, replace=False)].astype(np.float64))
+        for _ in range(n_iter):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            counts = np.bincount(assignments, minlength=k)
+            filled = counts > 0
+            centroids[filled] = _unit_rows(sums[filled])
+        return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+    def search(self, queries, n, allowed=None, n_probe=None):
+        queries = np.atleast_2d(queries)
+        n_probe = n_probe or self.n_probe
+        n = min(n, len(self.vectors))
+        if n_probe >= self.n_lists:
+            return masked_top_n(similarities(self.vectors, queries), n, allowed)
+
+        # filtered-out items are dropped from the probed lists before scoring
+        list_allowed = None if allowed is None else allowed[self.list_items]
+        probes, _ = top_n(queries @ self.centroids.T, n_probe)
+        indices = np.full((len(queries), n), -1, dtype=np.int64)
+        scores = np.full((len(queries), n), -np.inf)
+        for q, (query, lists) in enumerate(zip(queries, probes)):
+            rows = np.concatenate([
+                np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in lists
+            ])
+            if list_allowed is not None:
+                rows = rows[list_allowed[rows]]
+            if len(rows) < n:
+                # Probed lists too small to fill the result; scan everything
+                rows = np.arange(len(self.list_items))
+                if list_allowed is not None:
+                    rows = rows[list_allowed]
+            items = self.list_items[rows]
+            top, top_scores = top_n(similarities(self.vectors[items], query), n)
+            indices[q, :top.shape[1]] = items[top[0]]
+            scores[q, :top.shape[1]] = top_scores[0]
+        return indices, scores
+
+
+INDEX_TYPES = {
+    'exact': ExactIndex,
+    'ivf': IVFIndex,
+}
+
+
+def build_index(vectors, kind='exact', **params):
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}', expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](vectors, **params)
+
+
+def load_index(vectors, kind, params, arrays):
+    return INDEX_TYPES[kind].from_state(vectors, params, arrays)
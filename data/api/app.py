@@ -1,26 +1,376 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from datetime import datetime
 import joblib
+import os
+import threading
+import time
 
-# ensure recommender.py is importable
-from recommender import HybridRecommender
+from artifact import MANIFEST_NAME, load_artifact
+from batching import MicroBatcher
+from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, count_error, observe_request
+from model_store import ModelHandle, ingest_record
+from profiler import from_env as profiler_from_env, maybe_profile
+from profiles import CART, PURCHASE
+from result_cache import RecommendationCache
 
 app = FastAPI()
 
-# load the trained model (must be in same folder)
-model: HybridRecommender = joblib.load("model.pkl")
+# per-process cache of recommendation lists; size with the /cache/stats hit rate
+cache = RecommendationCache(
+    max_entries=int(os.environ.get("REC_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.environ.get("REC_CACHE_TTL", "300")),
+)
+
+# largest list a request may ask for; n outside 1..MAX_N is rejected with a 422
+MAX_N = int(os.environ.get("MAX_RECOMMENDATIONS", "100"))
+
+# content similarity search: "exact" or "ivf" (approximate, tuned by CONTENT_INDEX_PROBES);
+# when unset the index stored with the model is used
+CONTENT_INDEX = os.environ.get("CONTENT_INDEX")
+
+def configure(scorer):
+    if CONTENT_INDEX == "ivf":
+        scorer.build_content_index("ivf", n_probe=int(os.environ.get("CONTENT_INDEX_PROBES", "8")))
+    elif CONTENT_INDEX:
+        scorer.build_content_index(CONTENT_INDEX)
+    return scorer
+
+# serialises model updates; recommendation reads don't take it
+ingest_lock = threading.Lock()
+
+# Applies one update made through /events or /invalidate to a scorer and returns
+# the variants ingested or cache entries evicted. In MODEL_STORE mode updates go
+# through the store's event log instead and every worker applies each record.
+def apply_update(scorer, record):
+    user_id = record["user_id"]
+    if record["op"] == "event":
+        with ingest_lock:
+            applied = ingest_record(scorer, record)
+        cache.invalidate_user(user_id)
+    else:
+        applied = cache.invalidate_user(user_id)
+    # recently active users are scored live until the next retrain
+    topk = getattr(scorer, "topk", None)
+    if topk is not None:
+        topk.mark_stale(user_id)
+    return applied
+
+# Multi-worker serving: publish with `python model_store.py model.pkl <store>` and start
+# the workers with MODEL_STORE=<store> (e.g. gunicorn -w 4 -k uvicorn.workers.UvicornWorker app:app).
+# Every worker maps the same read-only arrays and switches to a newly published
+# version within MODEL_CHECK_INTERVAL seconds. Events and invalidations reach
+# every worker within MODEL_EVENT_INTERVAL seconds through the store's event
+# log, and are replayed onto each newly loaded version (see model_store.py). A log
+# that grows past MODEL_EVENT_LOG_MAX_BYTES is folded into a new version so that
+# replay stays short.
+# Otherwise load the exported serving artifact (python artifact.py model.pkl artifact)
+# if present, or fall back to unpickling the full trained model (must be in same folder)
+MODEL_STORE = os.environ.get("MODEL_STORE")
+MODEL_ARTIFACT = os.environ.get("MODEL_ARTIFACT", "artifact")
+store = None
+if MODEL_STORE:
+    store = ModelHandle(
+        MODEL_STORE,
+        check_interval=float(os.environ.get("MODEL_CHECK_INTERVAL", "5")),
+        loader=lambda path: configure(load_artifact(path)),
+        on_swap=lambda scorer, version: cache.clear(),
+        on_event=apply_update,
+        event_interval=float(os.environ.get("MODEL_EVENT_INTERVAL", "0.5")),
+        max_log_bytes=int(os.environ.get("MODEL_EVENT_LOG_MAX_BYTES", str(16 << 20))),
+    )
+elif os.path.exists(os.path.join(MODEL_ARTIFACT, MANIFEST_NAME)):
+    model = configure(load_artifact(MODEL_ARTIFACT))
+else:
+    model = configure(joblib.load("model.pkl"))
+
+# async endpoints pass wait=False so a version load or event replay never
+# runs on the event loop; they get the scorer in use until it's done
+def get_model(wait=True):
+    return store.get(wait) if store is not None else model
+
+# precomputed lists of an artifact exported with topk_size (see topk_store.py);
+# requests they can answer skip the cache and the scorer
+def get_topk(wait=True):
+    return getattr(get_model(wait), "topk", None)
+
+EVENT_KINDS = {"order": PURCHASE, "cart": CART}
+
+# SERVING_MODE=async coalesces concurrent /recommend/{user_id} calls into one
+# recommend_batch pass; a batch is sent once it holds BATCH_MAX_SIZE users or its
+# first request has waited BATCH_MAX_WAIT_MS. "sync" scores each request on its own.
+SERVING_MODE = os.environ.get("SERVING_MODE", "async")
+
+# SLOW_PROFILE_MS=<ms> samples the stacks of scoring calls and dumps those slower
+# than that to SLOW_PROFILE_DIR (see profiler.py); off by default
+profiler = profiler_from_env()
+
+def score_batch(user_ids, params, sessions=None):
+    n, fusion, filters = params
+    with maybe_profile(profiler, "recommend_batch"):
+        return get_model().recommend_batch(user_ids, n=n, sessions=sessions, filters=dict(filters),
+                                           **dict(fusion))
+
+# attribute filters as a hashable part of the params, so filtered lists are
+# cached and micro-batched separately; every field takes a list of alternatives
+def filter_params(category=None, size=None, color=None, in_stock=False):
+    fields = {"category": category, "size": size, "color": color}
+    filters = tuple((field, tuple(values)) for field, values in fields.items() if values)
+    if in_stock:
+        filters += (("in_stock", True),)
+    return filters
+
+batcher = None
+if SERVING_MODE == "async":
+    batcher = MicroBatcher(
+        score_batch,
+        max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", "64")),
+        max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", "5")),
+    )
+
+# cache and batcher counters, read when /metrics is scraped
+def collect_service_stats():
+    stats = cache.stats()
+    yield "recommender_cache_entries", "gauge", "Cached recommendation lists", [({}, stats["size"])]
+    for key in ["hits", "misses", "expirations", "evictions", "invalidations"]:
+        yield f"recommender_cache_{key}_total", "counter", f"Result cache {key}", [({}, stats[key])]
+    if batcher is not None:
+        stats = batcher.stats()
+        yield "recommender_batches_total", "counter", "Micro-batches scored", [({}, stats["batches"])]
+        yield ("recommender_batched_requests_total", "counter", "Requests scored through micro-batches",
+               [({}, stats["requests"])])
+    topk = get_topk()
+    if topk is not None:
+        stats = topk.stats()
+        yield "recommender_topk_age_seconds", "gauge", "Age of the precomputed top-k lists", [({}, stats["age_seconds"])]
+        yield ("recommender_topk_lookups_total", "counter", "Top-k store lookups by result",
+               [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])])
+
+REGISTRY.add_collector(collect_service_stats)
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        observe_request(route.path if route is not None else "unmatched", status, time.perf_counter() - start)
 
 class RecResponse(BaseModel):
     user_id: str
     recommendations: List[str]
 
+class SimilarResponse(BaseModel):
+    variant_id: str
+    recommendations: List[str]
+
+class BatchRecRequest(BaseModel):
+    user_ids: List[str]
+    n: int = Field(10, ge=1, le=MAX_N)
+    content_weight: float = 0.4
+    als_weight: float = 0.3
+    lfm_weight: float = 0.15
+    session_weight: float = 0.1
+    popularity_weight: float = 0.05
+    diversity_penalty: float = 0.3
+    price_tier_penalty: float = 0.5
+    # only recommend variants in one of these categories (ids or names, e.g. "Men"),
+    # sizes and colours, and optionally only those in stock
+    category: Optional[List[str]] = None
+    size: Optional[List[str]] = None
+    color: Optional[List[str]] = None
+    in_stock: bool = False
+    # live session per user: variant ids viewed/added in this visit, oldest first
+    sessions: Optional[Dict[str, List[str]]] = None
+
+class BatchRecResponse(BaseModel):
+    results: List[RecResponse]
+
+class EventItem(BaseModel):
+    variant_id: str
+    quantity: int = 1
+
+class EventRequest(BaseModel):
+    user_id: str
+    type: str  # "order" or "cart"
+    items: List[EventItem]
+    created_at: Optional[datetime] = None
+
+@app.post("/recommend/batch", response_model=BatchRecResponse)
+def recommend_batch(request: BatchRecRequest):
+    try:
+        fusion = dict(content_weight=request.content_weight, als_weight=request.als_weight,
+                      lfm_weight=request.lfm_weight, session_weight=request.session_weight,
+                      popularity_weight=request.popularity_weight,
+                      diversity_penalty=request.diversity_penalty,
+                      price_tier_penalty=request.price_tier_penalty)
+        filters = filter_params(request.category, request.size, request.color, request.in_stock)
+        params = (request.n, tuple(fusion.items()), filters)
+        sessions = request.sessions or {}
+        topk = get_topk()
+        if topk is not None and (filters or not topk.serves(request.n, fusion)):
+            topk = None
+
+        # only users without a precomputed or cached list go through the batch scorer;
+        # lists shaped by a live session are neither read from nor written to the cache
+        recs = {}
+        for user_id in request.user_ids:
+            if user_id in sessions:
+                recs[user_id] = None
+                continue
+            user_recs = topk.lookup(user_id, request.n) if topk is not None else None
+            recs[user_id] = user_recs if user_recs is not None else cache.get(user_id, params)
+        missing = [user_id for user_id, user_recs in recs.items() if user_recs is None]
+        if missing:
+            generations = [cache.generation(user_id) for user_id in missing]
+            scored = score_batch(missing, params, [sessions.get(user_id) for user_id in missing])
+            for user_id, user_recs, generation in zip(missing, scored, generations):
+                if user_id not in sessions:
+                    cache.put(user_id, params, user_recs, generation)
+                recs[user_id] = user_recs
+
+        return BatchRecResponse(results=[
+            RecResponse(user_id=user_id, recommendations=[str(v) for v in recs[user_id]])
+            for user_id in request.user_ids
+        ])
+    except Exception as e:
+        count_error("/recommend/batch", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/recommend/{user_id}", response_model=RecResponse)
-def recommend(user_id: str, n: int = 10):
+async def recommend(user_id: str, n: int = Query(10, ge=1, le=MAX_N),
+                    content_weight: float = 0.4, als_weight: float = 0.3, lfm_weight: float = 0.15,
+                    session_weight: float = 0.1, popularity_weight: float = 0.05,
+                    diversity_penalty: float = 0.3, price_tier_penalty: float = 0.5,
+                    session: Optional[str] = None, category: Optional[str] = None,
+                    size: Optional[str] = None, color: Optional[str] = None, in_stock: bool = False):
+    # session: comma-separated variant ids of the live session, oldest first
+    # category / size / color: comma-separated alternatives, e.g. category=Men&size=M,L
     try:
-        recs = model.recommend(user_id)[:n]
+        fusion = dict(content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+                      session_weight=session_weight, popularity_weight=popularity_weight,
+                      diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty)
+        filters = filter_params(*(value.split(",") if value else None for value in (category, size, color)),
+                                in_stock)
+        params = (n, tuple(fusion.items()), filters)
+        session_history = session.split(",") if session else None
+        recs = None
+        topk = get_topk(wait=False)
+        if topk is not None and not filters and topk.serves(n, fusion, session_history):
+            recs = topk.lookup(user_id, n)
+        if recs is None and session_history is None:
+            recs = cache.get(user_id, params)
+        if recs is None:
+            generation = cache.generation(user_id)
+            if batcher is not None:
+                recs = await batcher.submit(user_id, params, session_history)
+            else:
+                recs = await run_in_threadpool(score_batch, [user_id], params, [session_history])
+                recs = recs[0]
+            if session_history is None:
+                cache.put(user_id, params, recs, generation)
         return RecResponse(user_id=user_id, recommendations=[str(v) for v in recs])
     except KeyError:
         return RecResponse(user_id=user_id, recommendations=[])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        count_error("/recommend/{user_id}", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# trending variants from time-decayed orders and cart events, optionally within a category id
+@app.get("/popular")
+def popular(n: int = Query(10, ge=1, le=MAX_N), category: Optional[str] = None):
+    try:
+        return {"category": category, "recommendations": [str(v) for v in get_model().popular(n, category)]}
+    except Exception as e:
+        count_error("/popular", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# "similar to this variant" for product pages, from the neighbour lists built at training time
+@app.get("/similar/{variant_id}", response_model=SimilarResponse)
+def similar(variant_id: str, n: int = Query(10, ge=1, le=MAX_N)):
+    current = get_model()
+    if getattr(current, "neighbours", None) is None:
+        raise HTTPException(status_code=503, detail="The loaded model has no similar-variant lists; "
+                                                    "build them with train.py --neighbours or neighbours.py")
+    try:
+        recs = current.similar(variant_id, n)
+    except Exception as e:
+        count_error("/similar/{variant_id}", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if recs is None:
+        raise HTTPException(status_code=404, detail=f"Unknown variant '{variant_id}'")
+    return SimilarResponse(variant_id=variant_id, recommendations=[str(v) for v in recs])
+
+# new orders / cart events: updates the user's profile, ALS factors and popularity in place
+@app.post("/events")
+def ingest_event(event: EventRequest):
+    if event.type not in EVENT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown event type '{event.type}'")
+    created_at = event.created_at or datetime.now()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone().replace(tzinfo=None)
+    record = {
+        "op": "event",
+        "user_id": event.user_id,
+        "variant_ids": [item.variant_id for item in event.items],
+        "kind": EVENT_KINDS[event.type],
+        "quantities": [item.quantity for item in event.items],
+        "created_at": created_at.isoformat(),
+    }
+    try:
+        if store is not None:
+            positions = get_model().variant_positions
+            ingested = sum(variant_id in positions for variant_id in record["variant_ids"])
+            store.append_event(record)
+        else:
+            ingested = apply_update(model, record)
+    except Exception as e:
+        count_error("/events", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"user_id": event.user_id, "ingested": ingested}
+
+# called by the backend after an order or cart event so the user's next request is fresh
+@app.post("/invalidate/{user_id}")
+def invalidate(user_id: str):
+    record = {"op": "invalidate", "user_id": user_id}
+    if store is not None:
+        evicted = cache.invalidate_user(user_id)
+        store.append_event(record)
+    else:
+        evicted = apply_update(model, record)
+    return {"user_id": user_id, "evicted": evicted}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.get("/topk/stats")
+def topk_stats():
+    topk = get_topk()
+    if topk is None:
+        return {"enabled": False}
+    return {"enabled": True, **topk.stats()}
+
+@app.get("/batching/stats")
+def batching_stats():
+    if batcher is None:
+        return {"mode": SERVING_MODE}
+    return {"mode": SERVING_MODE, **batcher.stats()}
+
+# Prometheus scrape target: per-stage and per-endpoint latency histograms, error counts
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/model/version")
+def model_version():
+    if store is not None:
+        store.get()
+        return {"store": MODEL_STORE, "version": store.version}
+    return {"store": None, "version": getattr(model, "manifest", {}).get("created_at")}
@@ -0,0 +1,246 @@
+import json
+import os
+import shutil
+import sys
+import numpy as np
+from datetime import datetime
+from scipy.sparse import csr_matrix
+
+from ann import load_index
+from features import CompactFeatures
+from filters import AttributeIndex
+from neighbours import NEIGHBOURS_DIR, NeighbourTable
+from profiles import UserInteractionIndex
+from scoring import HybridScorer
+from session import SessionIndex
+from topk_store import TOPK_DIR, TopKStore, materialize
+from versioned_dir import versions_dir
+
+# Serving artifact: one .npy per array plus a manifest, so the API can memory-map
+# the trained state without importing tensorflow, torch, implicit, lightfm or
+# sentence-transformers, and without unpickling the training DataFrames.
+ARTIFACT_VERSION = 8
+MANIFEST_NAME = 'manifest.json'
+
+
+def export_artifact(model, path, topk_size=0):
+    # topk_size > 0 also precomputes that many recommendations per known user
+    if getattr(model, 'scorer', None) is None:
+        model.build_scorer()
+    scorer = model.scorer
+    scorer.compact()
+    content = model.content_model
+
+    arrays = {
+        'variant_ids': scorer.variant_ids.astype(str),
+        'collab_to_content': scorer.collab_to_content,
+        **user_arrays(scorer),
+        'als_item_factors': scorer.als_item_factors,
+        'lfm_user_embeddings': scorer.lfm_user_embeddings,
+        'lfm_user_biases': scorer.lfm_user_biases,
+        'lfm_item_embeddings': scorer.lfm_item_embeddings,
+        'lfm_item_biases': scorer.lfm_item_biases,
+        'item_prices': scorer.item_prices,
+        'item_products': scorer.item_products,
+        'item_categories': scorer.item_categories,
+        'category_ids': np.asarray(scorer.category_ids).astype(str),
+        'session_indptr': scorer.session_index.indptr,
+        'session_indices': scorer.session_index.indices,
+        'session_data': scorer.session_index.data,
+        'scaler_min': content.scaler.min_,
+        'scaler_scale': content.scaler.scale_,
+    }
+    encoder_columns = list(content.encoder.feature_names_in_)
+    for column, categories in zip(encoder_columns, content.encoder.categories_):
+        arrays[f'encoder_{column}'] = np.asarray(categories).astype(str)
+
+    # models pickled before CompactFeatures keep their dense matrix
+    if isinstance(scorer.feature_matrix, CompactFeatures):
+        feature_params, feature_arrays = scorer.feature_matrix.get_state()
+    else:
+        feature_params, feature_arrays = None, {'dense': scorer.feature_matrix}
+    for name, array in feature_arrays.items():
+        arrays[f'features_{name}'] = array
+
+    # models pickled before attribute filters export none and can't filter
+    attribute_params, attribute_arrays = None, {}
+    if scorer.attributes is not None:
+        attribute_params, attribute_arrays = scorer.attributes.get_state()
+    for name, array in attribute_arrays.items():
+        arrays[f'attributes_{name}'] = array
+
+    index_params, index_arrays = scorer.content_index.get_state()
+    for name, array in index_arrays.items():
+        arrays[f'content_index_{name}'] = array
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+    if topk_size:
+        materialize(scorer, os.path.join(path, TOPK_DIR), topk_size)
+    if scorer.neighbours is not None:
+        scorer.neighbours.save(os.path.join(path, NEIGHBOURS_DIR))
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'encoder_columns': encoder_columns,
+        'als_regularization': scorer.als_regularization,
+        'als_alpha': scorer.als_alpha,
+        'features': {'params': feature_params, 'arrays': list(feature_arrays)},
+        'attributes': {'params': attribute_params, 'arrays': list(attribute_arrays)},
+        'content_index': {
+            'kind': scorer.content_index.kind,
+            'params': index_params,
+            'arrays': list(index_arrays),
+        },
+        'arrays': {
+            name: {'dtype': str(array.dtype), 'shape': list(array.shape)}
+            for name, array in arrays.items()
+        },
+    }
+    # The manifest goes last: a directory without one is an unfinished export
+    with open(os.path.join(path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# The arrays that ingested events change once they are compacted into the
+# scorer; everything else in an artifact only changes on retrain
+def user_arrays(scorer):
+    interactions = scorer.interaction_index
+    return {
+        'collab_user_ids': np.asarray(scorer.collab_user_index).astype(str),
+        'liked_indptr': scorer.liked_items.indptr,
+        'liked_indices': scorer.liked_items.indices,
+        'liked_data': scorer.liked_items.data,
+        'als_user_factors': scorer.als_user_factors,
+        'interaction_user_ids': interactions.user_ids.astype(str),
+        'interaction_offsets': interactions.offsets,
+        'interaction_items': interactions.items,
+        'interaction_timestamps': interactions.timestamps,
+        'interaction_kinds': interactions.kinds,
+    }
+
+
+def checkpoint_artifact(scorer, source, target):
+    # Writes the artifact at `source` to `target` with the user arrays of
+    # `scorer`, a scorer loaded from it that has ingested events since. Every
+    # other file, top-k and neighbour lists included, is a hard link to the
+    # source's, so this costs only the rewritten arrays and no retraining.
+    with open(os.path.join(source, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    scorer.compact()
+    arrays = user_arrays(scorer)
+
+    os.makedirs(target)
+    for name in manifest['arrays']:
+        if name not in arrays:
+            os.link(os.path.join(source, f'{name}.npy'), os.path.join(target, f'{name}.npy'))
+    for name in arrays:
+        np.save(os.path.join(target, f'{name}.npy'), np.ascontiguousarray(arrays[name]))
+        manifest['arrays'][name] = {'dtype': str(arrays[name].dtype), 'shape': list(arrays[name].shape)}
+    for name in (TOPK_DIR, NEIGHBOURS_DIR):
+        path = os.path.join(source, name)
+        if os.path.islink(path):
+            # versioned_dir layout: the relative link and the versions it points into
+            os.symlink(os.readlink(path), os.path.join(target, name))
+            path = versions_dir(path)
+        if os.path.isdir(path):
+            shutil.copytree(path, os.path.join(target, os.path.basename(path)), copy_function=os.link)
+
+    manifest['created_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(os.path.join(target, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != ARTIFACT_VERSION:
+        raise ValueError(
+            f"Artifact at {path} has version {manifest.get('version')}, expected {ARTIFACT_VERSION}"
+        )
+    return manifest
+
+
+def load_arrays(path, names, mmap_mode='r'):
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in names}
+
+
+def load_artifact(path, mmap_mode='r'):
+    manifest = read_manifest(path)
+    arrays = load_arrays(path, manifest['arrays'], mmap_mode)
+
+    interaction_index = UserInteractionIndex.from_arrays(
+        arrays['interaction_user_ids'],
+        arrays['interaction_offsets'],
+        arrays['interaction_items'],
+        arrays['interaction_timestamps'],
+        arrays['interaction_kinds'],
+    )
+    liked_items = csr_matrix(
+        (arrays['liked_data'], arrays['liked_indices'], arrays['liked_indptr']),
+        shape=(len(arrays['collab_user_ids']), len(arrays['collab_to_content']))
+    )
+    feature_state = manifest['features']
+    feature_arrays = {name: arrays[f'features_{name}'] for name in feature_state['arrays']}
+    if feature_state['params'] is None:
+        feature_matrix = feature_arrays['dense']
+    else:
+        feature_matrix = CompactFeatures.from_state(feature_state['params'], feature_arrays)
+
+    attribute_state = manifest['attributes']
+    attributes = None
+    if attribute_state['params'] is not None:
+        attributes = AttributeIndex.from_state(
+            attribute_state['params'], {name: arrays[f'attributes_{name}'] for name in attribute_state['arrays']}
+        )
+
+    index_state = manifest['content_index']
+    content_index = load_index(
+        feature_matrix, index_state['kind'], index_state['params'],
+        {name: arrays[f'content_index_{name}'] for name in index_state['arrays']}
+    )
+
+    scorer = HybridScorer(
+        variant_ids=arrays['variant_ids'],
+        feature_matrix=feature_matrix,
+        content_index=content_index,
+        interaction_index=interaction_index,
+        collab_user_ids=arrays['collab_user_ids'],
+        collab_to_content=arrays['collab_to_content'],
+        liked_items=liked_items,
+        als_user_factors=arrays['als_user_factors'],
+        als_item_factors=arrays['als_item_factors'],
+        lfm_user_embeddings=arrays['lfm_user_embeddings'],
+        lfm_user_biases=arrays['lfm_user_biases'],
+        lfm_item_embeddings=arrays['lfm_item_embeddings'],
+        lfm_item_biases=arrays['lfm_item_biases'],
+        item_prices=arrays['item_prices'],
+        item_products=arrays['item_products'],
+        item_categories=arrays['item_categories'],
+        als_regularization=manifest['als_regularization'],
+        als_alpha=manifest['als_alpha'],
+        session_index=SessionIndex.from_arrays(
+            arrays['session_indptr'], arrays['session_indices'], arrays['session_data']
+        ),
+        category_ids=arrays['category_ids'],
+        attributes=attributes,
+        neighbours=NeighbourTable.open(path, mmap_mode),
+    )
+    scorer.manifest = manifest
+    scorer.topk = TopKStore.open(path, scorer.variant_ids, mmap_mode)
+    return scorer
+
+
+# Usage: python artifact.py [model.pkl] [artifact_dir] [topk_size]
+if __name__ == "__main__":
+    import joblib
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'model.pkl'
+    artifact_path = sys.argv[2] if len(sys.argv) > 2 else 'artifact'
+    topk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    manifest = export_artifact(joblib.load(model_path), artifact_path, topk_size)
+    print(f"Exported {len(manifest['arrays'])} arrays to {artifact_path}")
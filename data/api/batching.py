@@ -0,0 +1,84 @@
+import asyncio
+from collections import defaultdict
+
+
+# Collects concurrent single-user requests into micro-batches for one vectorised
+# scoring call. A batch closes when it holds max_batch_size requests or when
+# max_wait_ms has passed since its first request, whichever comes first.
+# Requests are grouped by params (n, fusion settings and filters) since only requests
+# with identical params can share a scoring pass; context carries per-request
+# data such as a live session. score(user_ids, params, contexts) runs on a worker
+# thread so the event loop keeps accepting requests meanwhile.
+class MicroBatcher:
+    def __init__(self, score, max_batch_size=64, max_wait_ms=5.0):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = None
+        self._worker = None
+
+        self.requests = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    async def submit(self, user_id, params, context=None):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_id, params, context, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._dispatch(batch)
+
+    async def _dispatch(self, batch):
+        self.requests += len(batch)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+        groups = defaultdict(list)
+        for user_id, params, context, future in batch:
+            groups[params].append((user_id, context, future))
+
+        for params, items in groups.items():
+            try:
+                results = await asyncio.to_thread(
+                    self.score, [user_id for user_id, _, _ in items], params, [context for _, context, _ in items]
+                )
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+        }
@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Scaling benchmark: generates a seeded synthetic dataset (data/scripts/mock_data.py),
+# then times load_data, CollaborativeFiltering fitting, HybridRecommender construction
+# and single/batch recommend latency, and records how much resident memory every
+# stage added (RSS after minus before; transient peaks inside a stage only show
+# in the process-wide peak).
+# Results go to a JSON file; --baseline compares them against an earlier run and
+# exits non-zero when a timing regressed by more than --tolerance.
+#
+# Usage: python benchmark.py [--scale medium] [--users N --products N] [--baseline old.json]
+# (results are named after the users/products actually in the dataset)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import mock_data
+
+RESULTS_VERSION = 2
+
+SCALES = {
+    'sample': {'users': 700, 'products': 186},
+    'medium': {'users': 50_000, 'products': 5_000},
+    'large': {'users': 1_000_000, 'products': 20_000},
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    # resident set size right now, from /proc on Linux; None elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def dataset_size(csv_dir):
+    # users, products and variants actually in the CSVs, which differ from the
+    # requested sizes when an existing --data-dir is reused
+    import pandas as pd
+    return {name: len(pd.read_csv(os.path.join(csv_dir, f'{name}.csv'), usecols=[column]))
+            for name, column in [('users', 'user_id'), ('products', 'product_id'), ('variants', 'variant_id')]}
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def package_versions():
+    import importlib.metadata
+    versions = {}
+    for name in ['numpy', 'pandas', 'scipy', 'scikit-learn', 'implicit', 'lightfm', 'pyarrow']:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+class Stages:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, fn, *args, **kwargs):
+        print(f"{name}...", end=' ', flush=True)
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        value = fn(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+        self.results[name] = {
+            'seconds': seconds,
+            'rss_before_mb': rss_before,
+            'rss_after_mb': rss_after,
+            'rss_delta_mb': rss_after - rss_before if rss_before is not None else None,
+        }
+        print(f"{seconds:.2f}s")
+        return value
+
+
+def run(args):
+    data_dir = args.data_dir or os.path.join(
+        'benchmark_data', f'{args.users}u-{args.products}p-seed{args.seed}')
+    csv_dir = os.path.join(data_dir, 'csv')
+    # keep the caches with the dataset so runs on different sizes don't mix
+    os.environ.setdefault('EMBEDDING_CACHE_DIR', os.path.join(data_dir, 'embedding_cache'))
+
+    from data_cache import load_data
+    from models import CollaborativeFiltering, HybridRecommender
+
+    stages = Stages()
+    rows = None
+    if args.regenerate or not os.path.exists(os.path.join(csv_dir, 'cart_events.csv')):
+        rows = stages.run('generate', mock_data.generate, csv_dir, args.users, args.products, args.seed)
+
+    cache_dir = os.path.join(data_dir, 'data_cache')
+    if os.path.exists(os.path.join(cache_dir, 'manifest.json')):
+        os.remove(os.path.join(cache_dir, 'manifest.json'))
+    stages.run('load_data_cold', load_data, csv_dir, cache_dir)
+    products, purchases, carts = stages.run('load_data_warm', load_data, csv_dir, cache_dir)
+    dataset = dataset_size(csv_dir)
+    if rows is None:
+        rows = {}
+    rows.update({'product_variants': len(products), 'user_purchases': len(purchases), 'user_carts': len(carts)})
+
+    stages.run('collaborative_filtering_fit', CollaborativeFiltering, purchases)
+    model = stages.run('hybrid_recommender_build', HybridRecommender, products, purchases, carts)
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = np.asarray(model.interaction_index.user_ids)
+    sample = rng.choice(user_ids, size=min(args.requests, len(user_ids)), replace=False)
+
+    # warm-up so lazy initialisation (ALS gram matrix, index pages) isn't timed
+    model.recommend_batch(list(sample[:8]), n=args.n)
+
+    def single():
+        seconds = []
+        for user_id in sample:
+            start = time.perf_counter()
+            model.recommend(user_id, n=args.n)
+            seconds.append(time.perf_counter() - start)
+        return seconds
+
+    def batch():
+        seconds = []
+        for start_row in range(0, len(sample), args.batch_size):
+            users = list(sample[start_row:start_row + args.batch_size])
+            start = time.perf_counter()
+            model.recommend_batch(users, n=args.n)
+            seconds.append(time.perf_counter() - start)
+        return seconds
+
+    single_seconds = stages.run('recommend_single', single)
+    batch_seconds = stages.run('recommend_batch', batch)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'packages': package_versions(),
+        },
+        'params': {
+            'users': args.users, 'products': args.products, 'seed': args.seed,
+            'requests': len(sample), 'batch_size': args.batch_size, 'n': args.n,
+        },
+        'dataset': dataset,
+        'rows': rows,
+        'stages': stages.results,
+        'latency': {
+            'single': percentiles(single_seconds),
+            'batch': {
+                **percentiles(batch_seconds),
+                'users_per_second': len(sample) / sum(batch_seconds),
+            },
+        },
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # (metric, baseline, current) for every timing that got slower than allowed
+    regressions = []
+    for name, stage in results['stages'].items():
+        if name in baseline.get('stages', {}):
+            before = baseline['stages'][name]['seconds']
+            if stage['seconds'] > before * (1 + tolerance):
+                regressions.append((f'stages.{name}.seconds', before, stage['seconds']))
+    for kind in ['single', 'batch']:
+        for key in ['p50_ms', 'p95_ms', 'p99_ms']:
+            before = baseline.get('latency', {}).get(kind, {}).get(key)
+            if before is not None and results['latency'][kind][key] > before * (1 + tolerance):
+                regressions.append((f'latency.{kind}.{key}', before, results['latency'][kind][key]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Recommender scaling benchmark')
+    parser.add_argument('--scale', choices=SCALES, default='sample')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir')
+    parser.add_argument('--regenerate', action='store_true')
+    parser.add_argument('--requests', type=int, default=500, help='users sampled for latency')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('-n', type=int, default=10)
+    parser.add_argument('--output', help='results file (default benchmark_results/<users>u-<products>p-<time>.json)')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    args.users = args.users or SCALES[args.scale]['users']
+    args.products = args.products or SCALES[args.scale]['products']
+
+    results = run(args)
+
+    dataset = results['dataset']
+    output = args.output or os.path.join(
+        'benchmark_results',
+        f"{dataset['users']}u-{dataset['products']}p-{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    single, batch = results['latency']['single'], results['latency']['batch']
+    print(f"{dataset['users']} users, {dataset['products']} products, {dataset['variants']} variants: "
+          f"single p50/p95/p99 {single['p50_ms']:.1f}/{single['p95_ms']:.1f}/{single['p99_ms']:.1f} ms, "
+          f"batch of {args.batch_size} p95 {batch['p95_ms']:.1f} ms ({batch['users_per_second']:.0f} users/s), "
+          f"peak RSS {results['peak_rss_mb']:.0f} MB")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for metric, before, after in regressions:
+            print(f"REGRESSION {metric}: {before:.4g} -> {after:.4g}")
+        if regressions:
+            sys.exit(1)
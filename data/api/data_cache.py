@@ -0,0 +1,184 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Columnar cache of the joined training tables. The CSV export is parsed and
+# merged once; every UUID is replaced by a dense int32 code into an id table and
+# the results are written as Parquet. Later loads read only the requested
+# columns and turn the codes back into categoricals over the id tables.
+CACHE_VERSION = 2
+CSV_DIR = os.environ.get('CSV_DIR', 'csv')
+DATA_CACHE_DIR = os.environ.get('DATA_CACHE_DIR', 'data_cache')
+
+SOURCE_FILES = ['products.csv', 'variants.csv', 'orders.csv', 'order_items.csv',
+                'cart_events.csv', 'product_categories.csv', 'categories.csv']
+
+# id table each coded column points into
+ID_COLUMNS = {
+    'user_id': 'user',
+    'variant_id': 'variant',
+    'product_id': 'product',
+    'order_id': 'order',
+    'category_id': 'category',
+}
+
+PRODUCT_VARIANT_COLUMNS = ['variant_id', 'product_id', 'name', 'description', 'color', 'size',
+                           'price', 'stock']
+PURCHASE_COLUMNS = ['order_id', 'user_id', 'status', 'created_at', 'variant_id', 'quantity',
+                    'price_at_purchase', 'color', 'size', 'price']
+CART_COLUMNS = ['user_id', 'variant_id', 'quantity', 'created_at', 'color', 'size', 'price']
+
+# Columns HybridRecommender and its components read from each table
+MODEL_COLUMNS = {
+    'product_variants': ['variant_id', 'product_id', 'name', 'description', 'color', 'size',
+                         'price', 'stock', 'category_id', 'category_name'],
+    'user_purchases': ['user_id', 'variant_id', 'quantity', 'price_at_purchase', 'created_at',
+                       'color', 'size', 'price'],
+    'user_carts': ['user_id', 'variant_id', 'quantity', 'created_at', 'color', 'size', 'price'],
+}
+
+
+def source_signature(csv_dir):
+    signature = {}
+    for name in SOURCE_FILES:
+        stat = os.stat(os.path.join(csv_dir, name))
+        signature[name] = [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+def _encode(frame, id_tables):
+    frame = frame.copy()
+    for column, entity in ID_COLUMNS.items():
+        if column in frame:
+            frame[column] = id_tables[entity].get_indexer(frame[column]).astype(np.int32)
+    return frame
+
+
+def build_cache(csv_dir=CSV_DIR, cache_dir=DATA_CACHE_DIR):
+    products = pd.read_csv(os.path.join(csv_dir, 'products.csv'),
+                           usecols=['product_id', 'name', 'description'])
+    variants = pd.read_csv(os.path.join(csv_dir, 'variants.csv'),
+                           usecols=['variant_id', 'product_id', 'size', 'color', 'price', 'stock'])
+    orders = pd.read_csv(os.path.join(csv_dir, 'orders.csv'),
+                         usecols=['order_id', 'user_id', 'status', 'created_at'],
+                         parse_dates=['created_at'])
+    order_items = pd.read_csv(os.path.join(csv_dir, 'order_items.csv'),
+                              usecols=['order_id', 'variant_id', 'quantity', 'price_at_purchase'])
+    cart_events = pd.read_csv(os.path.join(csv_dir, 'cart_events.csv'),
+                              usecols=['user_id', 'variant_id', 'quantity', 'created_at'],
+                              parse_dates=['created_at'])
+    product_categories = pd.read_csv(os.path.join(csv_dir, 'product_categories.csv'))
+    categories = pd.read_csv(os.path.join(csv_dir, 'categories.csv'), usecols=['category_id', 'name'])
+
+    id_tables = {
+        'user': pd.Index(pd.unique(pd.concat([orders['user_id'], cart_events['user_id']]))),
+        'variant': pd.Index(pd.unique(variants['variant_id'])),
+        'product': pd.Index(pd.unique(products['product_id'])),
+        'order': pd.Index(pd.unique(orders['order_id'])),
+        'category': pd.Index(pd.unique(product_categories['category_id'])),
+    }
+    variants = _encode(variants, id_tables)
+    products = _encode(products, id_tables)
+    orders = _encode(orders, id_tables)
+    order_items = _encode(order_items, id_tables)
+    cart_events = _encode(cart_events, id_tables)
+    product_categories = _encode(product_categories, id_tables)
+
+    # One row per variant of a product that has at least one category, ordered by
+    # variant_id like the groupby in the original load_data
+    product_variants = variants.merge(products, on='product_id')
+    product_variants = product_variants[product_variants['product_id'].isin(product_categories['product_id'])]
+    variant_uuids = id_tables['variant'][product_variants['variant_id']]
+    product_variants = product_variants.iloc[np.argsort(np.asarray(variant_uuids), kind='stable')]
+    product_variants = product_variants[PRODUCT_VARIANT_COLUMNS].reset_index(drop=True)
+
+    variant_categories = (
+        product_variants[['variant_id', 'product_id']]
+        .merge(product_categories, on='product_id')[['variant_id', 'category_id']]
+        .drop_duplicates()
+    )
+
+    attributes = product_variants[['variant_id', 'color', 'size', 'price']]
+    user_purchases = orders.merge(order_items, on='order_id').merge(attributes, on='variant_id')
+    user_carts = cart_events.merge(attributes, on='variant_id')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for entity, ids in id_tables.items():
+        pd.DataFrame({'id': np.asarray(ids, dtype=str)}).to_parquet(
+            os.path.join(cache_dir, f'ids_{entity}.parquet'), index=False)
+    product_variants.to_parquet(os.path.join(cache_dir, 'product_variants.parquet'), index=False)
+    variant_categories.to_parquet(os.path.join(cache_dir, 'variant_categories.parquet'), index=False)
+    # display name per category code, aligned with ids_category
+    names = categories.set_index('category_id')['name'].reindex(id_tables['category'])
+    pd.DataFrame({'name': names.fillna('').astype(str).to_numpy()}).to_parquet(
+        os.path.join(cache_dir, 'category_names.parquet'), index=False)
+    user_purchases[PURCHASE_COLUMNS].to_parquet(os.path.join(cache_dir, 'user_purchases.parquet'), index=False)
+    user_carts[CART_COLUMNS].to_parquet(os.path.join(cache_dir, 'user_carts.parquet'), index=False)
+
+    # Written last so an interrupted build is never mistaken for a valid cache
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': source_signature(csv_dir)}, f, indent=2)
+
+
+def cache_is_fresh(csv_dir=CSV_DIR, cache_dir=DATA_CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return False
+    return manifest.get('version') == CACHE_VERSION and manifest.get('source') == source_signature(csv_dir)
+
+
+def load_ids(entity, cache_dir=DATA_CACHE_DIR):
+    return pd.read_parquet(os.path.join(cache_dir, f'ids_{entity}.parquet'))['id'].to_numpy()
+
+
+def read_table(name, columns=None, cache_dir=DATA_CACHE_DIR):
+    columns = list(columns) if columns is not None else None
+    # category_id / category_name are per-variant lists assembled from variant_categories
+    list_columns = ['category_id', 'category_name'] if name == 'product_variants' else []
+    wanted_lists = [c for c in list_columns if columns is None or c in columns]
+    file_columns = columns
+    if wanted_lists and columns is not None:
+        file_columns = [c for c in columns if c not in list_columns]
+        if 'variant_id' not in file_columns:
+            file_columns.append('variant_id')
+
+    table = pd.read_parquet(os.path.join(cache_dir, f'{name}.parquet'), columns=file_columns)
+
+    if wanted_lists:
+        links = pd.read_parquet(os.path.join(cache_dir, 'variant_categories.parquet'))
+        links = links.sort_values('variant_id', kind='stable')
+        codes = links['category_id'].to_numpy()
+        variants, starts = np.unique(links['variant_id'].to_numpy(), return_index=True)
+        values = {'category_id': load_ids('category', cache_dir)}
+        if 'category_name' in wanted_lists:
+            values['category_name'] = pd.read_parquet(
+                os.path.join(cache_dir, 'category_names.parquet'))['name'].to_numpy()
+        for column in wanted_lists:
+            lists = np.split(values[column][codes], starts[1:])
+            by_variant = dict(zip(variants, (list(c) for c in lists)))
+            table[column] = [by_variant.get(v, []) for v in table['variant_id']]
+
+    # Each table only keeps the ids it uses, like astype('category') on the merged frames
+    for column, entity in ID_COLUMNS.items():
+        if column in table and column != 'category_id':
+            codes = pd.Categorical.from_codes(table[column], categories=load_ids(entity, cache_dir))
+            table[column] = codes.remove_unused_categories()
+
+    if columns is not None:
+        table = table[columns]
+    return table
+
+
+def load_data(csv_dir=CSV_DIR, cache_dir=DATA_CACHE_DIR, columns=None):
+    # (product_variants, user_purchases, user_carts); columns maps table name to
+    # the columns to read and defaults to what the recommender models use
+    if not cache_is_fresh(csv_dir, cache_dir):
+        build_cache(csv_dir, cache_dir)
+    columns = {**MODEL_COLUMNS, **(columns or {})}
+    return tuple(
+        read_table(name, columns[name], cache_dir)
+        for name in ('product_variants', 'user_purchases', 'user_carts')
+    )
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import numpy as np
+
+TEXT_MODEL_NAME = 'paraphrase-MiniLM-L6-v2'
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', 'embedding_cache')
+
+
+# On-disk cache of sentence embeddings keyed by sha1(model name + text).
+# Vectors are memory-mapped on load and only texts that are new or changed
+# since the last run are sent through the SentenceTransformer.
+class EmbeddingStore:
+    def __init__(self, path=EMBEDDING_CACHE_DIR, model_name=TEXT_MODEL_NAME):
+        self.path = path
+        self.model_name = model_name
+        self._text_model = None
+
+        prefix = os.path.join(path, model_name.replace('/', '_'))
+        self.keys_path = prefix + '.keys.npy'
+        self.vectors_path = prefix + '.vectors.npy'
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.keys_path) and os.path.exists(self.vectors_path):
+            self.keys = np.load(self.keys_path)
+            self.vectors = np.load(self.vectors_path, mmap_mode='r')
+        else:
+            self.keys = np.empty(0, dtype='S40')
+            self.vectors = None
+        self.positions = {key: pos for pos, key in enumerate(self.keys)}
+
+    @property
+    def text_model(self):
+        # Only imported when something actually needs encoding
+        if self._text_model is None:
+            from sentence_transformers import SentenceTransformer
+            self._text_model = SentenceTransformer(self.model_name)
+        return self._text_model
+
+    def key(self, text):
+        return hashlib.sha1(f'{self.model_name}\0{text}'.encode('utf-8')).hexdigest().encode('ascii')
+
+    def encode(self, texts):
+        texts = list(texts)
+        keys = [self.key(text) for text in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.positions and key not in missing:
+                missing[key] = text
+        if missing:
+            self._append(list(missing), self.text_model.encode(list(missing.values())))
+
+        if not keys:
+            return np.empty((0, self.vectors.shape[1] if self.vectors is not None else 0), dtype=np.float32)
+        return np.asarray(self.vectors[[self.positions[key] for key in keys]])
+
+    def _append(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.vectors is not None:
+            vectors = np.concatenate([self.vectors, vectors])
+        keys = np.concatenate([self.keys, np.array(keys, dtype='S40')])
+
+        # Write next to the old files and swap vectors in before keys, so after
+        # a crash every stored key still points at a fully written row
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self.vectors_path + '.tmp.npy', vectors)
+        np.save(self.keys_path + '.tmp.npy', keys)
+        self.vectors = None  # release the memory map before replacing the file
+        os.replace(self.vectors_path + '.tmp.npy', self.vectors_path)
+        os.replace(self.keys_path + '.tmp.npy', self.keys_path)
+        self._load()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from sklearn.model_selection import ParameterGrid
+
+# Offline evaluation. Each user's most recent orders are held out, the model is
+# trained on everything before them and asked for k recommendations per user;
+# precision@k, recall@k, NDCG@k and catalog coverage are computed over the whole
+# recommendation matrix at once. grid_search() runs that over ALS/LightFM
+# hyperparameters (one fit per combination, in parallel processes) and, for
+# every fit, over the recommend() fusion weights, which need no refit.
+#
+# Usage: python evaluation.py [--csv-dir csv] [--k 10] [--workers 4] [--out results.csv]
+
+HOLDOUT_ORDERS = 1
+
+# time_split picks held-out orders by order_id, which the models don't read
+PURCHASE_COLUMNS = ['order_id', 'user_id', 'variant_id', 'quantity', 'price_at_purchase', 'created_at',
+                    'color', 'size', 'price']
+
+# Keys are 'als__<param>' / 'lfm__<param>' for the model constructors, plus 'lfm_epochs'
+COLLAB_GRID = {
+    'als__factors': [32, 64, 128],
+    'als__regularization': [0.01, 0.1],
+    'lfm__no_components': [10, 30],
+    'lfm_epochs': [10, 20],
+}
+FUSION_GRID = {
+    'content_weight': [0.2, 0.4, 0.6],
+    'als_weight': [0.1, 0.3, 0.5],
+    'lfm_weight': [0.0, 0.2, 0.4],
+    'popularity_weight': [0.0, 0.1, 0.2],
+    'diversity_penalty': [0.0, 0.3],
+    'price_tier_penalty': [0.0, 0.5],
+}
+# Live sessions don't exist offline, so session_weight isn't searched
+DEFAULT_FUSION = {'content_weight': 0.4, 'als_weight': 0.3, 'lfm_weight': 0.15, 'popularity_weight': 0.05,
+                  'diversity_penalty': 0.3, 'price_tier_penalty': 0.5}
+
+
+def time_split(user_purchases, user_carts, holdout_orders=HOLDOUT_ORDERS):
+    # (train_purchases, train_carts, test_purchases). Users with more than
+    # holdout_orders orders lose their latest ones to the test set; cart events
+    # from the first held-out order on are dropped so they can't leak it.
+    # Held-out items the user also bought earlier are not counted as relevant:
+    # re-purchases aren't what the recommender is meant to surface.
+    # user_purchases needs order_id (see load_data's columns argument); orders
+    # are ranked per user by created_at, ties broken by order_id
+    orders = user_purchases[['user_id', 'order_id', 'created_at']].drop_duplicates('order_id')
+    orders = orders.sort_values(['created_at', 'order_id'], ascending=False, kind='stable')
+    by_user = orders.groupby('user_id', observed=True)
+    recency = by_user.cumcount().to_numpy() + 1
+    n_orders = by_user['order_id'].transform('size').to_numpy()
+    held_out = orders['order_id'][(recency <= holdout_orders) & (n_orders > holdout_orders)]
+    in_test = user_purchases['order_id'].isin(held_out).to_numpy()
+    train, test = user_purchases[~in_test], user_purchases[in_test]
+
+    cutoff = test.groupby('user_id', observed=True)['created_at'].min()
+    cart_cutoff = user_carts['user_id'].astype(object).map(cutoff)
+    train_carts = user_carts[~(user_carts['created_at'] >= cart_cutoff).to_numpy()]
+
+    bought = pd.MultiIndex.from_frame(train[['user_id', 'variant_id']].astype(object))
+    test_pairs = pd.MultiIndex.from_frame(test[['user_id', 'variant_id']].astype(object))
+    test = test[~test_pairs.isin(bought)]
+    return _drop_unused(train), _drop_unused(train_carts), test
+
+
+def _drop_unused(frame):
+    frame = frame.copy()
+    for column in ('user_id', 'variant_id'):
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].cat.remove_unused_categories()
+    return frame
+
+
+def ranking_metrics(recommended, relevant, k):
+    # recommended: (n_users, k) item positions padded with -1; relevant: CSR
+    # (n_users, n_items) of held-out items. Returns per-user precision, recall
+    # and NDCG at k.
+    n_users, n_items = relevant.shape
+    rows = np.repeat(np.arange(n_users), np.diff(relevant.indptr))
+    relevant_keys = rows.astype(np.int64) * n_items + relevant.indices
+    keys = np.arange(n_users)[:, None].astype(np.int64) * n_items + recommended
+    hits = (recommended >= 0) & np.isin(keys, relevant_keys)
+
+    n_relevant = np.diff(relevant.indptr)
+    n_hits = hits.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(n_relevant, k)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'precision': n_hits / k,
+            'recall': np.where(n_relevant > 0, n_hits / n_relevant, 0.0),
+            'ndcg': np.where(ideal > 0, (hits * discounts).sum(axis=1) / ideal, 0.0),
+        }
+
+
+def recommendation_matrix(recommendations, variant_ids, k):
+    # Lists of variant ids -> (n_users, k) positions in variant_ids, -1 padded
+    padded = pd.DataFrame(recommendations).reindex(columns=range(k))
+    positions = pd.Index(variant_ids).get_indexer(padded.to_numpy(dtype=object).ravel())
+    return positions.reshape(len(recommendations), k)
+
+
+def evaluate(model, test_purchases, k=10, now=None, **fusion):
+    # model: a HybridRecommender or a HybridScorer (e.g. a loaded artifact)
+    scorer = getattr(model, 'scorer', None) or model
+    variant_ids = scorer.variant_ids
+    items = pd.Index(variant_ids).get_indexer(test_purchases['variant_id'].astype(object))
+    known = items >= 0
+    user_codes, user_ids = pd.factorize(test_purchases['user_id'].astype(object).to_numpy()[known])
+    relevant = csr_matrix((np.ones(len(user_codes)), (user_codes, items[known])),
+                          shape=(len(user_ids), len(variant_ids)))
+    relevant.data[:] = 1
+
+    start = time.perf_counter()
+    recommendations = scorer.recommend_batch(list(user_ids), n=k, now=now, **{**DEFAULT_FUSION, **fusion})
+    seconds = time.perf_counter() - start
+
+    recommended = recommendation_matrix(recommendations, variant_ids, k)
+    metrics = ranking_metrics(recommended, relevant, k)
+    report = {f'{name}@{k}': float(values.mean()) for name, values in metrics.items()}
+    report['coverage'] = len(np.unique(recommended[recommended >= 0])) / len(variant_ids)
+    report['users'] = len(user_ids)
+    report['users_per_second'] = len(user_ids) / seconds if seconds else float('inf')
+    return report
+
+
+def split_collab_params(params):
+    # {'als__factors': 64, 'lfm_epochs': 10} -> ({'factors': 64}, {}, {'lfm_epochs': 10})
+    als = {key[5:]: value for key, value in params.items() if key.startswith('als__')}
+    lfm = {key[5:]: value for key, value in params.items() if key.startswith('lfm__')}
+    rest = {key: value for key, value in params.items() if '__' not in key}
+    return als, lfm, rest
+
+
+def evaluate_collab_params(content_model, split, collab_params, fusion_grid, k, now, threads):
+    # One grid job: fit the collaborative models with collab_params on the
+    # training split, then score every fusion setting against the held-out orders
+    from models import CollaborativeFiltering, HybridRecommender
+    from train import limit_threads
+    limit_threads(1)
+    products = content_model.products
+    train_purchases, train_carts, test_purchases = split
+    als_params, lfm_params, rest = split_collab_params(collab_params)
+
+    start = time.perf_counter()
+    collab = CollaborativeFiltering(train_purchases, {**als_params, 'num_threads': threads}, lfm_params,
+                                    num_threads=threads, **rest)
+    model = HybridRecommender(products, train_purchases, train_carts,
+                              content_model=content_model, collab_model=collab)
+    fit_seconds = time.perf_counter() - start
+
+    rows = []
+    for fusion in ParameterGrid(fusion_grid):
+        report = evaluate(model, test_purchases, k, now, **fusion)
+        rows.append({**collab_params, **fusion, **report, 'fit_seconds': fit_seconds})
+    return rows
+
+
+def grid_search(product_variants, user_purchases, user_carts, collab_grid=COLLAB_GRID, fusion_grid=FUSION_GRID,
+                k=10, holdout_orders=HOLDOUT_ORDERS, workers=4, threads=1, content_model=None):
+    # DataFrame with one row per (collab params, fusion weights) combination,
+    # best NDCG first. The content model doesn't depend on interactions and is
+    # built once; collab combinations run in `workers` processes.
+    from models import ContentRecommender
+    split = time_split(user_purchases, user_carts, holdout_orders)
+    now = split[0]['created_at'].max()
+    content_model = content_model or ContentRecommender(product_variants)
+    jobs = list(ParameterGrid(collab_grid))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            futures = [pool.submit(evaluate_collab_params, content_model, split, params, fusion_grid, k, now, threads)
+                       for params in jobs]
+            rows = [row for future in futures for row in future.result()]
+    else:
+        rows = [row for params in jobs
+                for row in evaluate_collab_params(content_model, split, params, fusion_grid, k, now, threads)]
+
+    return pd.DataFrame(rows).sort_values(f'ndcg@{k}', ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Evaluate the hybrid recommender on held-out recent orders')
+    parser.add_argument('--csv-dir')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--holdout-orders', type=int, default=HOLDOUT_ORDERS)
+    parser.add_argument('--workers', type=int, default=4, help='processes for the hyperparameter grid')
+    parser.add_argument('--threads', type=int, default=1, help='ALS/LightFM threads per process')
+    parser.add_argument('--collab-grid', type=json.loads, default=COLLAB_GRID,
+                        help='JSON, e.g. \'{"als__factors": [32, 64]}\'')
+    parser.add_argument('--fusion-grid', type=json.loads, default=FUSION_GRID)
+    parser.add_argument('--out', help='write all results as CSV')
+    args = parser.parse_args()
+
+    from data_cache import CSV_DIR, load_data
+    products, purchases, carts = load_data(args.csv_dir or CSV_DIR, columns={'user_purchases': PURCHASE_COLUMNS})
+    results = grid_search(products, purchases, carts, args.collab_grid, args.fusion_grid, args.k,
+                          args.holdout_orders, args.workers, args.threads)
+    if args.out:
+        results.to_csv(args.out, index=False)
+    print(results.head(10).to_string())
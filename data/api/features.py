@@ -0,0 +1,137 @@
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+# Content features of the catalog kept as separate blocks instead of one dense
+# float64 matrix:
+#
+#   categorical  CSR one-hot colour/size, float32 (two nonzeros per item)
+#   numeric      dense float32 scaled price
+#   text         sentence embeddings, int8 with one float32 scale per row
+#                (x ~= text * text_scales[:, None]), or plain float32
+#
+# Columns are laid out like the old np.hstack([categorical, numeric, text]), so
+# user profiles stay dense vectors in that space. Similarities to the whole
+# catalog are computed block by block; the int8 rows are widened to float32
+# BLOCK_ROWS at a time and never all at once.
+TEXT_DTYPE = 'int8'
+BLOCK_ROWS = 4096
+
+
+class CompactFeatures:
+    def __init__(self, categorical, numeric, text, text_scales=None):
+        self.categorical = csr_matrix(categorical, dtype=np.float32)
+        self.numeric = numeric
+        self.text = text
+        self.text_scales = text_scales
+        self.n_categorical = self.categorical.shape[1]
+        self.n_numeric = numeric.shape[1]
+
+    @classmethod
+    def from_blocks(cls, categorical, numeric, text, text_dtype=TEXT_DTYPE):
+        numeric = np.asarray(numeric, dtype=np.float32)
+        text = np.asarray(text, dtype=np.float32)
+        if text_dtype == 'float32':
+            return cls(categorical, numeric, text)
+        if text_dtype != 'int8':
+            raise ValueError(f"Unknown text dtype '{text_dtype}', expected 'int8' or 'float32'")
+        # symmetric per-row quantisation: the largest component maps to +-127
+        peak = np.abs(text).max(axis=1) if text.shape[1] else np.zeros(len(text), dtype=np.float32)
+        scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+        quantised = np.clip(np.rint(text / scales[:, None]), -127, 127).astype(np.int8)
+        return cls(categorical, numeric, quantised, scales)
+
+    @property
+    def shape(self):
+        return len(self.numeric), self.n_categorical + self.n_numeric + self.text.shape[1]
+
+    @property
+    def nbytes(self):
+        categorical = self.categorical
+        scales = self.text_scales.nbytes if self.text_scales is not None else 0
+        return (categorical.data.nbytes + categorical.indices.nbytes + categorical.indptr.nbytes
+                + self.numeric.nbytes + self.text.nbytes + scales)
+
+    def __len__(self):
+        return len(self.numeric)
+
+    def __getitem__(self, rows):
+        scales = self.text_scales[rows] if self.text_scales is not None else None
+        return CompactFeatures(self.categorical[rows], self.numeric[rows], self.text[rows], scales)
+
+    def _split(self, queries):
+        c, m = self.n_categorical, self.n_categorical + self.n_numeric
+        return queries[:, :c], queries[:, c:m], queries[:, m:]
+
+    def _text_rows(self, rows):
+        block = np.asarray(self.text[rows], dtype=np.float32)
+        if self.text_scales is not None:
+            block *= self.text_scales[rows, None]
+        return block
+
+    def similarities(self, queries):
+        # (queries x items) dot products with the dense-equivalent rows, float32;
+        # each block of item rows is scored in one pass over all three blocks
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        categorical, numeric, text = self._split(queries)
+        categorical_t = np.ascontiguousarray(categorical.T)
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, len(self))
+            block = text @ np.asarray(self.text[start:end], dtype=np.float32).T
+            if self.text_scales is not None:
+                block *= self.text_scales[start:end]
+            block += numeric @ self.numeric[start:end].T
+            block += (self.categorical[start:end] @ categorical_t).T
+            scores[:, start:end] = block
+        return scores
+
+    def weighted_sum(self, weights):
+        # weights (users x items, sparse) @ features, only widening the text rows
+        # the users actually touch
+        weights = csr_matrix(weights)
+        rows = np.unique(weights.indices)
+        text = weights[:, rows] @ self._text_rows(rows)
+        return np.hstack([(weights @ self.categorical).toarray(), weights @ self.numeric, text])
+
+    def toarray(self):
+        return np.hstack([self.categorical.toarray(), self.numeric, self._text_rows(np.arange(len(self)))])
+
+    def get_state(self):
+        arrays = {
+            'categorical_indptr': self.categorical.indptr,
+            'categorical_indices': self.categorical.indices,
+            'categorical_data': self.categorical.data,
+            'numeric': self.numeric,
+            'text': self.text,
+        }
+        if self.text_scales is not None:
+            arrays['text_scales'] = self.text_scales
+        return {'n_categorical': self.n_categorical}, arrays
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        categorical = csr_matrix(
+            (arrays['categorical_data'], arrays['categorical_indices'], arrays['categorical_indptr']),
+            shape=(len(arrays['numeric']), params['n_categorical'])
+        )
+        return cls(categorical, arrays['numeric'], arrays['text'], arrays.get('text_scales'))
+
+
+# Dense arrays (models pickled before CompactFeatures) and CompactFeatures both
+# go through these two
+def similarities(vectors, queries):
+    if isinstance(vectors, CompactFeatures):
+        return vectors.similarities(queries)
+    return np.atleast_2d(queries) @ vectors.T
+
+
+def weighted_sum(weights, vectors):
+    if isinstance(vectors, CompactFeatures):
+        return vectors.weighted_sum(weights)
+    return weights @ vectors
+
+
+def as_dense(vectors):
+    if isinstance(vectors, CompactFeatures) or issparse(vectors):
+        return vectors.toarray()
+    return vectors
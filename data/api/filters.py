@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# Attribute filters over the catalog. Every (field, value) pair, e.g.
+# 'size:m' or 'category:women', owns one packed bitmask of the catalog rows
+# that carry it, built once from the product table:
+#
+#   keys      'field:value' strings, values lower-cased
+#   bitmasks  (keys, ceil(items / 8)) uint8, np.packbits of the row masks
+#
+# A filter ORs the masks of the values asked for within a field, ANDs across
+# fields and unpacks the result into one boolean mask over the catalog, which
+# the scorer applies to every candidate source before taking its top items.
+# Categories are keyed by both id and display name; 'in_stock' holds stock > 0
+# as of the export.
+FILTER_FIELDS = ('category', 'size', 'color')
+IN_STOCK_KEY = 'in_stock'
+
+
+def filter_key(field, value):
+    return f'{field}:{str(value).strip().lower()}'
+
+
+class AttributeIndex:
+    def __init__(self, keys, bitmasks, n_items):
+        self.keys = np.asarray(keys, dtype=object)
+        self.positions = {key: row for row, key in enumerate(self.keys)}
+        self.bitmasks = bitmasks
+        self.n_items = n_items
+
+    @classmethod
+    def from_products(cls, products):
+        # products: one row per catalog row; any of size, color, stock,
+        # category_id and category_name (lists per row) may be missing
+        keys, rows = [], []
+        for field in ('size', 'color'):
+            if field in products:
+                keys.append(products[field].map(lambda value: filter_key(field, value)).to_numpy(dtype=object))
+                rows.append(np.arange(len(products)))
+        for column in ('category_id', 'category_name'):
+            if column in products:
+                links = products[column].reset_index(drop=True).explode().dropna()
+                keys.append(links.map(lambda value: filter_key('category', value)).to_numpy(dtype=object))
+                rows.append(links.index.to_numpy(dtype=np.int64))
+        if 'stock' in products:
+            in_stock = np.flatnonzero(products['stock'].to_numpy() > 0)
+            keys.append(np.full(len(in_stock), IN_STOCK_KEY, dtype=object))
+            rows.append(in_stock)
+
+        if not keys:
+            return cls([], np.zeros((0, (len(products) + 7) // 8), dtype=np.uint8), len(products))
+        codes, unique_keys = pd.factorize(np.concatenate(keys))
+        masks = np.zeros((len(unique_keys), len(products)), dtype=bool)
+        masks[codes, np.concatenate(rows)] = True
+        return cls(unique_keys, np.packbits(masks, axis=1), len(products))
+
+    def mask(self, category=None, size=None, color=None, in_stock=False):
+        # Boolean mask over catalog rows, or None when no filter is set. Each
+        # field takes one value or a list of alternatives; unknown values match
+        # nothing.
+        requested = []
+        for field, values in zip(FILTER_FIELDS, (category, size, color)):
+            if values is not None:
+                values = [values] if isinstance(values, str) else values
+                requested.append([filter_key(field, value) for value in values])
+        if in_stock:
+            requested.append([IN_STOCK_KEY])
+
+        selected = None
+        for keys in requested:
+            bits = np.zeros(self.bitmasks.shape[1], dtype=np.uint8)
+            for key in keys:
+                if key in self.positions:
+                    bits |= self.bitmasks[self.positions[key]]
+            selected = bits if selected is None else selected & bits
+        if selected is None:
+            return None
+        return np.unpackbits(selected, count=self.n_items).astype(bool)
+
+    def get_state(self):
+        return {'n_items': self.n_items}, {'keys': self.keys.astype(str), 'bitmasks': self.bitmasks}
+
+    @classmethod
+    def from_state(cls, params, arrays):
+        return cls(arrays['keys'], arrays['bitmasks'], params['n_items'])
@@ -0,0 +1,126 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# In-process counters and latency histograms rendered in the Prometheus text
+# format. Stdlib only, so the NumPy serving core can time its stages without
+# pulling in a client library; an observation is one bisect and two adds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help)
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}  # (name, labels) -> value
+        # callables returning [(name, type, help, [(labels dict, value)])], read at render time
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+        described = set()
+
+        def header(name, default_kind):
+            if name not in described:
+                kind, help_text = self._meta.get(name, (default_kind, name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                described.add(name)
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", repr(bound))])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                self.describe(name, kind, help_text)
+                header(name, kind)
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe('recommender_stage_seconds', 'histogram',
+                  'Time spent in each scoring stage per recommend_batch chunk')
+REGISTRY.describe('recommender_request_seconds', 'histogram', 'Request latency by endpoint and status')
+REGISTRY.describe('recommender_errors_total', 'counter', 'Requests that failed, by endpoint and exception type')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def stage(name):
+    return REGISTRY.timed('recommender_stage_seconds', stage=name)
+
+
+def observe_request(endpoint, status, seconds):
+    REGISTRY.observe('recommender_request_seconds', seconds, endpoint=endpoint, status=str(status))
+
+
+def count_error(endpoint, error):
+    REGISTRY.inc('recommender_errors_total', endpoint=endpoint, exception=type(error).__name__)
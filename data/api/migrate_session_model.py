@@ -0,0 +1,41 @@
+import os
+import sys
+
+import joblib
+
+# One-off migration for model.pkl files trained before the cart-event session
+# index (session.py) replaced the GRU. Those pickles still hold the Keras
+# model inside SessionRecommender, so loading them needs tensorflow, which is
+# no longer in requirements.txt. Run this once per old model in an environment
+# that has tensorflow installed (pip install tensorflow); it rebuilds the
+# session index from the pickled carts and writes the model back without the
+# GRU, after which it loads with the regular requirements.
+#
+# Usage: python migrate_session_model.py [model.pkl] [output.pkl]
+# (output defaults to overwriting the input)
+
+
+def migrate(model):
+    # True when the model still carried the GRU session model
+    if getattr(model.session_model, 'index', None) is not None:
+        return False
+    model.build_session_model()
+    model.build_scorer()
+    return True
+
+
+if __name__ == "__main__":
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'model.pkl'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else model_path
+    try:
+        model = joblib.load(model_path)
+    except ModuleNotFoundError as e:
+        sys.exit(f"Loading {model_path} needs {e.name}; install it for this run only, "
+                 f"e.g. pip install {e.name}")
+    if not migrate(model):
+        print(f"{model_path} already uses the session index, nothing to do")
+        sys.exit(0)
+    staged = f'{output_path}.tmp-{os.getpid()}'
+    joblib.dump(model, staged)
+    os.replace(staged, output_path)
+    print(f"Saved {output_path} without the GRU session model")
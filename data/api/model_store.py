@@ -0,0 +1,353 @@
+import fcntl
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from artifact import checkpoint_artifact, export_artifact, load_artifact
+from profiles import to_epoch_seconds
+
+# Versioned store of serving artifacts shared by every worker on a host:
+#
+#   <root>/versions/<version>/   one exported artifact each (see artifact.py)
+#   <root>/current -> versions/<version>
+#
+# A loader process exports a new version and then repoints `current` with a
+# single rename, so readers see either the old or the new version and never a
+# half-written one. Workers memory-map the arrays of the version they serve
+# read-only, which lets the page cache hold one copy of each array for all of
+# them instead of one per worker.
+#
+# Updates made through the API (ingested events, invalidations) are shared the
+# same way: the worker handling one appends it to the append-only log of the
+# current version, <root>/versions/<version>/events.jsonl, and every worker
+# applies the records it hasn't applied yet. A worker swapping to a new version
+# replays that version's log from the start on the fresh scorer. Publishing
+# seeds the new log with the events of the previous one that are newer than
+# the new version's latest interaction, i.e. missing from its training data.
+#
+# To keep that replay short, checkpoint() folds a log that has grown past a
+# size limit into a new version of the same model: the events are ingested and
+# compacted into its arrays and the log starts over. The folded records move to
+# <version>/folded_events.jsonl, which only publishing reads.
+CURRENT_LINK = 'current'
+VERSIONS_DIR = 'versions'
+EVENT_LOG_NAME = 'events.jsonl'
+FOLDED_LOG_NAME = 'folded_events.jsonl'
+LOCK_NAME = 'store.lock'
+
+
+def current_version(root):
+    try:
+        return os.path.basename(os.readlink(os.path.join(root, CURRENT_LINK)))
+    except FileNotFoundError:
+        return None
+
+
+def event_log_path(root, version):
+    return os.path.join(root, VERSIONS_DIR, version, EVENT_LOG_NAME)
+
+
+def new_version_name():
+    return datetime.now().strftime('%Y%m%dT%H%M%S%f') + f'-{os.getpid()}'
+
+
+@contextmanager
+def store_lock(root, blocking=True):
+    # Serialises publishing and checkpointing across processes, so a checkpoint
+    # of an older version never replaces a newly published one. Yields whether
+    # the lock is held; with blocking=False it isn't when another process has it.
+    os.makedirs(root, exist_ok=True)
+    fd = os.open(os.path.join(root, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def _swap_current(root, version):
+    # rename over the old link is atomic; a plain os.symlink on `current` is not
+    link = os.path.join(root, CURRENT_LINK)
+    staged = f'{link}.{os.getpid()}'
+    os.symlink(os.path.join(VERSIONS_DIR, version), staged)
+    os.replace(staged, link)
+
+
+def publish_artifact(model, root, keep=2, topk_size=0):
+    version = new_version_name()
+    target = os.path.join(root, VERSIONS_DIR, version)
+    export_artifact(model, target, topk_size)
+
+    with store_lock(root):
+        previous = current_version(root)
+        if previous is not None:
+            timestamps = np.load(os.path.join(target, 'interaction_timestamps.npy'), mmap_mode='r')
+            since = int(timestamps.max()) if len(timestamps) else None
+            # events folded into the previous version by checkpoints count as logged
+            carry_events(os.path.join(root, VERSIONS_DIR, previous, FOLDED_LOG_NAME),
+                         event_log_path(root, version), since)
+            offset = carry_events(event_log_path(root, previous), event_log_path(root, version), since)
+
+        _swap_current(root, version)
+
+        if previous is not None:
+            # events logged while the link moved; replay skips the ones seen twice
+            carry_events(event_log_path(root, previous), event_log_path(root, version), since, offset)
+        prune_versions(root, keep)
+    return version
+
+
+def ingest_record(scorer, record):
+    # Applies the interactions of one "event" record to a scorer
+    return scorer.ingest(record['user_id'], record['variant_ids'], record['kind'], record['quantities'],
+                         datetime.fromisoformat(record['created_at']))
+
+
+def checkpoint(root, keep=2, blocking=True):
+    # Folds the event log of the current version into a new version of the same
+    # model and returns it; None when the log is empty or, with blocking=False,
+    # another process is publishing or checkpointing
+    with store_lock(root, blocking) as locked:
+        previous = current_version(root) if locked else None
+        if previous is None:
+            return None
+        source = os.path.join(root, VERSIONS_DIR, previous)
+        records, offset = read_events(event_log_path(root, previous))
+        if not records:
+            return None
+
+        scorer = load_artifact(source)
+        applied = set()
+        for record in records:
+            if record['op'] == 'event' and record['id'] not in applied:
+                applied.add(record['id'])
+                ingest_record(scorer, record)
+        version = new_version_name()
+        target = os.path.join(root, VERSIONS_DIR, version)
+        checkpoint_artifact(scorer, source, target)
+
+        folded = os.path.join(source, FOLDED_LOG_NAME)
+        if os.path.exists(folded):
+            shutil.copyfile(folded, os.path.join(target, FOLDED_LOG_NAME))
+        carry_events(event_log_path(root, previous), os.path.join(target, FOLDED_LOG_NAME), end=offset)
+        # precomputed top-k lists of these users predate their events; one
+        # invalidation each keeps them scored live on the new version
+        users = dict.fromkeys(record['user_id'] for record in records)
+        _append(event_log_path(root, version), ''.join(
+            json.dumps({'op': 'invalidate', 'user_id': user_id, 'id': uuid.uuid4().hex}) + '\n'
+            for user_id in users
+        ).encode('utf-8'))
+
+        _swap_current(root, version)
+        # records logged since the read aren't folded in; they move over as they are
+        carry_events(event_log_path(root, previous), event_log_path(root, version), offset=offset, ops=None)
+        prune_versions(root, keep)
+    return version
+
+
+def _append(path, data):
+    # one O_APPEND write, so lines from concurrent writers never interleave
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def append_event(root, record):
+    # Logs one record under a fresh id. If a publish moved `current` meanwhile
+    # the record is appended to the new version's log as well.
+    line = (json.dumps({**record, 'id': uuid.uuid4().hex}) + '\n').encode('utf-8')
+    written = None
+    version = current_version(root)
+    while version != written:
+        _append(event_log_path(root, version), line)
+        written, version = version, current_version(root)
+
+
+def read_events(path, offset=0, end=None):
+    # (records, offset after them) for the complete lines of a log after offset,
+    # up to byte `end` if given
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read() if end is None else f.read(end - offset)
+    except FileNotFoundError:
+        return [], offset
+    end = data.rfind(b'\n') + 1
+    return [json.loads(line) for line in data[:end].splitlines() if line], offset + end
+
+
+def carry_events(source, target, since=None, offset=0, ops=('event',), end=None):
+    # Copies the records of log `source` between offset and end whose op is in
+    # `ops` (None: every record) and, for events, that were created after
+    # `since` (epoch seconds) to log `target`; returns the offset reached
+    records, offset = read_events(source, offset, end)
+    lines = [
+        json.dumps(record) + '\n' for record in records
+        if (ops is None or record['op'] in ops)
+        and (since is None or record['op'] != 'event'
+             or to_epoch_seconds([datetime.fromisoformat(record['created_at'])])[0] > since)
+    ]
+    if lines:
+        _append(target, ''.join(lines).encode('utf-8'))
+    return offset
+
+
+def prune_versions(root, keep=2):
+    # Workers still mapping a removed version keep their pages until they swap,
+    # since unlinking a file doesn't invalidate existing mappings
+    versions = sorted(os.listdir(os.path.join(root, VERSIONS_DIR)))
+    live = current_version(root)
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != live:
+            shutil.rmtree(os.path.join(root, VERSIONS_DIR, version), ignore_errors=True)
+
+
+# Per-worker view of the store. get() returns the scorer of the current version,
+# re-reading the `current` link at most every check_interval seconds and loading
+# the new version when it moved. A request holds on to the scorer it got, so it
+# is answered by one version from start to end. on_swap(scorer, version) runs
+# after each load, e.g. to clear caches filled by the previous version.
+# on_event(scorer, record) applies one record of the version's event log; new
+# records are picked up at most every event_interval seconds, and right away
+# by sync_events(). Once the log reaches max_log_bytes, the worker that appended
+# to it checkpoints the store in the background.
+class ModelHandle:
+    def __init__(self, root, check_interval=5.0, loader=load_artifact, on_swap=None, on_event=None,
+                 event_interval=0.5, max_log_bytes=None):
+        self.root = root
+        self.check_interval = check_interval
+        self.loader = loader
+        self.on_swap = on_swap
+        self.on_event = on_event
+        self.event_interval = event_interval
+        self.max_log_bytes = max_log_bytes
+
+        self._lock = threading.Lock()
+        self._events_lock = threading.Lock()
+        self._background_lock = threading.Lock()
+        self._background = {}  # task name -> thread running it
+        self._checked_at = 0.0
+        self._synced_at = 0.0
+        self._event_offset = 0
+        self._applied = set()  # ids of the records applied to the current scorer
+        self.version = None
+        self.scorer = None
+        self.refresh()
+
+    def get(self, wait=True):
+        # wait=False never loads a version or replays events on the calling
+        # thread, for callers on an event loop: it returns the scorer in use and
+        # leaves keeping it current to a background thread
+        if not wait:
+            self._in_background('poll', self._poll)
+            return self.scorer
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self.refresh()
+        if self.on_event is not None and now - self._synced_at >= self.event_interval:
+            self.sync_events()
+        return self.scorer
+
+    def _poll(self):
+        interval = self.check_interval
+        if self.on_event is not None:
+            interval = min(interval, self.event_interval)
+        while True:
+            try:
+                self.get()
+            except Exception:
+                pass  # e.g. `current` briefly missing; callers with wait=True see the error
+            time.sleep(interval)
+
+    def append_event(self, record):
+        # Logs a record for every worker and applies it here before returning;
+        # the record went to the current version, which may be newer than ours
+        append_event(self.root, record)
+        if not self.refresh():
+            self.sync_events()
+        if self.max_log_bytes is not None:
+            try:
+                size = os.path.getsize(event_log_path(self.root, self.version))
+            except FileNotFoundError:
+                size = 0
+            if size >= self.max_log_bytes:
+                self._in_background('checkpoint', self._checkpoint)
+
+    def _checkpoint(self):
+        if checkpoint(self.root, blocking=False) is not None:
+            self.refresh()
+
+    def _in_background(self, name, task):
+        # Starts task on a daemon thread unless the last one started under this name still runs
+        with self._background_lock:
+            thread = self._background.get(name)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=task, name=f'model-store-{name}', daemon=True)
+            self._background[name] = thread
+            thread.start()
+
+    def sync_events(self):
+        # Applies the records logged since the last sync to the current scorer
+        if self.on_event is None:
+            return 0
+        with self._events_lock:
+            self._synced_at = time.monotonic()
+            applied = len(self._applied)
+            self._event_offset = self._replay(self.scorer, self.version, self._event_offset, self._applied)
+            return len(self._applied) - applied
+
+    def _replay(self, scorer, version, offset, applied):
+        if self.on_event is None:
+            return offset
+        records, offset = read_events(event_log_path(self.root, version), offset)
+        for record in records:
+            if record['id'] not in applied:
+                applied.add(record['id'])
+                self.on_event(scorer, record)
+        return offset
+
+    def refresh(self):
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = current_version(self.root)
+            if version is None:
+                raise FileNotFoundError(f"No published model in {self.root}")
+            if version == self.version:
+                return False
+            scorer = self.loader(os.path.join(self.root, VERSIONS_DIR, version))
+            # the new version's log is applied before any request sees it
+            with self._events_lock:
+                applied = set()
+                self._event_offset = self._replay(scorer, version, 0, applied)
+                self._applied = applied
+                self._synced_at = time.monotonic()
+                self.scorer, self.version = scorer, version
+        if self.on_swap is not None:
+            self.on_swap(scorer, version)
+        return True
+
+
+# Usage: python model_store.py [model.pkl] [store_root] [topk_size]
+if __name__ == "__main__":
+    import joblib
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'model.pkl'
+    root = sys.argv[2] if len(sys.argv) > 2 else 'model_store'
+    topk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    version = publish_artifact(joblib.load(model_path), root, topk_size=topk_size)
+    print(f"Published {model_path} as {root}/{VERSIONS_DIR}/{version}")
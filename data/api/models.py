@@ -1,44 +1,78 @@
 import numpy as np
 import pandas as pd
-from collections import defaultdict
 from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
-from sklearn.metrics.pairwise import linear_kernel
 
-from sentence_transformers import SentenceTransformer
 from implicit.als import AlternatingLeastSquares
 from lightfm import LightFM
 
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import GRU, Dense, Embedding
 from scipy.sparse import csr_matrix
-from datetime import datetime
+
+from ann import build_index
+from embedding_store import EmbeddingStore
+from features import CompactFeatures
+from neighbours import NEIGHBOUR_K, NeighbourTable
+from profiles import PURCHASE, UserInteractionIndex
+from scoring import HybridScorer
+from session import SessionIndex
+
+# Default hyperparameters of the collaborative models
+ALS_PARAMS = {'factors': 64, 'regularization': 0.01}
+LFM_PARAMS = {'loss': 'warp'}
+LFM_EPOCHS = 20
 
 class ContentRecommender:
-    def __init__(self, product_variants):
+    def __init__(self, product_variants, text_embeddings=None):
         self.products = product_variants
         self.encoder = OneHotEncoder(handle_unknown='ignore')
         self.scaler = MinMaxScaler()
-        self.text_model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
 
-        # Preprocess features
+        # Preprocess features; text_embeddings can be encoded ahead, e.g. by train.py
         cat_features = self.encoder.fit_transform(product_variants[['color', 'size']])
         num_features = self.scaler.fit_transform(product_variants[['price']])
-        text_features = self.text_model.encode(product_variants['description'].fillna(''))
+        if text_embeddings is None:
+            text_embeddings = encode_descriptions(product_variants)
 
-        # Build matrix
-        self.text_embeddings = text_features
+        # Build matrix: sparse one-hot, float32 price and int8 text blocks (see features.py)
         self.variant_to_index = {
             variant_id: idx for idx, variant_id in enumerate(product_variants['variant_id'])
         }
-        self.feature_matrix = np.hstack([cat_features.toarray(), num_features, text_features])
+        self.feature_matrix = CompactFeatures.from_blocks(cat_features, num_features, text_embeddings)
+        self.build_index()
+
+    def update_catalog(self, product_variants, text_embeddings=None):
+        # New catalog rows on the already fitted encoder and scaler, so variants
+        # that didn't change keep exactly the same features
+        self.products = product_variants
+        cat_features = self.encoder.transform(product_variants[['color', 'size']])
+        num_features = self.scaler.transform(product_variants[['price']])
+        if text_embeddings is None:
+            text_embeddings = encode_descriptions(product_variants)
+        self.variant_to_index = {
+            variant_id: idx for idx, variant_id in enumerate(product_variants['variant_id'])
+        }
+        self.feature_matrix = CompactFeatures.from_blocks(cat_features, num_features, text_embeddings)
+        index = getattr(self, 'index', None)
+        kind = getattr(index, 'kind', 'exact')
+        self.build_index(kind, **({'n_probe': index.n_probe} if kind == 'ivf' else {}))
+
+    def build_index(self, kind='exact', **params):
+        # 'exact' scans the whole catalog; 'ivf' trades recall for latency via n_probe
+        self.index = build_index(self.feature_matrix, kind, **params)
 
     def recommend(self, user_profile, n=50):
-        similarities = linear_kernel([user_profile], self.feature_matrix)[0]
-        top_indices = np.argsort(similarities)[-n:][::-1]
-        return self.products.iloc[top_indices]['variant_id'].tolist()
+        if getattr(self, 'index', None) is None:
+            self.build_index()
+        top_indices, _ = self.index.search(user_profile, n)
+        return self.products.iloc[top_indices[0]]['variant_id'].tolist()
+
+def encode_descriptions(product_variants):
+    return EmbeddingStore().encode(product_variants['description'].fillna(''))
 
 class CollaborativeFiltering:
-    def __init__(self, user_purchases):
+    # fit=False only builds the interaction matrix and unfitted models, for
+    # callers that fit them elsewhere (train.py, evaluation.py)
+    def __init__(self, user_purchases, als_params=None, lfm_params=None, lfm_epochs=LFM_EPOCHS,
+                 num_threads=4, fit=True):
         self.user_purchases = user_purchases
 
         self.user_codes = user_purchases['user_id'].astype('category')
@@ -54,11 +88,11 @@ class CollaborativeFiltering:
             shape=(len(self.user_index), len(self.variant_index))
         )
 
-        self.als_model = AlternatingLeastSquares(factors=64, regularization=0.01)
-        self.als_model.fit(self.interaction_matrix)
-
-        self.lfm_model = LightFM(loss='warp')
-        self.lfm_model.fit(self.interaction_matrix, epochs=20, num_threads=4)
+        self.als_model = AlternatingLeastSquares(**{**ALS_PARAMS, **(als_params or {})})
+        self.lfm_model = LightFM(**{**LFM_PARAMS, **(lfm_params or {})})
+        if fit:
+            self.als_model.fit(self.interaction_matrix)
+            self.lfm_model.fit(self.interaction_matrix, epochs=lfm_epochs, num_threads=num_threads)
 
     def als_recommend(self, user_id, n=50):
         try:
@@ -79,81 +113,119 @@ class CollaborativeFiltering:
             return []
 
 class SessionRecommender:
-    def __init__(self, user_carts):
-        self.variant_ids = user_carts['variant_id'].astype('category')
-        self.variant_index = self.variant_ids.cat.categories
-        self.variant_to_idx = {v: i for i, v in enumerate(self.variant_index)}
-        self.idx_to_variant = {i: v for i, v in enumerate(self.variant_index)}
-
-        self.model = Sequential([
-            Embedding(input_dim=len(self.variant_index) + 1, output_dim=64),
-            GRU(128),
-            Dense(len(self.variant_index), activation='softmax')
-        ])
-        self.model.compile(loss='categorical_crossentropy', optimizer='adam')
-
-        # Note: Training omitted; you must train separately and save model if needed.
+    def __init__(self, user_carts, variant_to_index):
+        # Cart-event transitions between catalog rows, see session.py
+        self.variant_to_index = variant_to_index
+        self.variant_ids = np.empty(len(variant_to_index), dtype=object)
+        self.variant_ids[list(variant_to_index.values())] = list(variant_to_index)
+        self.index = SessionIndex(user_carts, variant_to_index)
 
     def recommend(self, session_history, n=10):
-        return []
+        # session_history: variant ids of the live session, oldest first
+        rows = [self.variant_to_index[v] for v in session_history if v in self.variant_to_index]
+        idx, _ = self.index.search([rows], n)
+        return self.variant_ids[idx[0][idx[0] >= 0]].tolist()
 
 class HybridRecommender:
-    def __init__(self, product_variants, user_purchases, user_carts):
+    # content_model / collab_model can be passed in already built, as train.py does
+    def __init__(self, product_variants, user_purchases, user_carts, content_model=None, collab_model=None):
         self.products = product_variants
         self.user_purchases = user_purchases
         self.user_carts = user_carts
 
-        self.content_model = ContentRecommender(product_variants)
-        self.collab_model = CollaborativeFiltering(user_purchases)
-        self.session_model = SessionRecommender(user_carts)
-
-    def create_user_profile(self, user_id):
-        purchases = self.user_purchases[self.user_purchases['user_id'] == user_id].copy()
-        carts = self.user_carts[self.user_carts['user_id'] == user_id].copy()
-        if purchases.empty and carts.empty:
-            return np.zeros(self.content_model.feature_matrix.shape[1])
-
-        now = datetime.now()
-        if not purchases.empty:
-            purchases['weight'] = np.exp(-(now - purchases['created_at']).dt.days / 14)
-        if not carts.empty:
-            carts['weight'] = 0.7 * np.exp(-(now - carts['created_at']).dt.days / 7)
-
-        interactions = pd.concat([purchases, carts], ignore_index=True)
+        self.content_model = content_model or ContentRecommender(product_variants)
+        self.collab_model = collab_model or CollaborativeFiltering(user_purchases)
+        self.build_session_model()
+        self.build_interaction_index()
+        self.build_scorer()
 
-        cat_features = self.content_model.encoder.transform(interactions[['color', 'size']]).toarray()
-        num_features = self.content_model.scaler.transform(interactions[['price']])
-        text_indices = interactions['variant_id'].map(self.content_model.variant_to_index).fillna(-1).astype(int)
-        valid_mask = text_indices >= 0
-        text_features = self.content_model.text_embeddings[text_indices[valid_mask]]
+    def build_session_model(self):
+        self.session_model = SessionRecommender(self.user_carts, self.content_model.variant_to_index)
 
-        all_features = np.hstack([cat_features[valid_mask], num_features[valid_mask], text_features])
-        weights = interactions['weight'].values[valid_mask]
+    def build_interaction_index(self):
+        self.interaction_index = UserInteractionIndex(
+            self.user_purchases, self.user_carts, self.content_model.variant_to_index
+        )
 
-        if all_features.shape[0] == 0:
-            return np.zeros(self.content_model.feature_matrix.shape[1])
+    def create_user_profile(self, user_id):
+        # Models pickled before the index existed build it on first use
+        if getattr(self, 'interaction_index', None) is None:
+            self.build_interaction_index()
+        return self.interaction_index.profile(user_id, self.content_model.feature_matrix)
+
+    def build_content_index(self, kind='exact', **params):
+        self.content_model.build_index(kind, **params)
+        self.build_scorer()
+
+    def build_scorer(self):
+        if getattr(self, 'interaction_index', None) is None:
+            self.build_interaction_index()
+        # Models pickled with the untrained GRU session model get the transition index;
+        # loading those needs tensorflow, see migrate_session_model.py
+        if getattr(self.session_model, 'index', None) is None:
+            self.build_session_model()
+        self.scorer = HybridScorer.from_model(self)
+
+    def recommend_batch(self, user_ids, content_weight=0.4, als_weight=0.3, lfm_weight=0.15,
+                        session_weight=0.1, popularity_weight=0.05, diversity_penalty=0.3,
+                        price_tier_penalty=0.5, n=10, sessions=None, filters=None):
+        if getattr(self, 'scorer', None) is None:
+            self.build_scorer()
+        return self.scorer.recommend_batch(
+            user_ids, content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+            session_weight=session_weight, popularity_weight=popularity_weight,
+            diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty, n=n, sessions=sessions,
+            filters=filters
+        )
 
-        user_profile = np.average(all_features, axis=0, weights=weights)
-        return user_profile
+    def popular(self, n=10, category=None):
+        if getattr(self, 'scorer', None) is None:
+            self.build_scorer()
+        return self.scorer.popular(n, category)
+
+    def build_neighbours(self, k=NEIGHBOUR_K, previous=None):
+        # Similar-variant lists; previous is an earlier table whose lists are
+        # reused for unchanged variants
+        if getattr(self, 'scorer', None) is None:
+            self.build_scorer()
+        self.neighbours = self.scorer.neighbours = NeighbourTable.build(self.scorer, k, previous=previous)
+        return self.neighbours
+
+    def update_catalog(self, product_variants, user_purchases, user_carts):
+        # Catalog change without retraining: variants added since training have
+        # no collaborative factors until the next retrain and are recommended on
+        # content, sessions and popularity. The similar-variant lists are
+        # updated incrementally (see neighbours.py).
+        previous = getattr(self, 'neighbours', None)
+        self.products = product_variants
+        self.user_purchases = user_purchases
+        self.user_carts = user_carts
+        self.content_model.update_catalog(product_variants)
+        self.neighbours = None
+        self.build_session_model()
+        self.build_interaction_index()
+        self.build_scorer()
+        if previous is not None:
+            self.build_neighbours(previous.k, previous=previous)
+
+    def similar(self, variant_id, n=10):
+        if getattr(self, 'scorer', None) is None:
+            self.build_scorer()
+        return self.scorer.similar(variant_id, n)
+
+    def ingest(self, user_id, variant_ids, kind=PURCHASE, quantities=None, created_at=None):
+        if getattr(self, 'scorer', None) is None:
+            self.build_scorer()
+        return self.scorer.ingest(user_id, variant_ids, kind, quantities, created_at)
 
     def recommend(self, user_id, session_history=None,
-                  content_weight=0.4, als_weight=0.3, lfm_weight=0.2, session_weight=0.1,
-                  diversity_penalty=0.3, price_tier_penalty=0.5, n=10):  # Ensure n is passed here
-        user_profile = self.create_user_profile(user_id)
-
-        content_recs = self.content_model.recommend(user_profile, n=n)  # Pass n to ContentRecommender
-        als_recs = self.collab_model.als_recommend(user_id, n=n)  # Pass n to CollaborativeFiltering
-        lfm_recs = self.collab_model.lfm_recommend(user_id, n=n)  # Pass n to CollaborativeFiltering
-        session_recs = self.session_model.recommend(session_history or [], n=n)  # Pass n to SessionRecommender
-
-        all_scores = defaultdict(float)
-        for weight, recs in zip(
-            [content_weight, als_weight, lfm_weight, session_weight],
-            [content_recs, als_recs, lfm_recs, session_recs]
-        ):
-            for i, variant_id in enumerate(recs):
-                all_scores[variant_id] += weight / (i + 1)
-
-        sorted_variants = sorted(all_scores.items(), key=lambda x: -x[1])
-        final_recs = [variant_id for variant_id, _ in sorted_variants][:n]  # Limit recommendations to n
-        return final_recs
+                  content_weight=0.4, als_weight=0.3, lfm_weight=0.15, session_weight=0.1,
+                  popularity_weight=0.05, diversity_penalty=0.3, price_tier_penalty=0.5, n=10, filters=None):
+        # Scored through HybridScorer so ingested interactions are reflected here too;
+        # users without any history get the trending items
+        return self.recommend_batch(
+            [user_id], content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+            session_weight=session_weight, popularity_weight=popularity_weight,
+            diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty, n=n,
+            sessions=None if session_history is None else [session_history], filters=filters
+        )[0]
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from features import as_dense, similarities
+from scoring import top_n
+from versioned_dir import new_version, publish_version
+
+# Precomputed "similar to this variant" lists. Two variants score
+#
+#   content_weight * cos(content features) + collab_weight * cos(ALS item factors)
+#
+# where variants the ALS model never saw only have the content part. Other
+# variants of the same product are left out: the detail page lists those
+# already. The top k per variant are stored next to the serving arrays:
+#
+#   <artifact>/neighbours/indices.npy       (variants, k) int32 catalog rows, -1 padded
+#   <artifact>/neighbours/scores.npy        (variants, k) float32 blended scores
+#   <artifact>/neighbours/variant_ids.npy   row -> variant id
+#   <artifact>/neighbours/fingerprints.npy  hash of each variant's content features
+#   <artifact>/neighbours/manifest.json     k, weights, hash of the ALS item factors, build time
+#
+# where neighbours is a link to the latest build (see versioned_dir.py).
+#
+# A score only depends on the two variants' own vectors, so after a catalog
+# change on the same trained model (train.py --catalog-only) build() with the
+# previous table recomputes the variants that are new or whose content changed,
+# folds their scores into the other lists, and fully recomputes only lists that
+# pointed at a removed or changed variant. A variant's ALS factors are fixed by
+# its id until the next retrain; variants added since have none. A retrain
+# changes every factor, and a previous table built on other factors is not
+# reused at all: retraining always means a full rebuild.
+NEIGHBOURS_DIR = 'neighbours'
+NEIGHBOUR_K = 20
+CONTENT_WEIGHT = 0.5
+COLLAB_WEIGHT = 0.5
+MANIFEST_NAME = 'manifest.json'
+
+# variants scored against the whole catalog per pass
+BLOCK_ROWS = 256
+
+
+class ItemVectors:
+    # Row-normalised content features and ALS factors of a HybridScorer, in
+    # catalog order
+    def __init__(self, scorer, content_weight=CONTENT_WEIGHT, collab_weight=COLLAB_WEIGHT):
+        self.features = scorer.feature_matrix
+        self.products = scorer.item_products
+        self.content_weight = content_weight
+        self.collab_weight = collab_weight
+        n_items = len(scorer.variant_ids)
+
+        self.inverse_norms = np.empty(n_items, dtype=np.float32)
+        fingerprints = np.empty(n_items, dtype=np.uint64)
+        factors = np.ascontiguousarray(scorer.als_item_factors, dtype=np.float32)
+        self.collab_fingerprint = hashlib.blake2b(factors.tobytes(), digest_size=16).hexdigest()
+        valid = scorer.collab_to_content >= 0
+        self.collab = np.zeros((n_items, factors.shape[1]), dtype=np.float32)
+        self.collab[scorer.collab_to_content[valid]] = factors[valid]
+        collab_norms = np.linalg.norm(self.collab, axis=1, keepdims=True)
+        self.collab /= np.where(collab_norms > 0, collab_norms, 1.0)
+
+        for start in range(0, n_items, BLOCK_ROWS):
+            rows = np.arange(start, min(start + BLOCK_ROWS, n_items))
+            dense = self.content_rows(rows)
+            norms = np.linalg.norm(dense, axis=1)
+            self.inverse_norms[rows] = np.where(norms > 0, 1.0 / np.where(norms > 0, norms, 1.0), 0.0)
+            for row, content in zip(rows, dense):
+                digest = hashlib.blake2b(content.tobytes(), digest_size=8)
+                fingerprints[row] = int.from_bytes(digest.digest(), 'little')
+        self.fingerprints = fingerprints
+
+    def __len__(self):
+        return len(self.inverse_norms)
+
+    def content_rows(self, rows):
+        return np.asarray(as_dense(self.features[rows]), dtype=np.float32)
+
+    def scores(self, rows):
+        # (rows x catalog) blended similarities, -inf for the same product
+        scores = similarities(self.features, self.content_rows(rows))
+        scores *= self.content_weight * self.inverse_norms[rows, None]
+        scores *= self.inverse_norms
+        scores += self.collab_weight * (self.collab[rows] @ self.collab.T)
+        scores[self.products[rows, None] == self.products[None, :]] = -np.inf
+        return scores
+
+
+def _top_k(scores, k):
+    idx, top_scores = top_n(scores, k)
+    idx[~np.isfinite(top_scores)] = -1
+    return idx, top_scores
+
+
+class NeighbourTable:
+    def __init__(self, variant_ids, indices, scores, fingerprints, content_weight=CONTENT_WEIGHT,
+                 collab_weight=COLLAB_WEIGHT, collab_fingerprint=None, created_at=None):
+        self.variant_ids = np.asarray(variant_ids, dtype=object)
+        self.variant_positions = {variant_id: pos for pos, variant_id in enumerate(self.variant_ids)}
+        self.indices = indices
+        self.scores = scores
+        self.fingerprints = fingerprints
+        self.content_weight = content_weight
+        self.collab_weight = collab_weight
+        self.collab_fingerprint = collab_fingerprint
+        self.created_at = created_at or datetime.now().isoformat(timespec='seconds')
+        self.k = indices.shape[1]
+        self.build_stats = {}
+
+    @classmethod
+    def build(cls, scorer, k=NEIGHBOUR_K, content_weight=CONTENT_WEIGHT, collab_weight=COLLAB_WEIGHT,
+              previous=None):
+        # previous: the table of an earlier build on the same ALS factors; its
+        # lists are reused for variants whose content hasn't changed
+        vectors = ItemVectors(scorer, content_weight, collab_weight)
+        n_items = len(vectors)
+        k = min(k, n_items)
+        indices = np.full((n_items, k), -1, dtype=np.int32)
+        scores = np.full((n_items, k), -np.inf, dtype=np.float32)
+        kept = np.empty(0, dtype=np.int64)
+        changed = np.ones(n_items, dtype=bool)  # new variants or different inputs
+
+        if (previous is not None and previous.k == k and previous.content_weight == content_weight
+                and previous.collab_weight == collab_weight
+                and getattr(previous, 'collab_fingerprint', None) == vectors.collab_fingerprint):
+            old_rows = pd.Index(previous.variant_ids).get_indexer(scorer.variant_ids)
+            same = old_rows >= 0
+            same[same] = previous.fingerprints[old_rows[same]] == vectors.fingerprints[same]
+            changed = ~same
+            remap = np.full(len(previous.variant_ids), -1, dtype=np.int64)
+            remap[old_rows[same]] = np.flatnonzero(same)
+
+            carried = np.asarray(previous.indices[old_rows[same]])
+            mapped = np.where(carried >= 0, remap[carried], -1)
+            intact = ~((carried >= 0) & (mapped < 0)).any(axis=1)
+            kept = np.flatnonzero(same)[intact]
+            indices[kept] = mapped[intact]
+            scores[kept] = previous.scores[old_rows[kept]]
+
+        dirty = np.ones(n_items, dtype=bool)
+        dirty[kept] = False
+        dirty = np.flatnonzero(dirty)
+        for start in range(0, len(dirty), BLOCK_ROWS):
+            rows = dirty[start:start + BLOCK_ROWS]
+            block = vectors.scores(rows)
+            indices[rows], scores[rows] = _top_k(block, k)
+            fresh = changed[rows]
+            if len(kept) and fresh.any():
+                # similarity is symmetric: changed variants may enter kept lists,
+                # which already rank every unchanged one
+                candidates = np.hstack([indices[kept], np.broadcast_to(rows[fresh], (len(kept), fresh.sum()))])
+                merged = np.hstack([scores[kept], block[fresh][:, kept].T])
+                order, scores[kept] = _top_k(merged, k)
+                picked = np.take_along_axis(candidates, np.maximum(order, 0), axis=1)
+                indices[kept] = np.where(order >= 0, picked, -1)
+
+        table = cls(scorer.variant_ids, indices, scores, vectors.fingerprints, content_weight, collab_weight,
+                    vectors.collab_fingerprint)
+        table.build_stats = {'variants': n_items, 'recomputed': len(dirty), 'reused': len(kept)}
+        return table
+
+    def similar(self, variant_id, n=10):
+        # The n most similar variant ids, or None for a variant the table doesn't know
+        row = self.variant_positions.get(variant_id)
+        if row is None:
+            return None
+        idx = np.asarray(self.indices[row, :n])
+        return self.variant_ids[idx[idx >= 0]].tolist()
+
+    def save(self, path):
+        # Written to a new version that `path` links to at the end, like topk_store.materialize
+        staged = new_version(path)
+        np.save(os.path.join(staged, 'indices.npy'), np.ascontiguousarray(self.indices))
+        np.save(os.path.join(staged, 'scores.npy'), np.ascontiguousarray(self.scores))
+        np.save(os.path.join(staged, 'variant_ids.npy'), self.variant_ids.astype(str))
+        np.save(os.path.join(staged, 'fingerprints.npy'), np.ascontiguousarray(self.fingerprints))
+        manifest = {
+            'created_at': self.created_at,
+            'k': self.k,
+            'content_weight': self.content_weight,
+            'collab_weight': self.collab_weight,
+            'collab_fingerprint': self.collab_fingerprint,
+            'variants': len(self.variant_ids),
+        }
+        with open(os.path.join(staged, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        publish_version(path, staged)
+        return manifest
+
+    @classmethod
+    def open(cls, artifact_path, mmap_mode='r'):
+        # None when the artifact has no neighbour lists
+        path = os.path.realpath(os.path.join(artifact_path, NEIGHBOURS_DIR))
+        if not os.path.exists(os.path.join(path, MANIFEST_NAME)):
+            return None
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        return cls(
+            np.load(os.path.join(path, 'variant_ids.npy')),
+            np.load(os.path.join(path, 'indices.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'scores.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'fingerprints.npy')),
+            manifest['content_weight'],
+            manifest['collab_weight'],
+            manifest.get('collab_fingerprint'),
+            manifest['created_at'],
+        )
+
+
+# Usage: python neighbours.py [model.pkl] [artifact_dir] [k]
+# (re)builds the lists of a trained model into an exported artifact, reusing
+# the lists already there when they come from the same trained model; train.py
+# builds them as part of training and of a catalog-only update
+if __name__ == "__main__":
+    import joblib
+
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'model.pkl'
+    artifact_path = sys.argv[2] if len(sys.argv) > 2 else 'artifact'
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else NEIGHBOUR_K
+    model = joblib.load(model_path)
+    table = model.build_neighbours(k, previous=NeighbourTable.open(artifact_path))
+    table.save(os.path.join(artifact_path, NEIGHBOURS_DIR))
+    stats = table.build_stats
+    print(f"Built neighbours for {stats['variants']} variants: "
+          f"{stats['recomputed']} recomputed, {stats['reused']} reused")
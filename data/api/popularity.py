@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+
+from profiles import CART, PURCHASE
+
+# Trending items from purchases and cart events. Every event adds its kind's
+# weight, halved for every POPULARITY_HALF_LIFE_DAYS since it happened. Decay
+# scales all items alike, so weights are kept as weight * 2^((t - anchor) / half
+# life) against a fixed anchor: adding an event is one scatter-add and nothing is
+# ever re-decayed; the anchor only moves forward when the exponents grow large.
+POPULARITY_HALF_LIFE_DAYS = 7.0
+KIND_WEIGHTS = np.zeros(max(PURCHASE, CART) + 1)
+KIND_WEIGHTS[PURCHASE] = 1.0
+KIND_WEIGHTS[CART] = 0.3
+
+# Top lists are recomputed at most this often while events keep arriving
+TOP_REFRESH_SECONDS = 1.0
+REBASE_EXPONENT = 64.0
+
+SECONDS_PER_DAY = 86400.0
+
+
+class PopularityIndex:
+    def __init__(self, n_items, item_categories=None, half_life_days=POPULARITY_HALF_LIFE_DAYS):
+        # item_categories: optional (items x categories) membership, nonzero where
+        # an item belongs to a category, for per-category lists
+        self.weights = np.zeros(n_items)
+        self.anchor = None  # epoch seconds at which weights are expressed
+        self.half_life = half_life_days * SECONDS_PER_DAY
+        self.item_categories = item_categories
+        self.version = 0
+        self._members = {}  # category column -> catalog rows
+        self._top = {}  # category column or None -> (version, computed_at, n, indices, scores)
+
+    @classmethod
+    def from_interactions(cls, interaction_index, n_items, item_categories=None,
+                          half_life_days=POPULARITY_HALF_LIFE_DAYS):
+        index = cls(n_items, item_categories, half_life_days)
+        index.add(interaction_index.items, interaction_index.timestamps, interaction_index.kinds)
+        for items, timestamps, kinds in list(interaction_index.pending.values()):
+            index.add(items, timestamps, kinds)
+        return index
+
+    def add(self, items, timestamps, kinds):
+        items = np.asarray(items, dtype=np.int64)
+        if not len(items):
+            return
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        weights = KIND_WEIGHTS[np.asarray(kinds)]
+
+        latest = int(timestamps.max())
+        if self.anchor is None:
+            self.anchor = latest
+        elif (latest - self.anchor) / self.half_life > REBASE_EXPONENT:
+            self.weights *= 2.0 ** ((self.anchor - latest) / self.half_life)
+            self.anchor = latest
+        np.add.at(self.weights, items, weights * 2.0 ** ((timestamps - self.anchor) / self.half_life))
+        self.version += 1
+
+    def top(self, n, category=None, allowed=None):
+        # (catalog rows, relative weights) of the n most popular items, overall or
+        # within one category column; items never interacted with are left out.
+        # allowed: optional boolean mask over catalog rows (attribute filters);
+        # those lists are not cached
+        if allowed is not None:
+            members = np.flatnonzero(allowed)
+            if category is not None:
+                members = np.intersect1d(members, self._category_members(category), assume_unique=True)
+            return self._rank(n, members)
+        cached = self._top.get(category)
+        if (cached is None or cached[2] < n
+                or (cached[0] != self.version and time.monotonic() - cached[1] >= TOP_REFRESH_SECONDS)):
+            members = None if category is None else self._category_members(category)
+            cached = self._top[category] = (self.version, time.monotonic(), n, *self._rank(n, members))
+        return cached[3][:n], cached[4][:n]
+
+    def _rank(self, n, members=None):
+        weights = self.weights if members is None else self.weights[members]
+        n_top = min(n, len(weights))
+        idx = np.argpartition(-weights, n_top - 1)[:n_top] if n_top else np.empty(0, dtype=np.int64)
+        idx = idx[np.argsort(-weights[idx], kind='stable')]
+        idx = idx[weights[idx] > 0]
+        top_scores = weights[idx]
+        if members is not None:
+            idx = members[idx]
+        return idx, top_scores
+
+    def _category_members(self, category):
+        members = self._members.get(category)
+        if members is None:
+            members = self._members[category] = np.flatnonzero(self.item_categories[:, category])
+        return members
@@ -0,0 +1,108 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+# Opt-in sampling profiler for slow calls. While a profiled call runs, one
+# background thread snapshots that call's thread stack every interval_ms; when
+# the call took longer than threshold_ms its stacks are written in collapsed
+# format ("file:function;file:function count", readable by flamegraph.pl and
+# speedscope) to out_dir, and the hottest ones are logged. Calls under the
+# threshold only cost the registration.
+class SlowCallProfiler:
+    def __init__(self, threshold_ms, interval_ms=5.0, out_dir='slow_profiles', top=5):
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        self.out_dir = out_dir
+        self.top = top
+
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    @contextmanager
+    def profile(self, name):
+        thread_id = threading.get_ident()
+        samples = Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._active.pop(thread_id, None)
+            if elapsed_ms >= self.threshold_ms:
+                self._dump(name, elapsed_ms, samples)
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval_ms / 1000)
+            with self._lock:
+                # exits when idle; the next profiled call starts a new sampler
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = dict(self._active)
+            frames = sys._current_frames()
+            for thread_id, samples in active.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                with self._lock:
+                    # the call may have finished and be dumping its samples already
+                    if self._active.get(thread_id) is samples:
+                        samples[';'.join(reversed(stack))] += 1
+
+    def _dump(self, name, elapsed_ms, samples):
+        if not samples:
+            logger.warning("%s took %.1f ms (no stack samples)", name, elapsed_ms)
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{name}.folded")
+        with open(path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        hottest = '\n'.join(f"  {count:4d}  {';'.join(stack.split(';')[-3:])}"
+                            for stack, count in samples.most_common(self.top))
+        logger.warning("%s took %.1f ms, %d samples written to %s; hottest stacks:\n%s",
+                       name, elapsed_ms, sum(samples.values()), path, hottest)
+
+
+# SLOW_PROFILE_MS enables profiling of calls slower than that many milliseconds;
+# SLOW_PROFILE_INTERVAL_MS and SLOW_PROFILE_DIR tune sampling rate and output
+def from_env():
+    threshold = os.environ.get('SLOW_PROFILE_MS')
+    if not threshold:
+        return None
+    return SlowCallProfiler(
+        float(threshold),
+        interval_ms=float(os.environ.get('SLOW_PROFILE_INTERVAL_MS', '5')),
+        out_dir=os.environ.get('SLOW_PROFILE_DIR', 'slow_profiles'),
+    )
+
+
+@contextmanager
+def maybe_profile(profiler, name):
+    if profiler is None:
+        yield
+    else:
+        with profiler.profile(name):
+            yield
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from scipy.sparse import csr_matrix
+
+from features import weighted_sum
+
+# Interaction kinds and their recency weighting: base weight * exp(-age_days / decay_days)
+PURCHASE, CART = 0, 1
+BASE_WEIGHTS = np.array([1.0, 0.7])
+DECAY_DAYS = np.array([14.0, 7.0])
+
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch_seconds(timestamps):
+    return np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def now_seconds(now=None):
+    return int(np.datetime64(now or datetime.now(), 's').astype(np.int64))
+
+
+# Purchases and cart events grouped per user into contiguous row ranges.
+# Every interaction is stored as the row of its variant in the content feature
+# matrix, so a user profile is a weighted sum over one slice instead of
+# filtering and re-encoding the full interaction history on every request.
+class UserInteractionIndex:
+    def __init__(self, user_purchases, user_carts, variant_to_index):
+        interactions = pd.concat([
+            pd.DataFrame({
+                'user_id': user_purchases['user_id'],
+                'variant_id': user_purchases['variant_id'],
+                'created_at': user_purchases['created_at'],
+                'kind': PURCHASE,
+            }),
+            pd.DataFrame({
+                'user_id': user_carts['user_id'],
+                'variant_id': user_carts['variant_id'],
+                'created_at': user_carts['created_at'],
+                'kind': CART,
+            }),
+        ], ignore_index=True)
+
+        items = interactions['variant_id'].map(variant_to_index)
+        interactions = interactions[items.notna()]
+        items = items[items.notna()]
+
+        user_codes, user_ids = pd.factorize(interactions['user_id'])
+        order = np.argsort(user_codes, kind='stable')
+        counts = np.bincount(user_codes, minlength=len(user_ids))
+
+        self._set_arrays(
+            user_ids,
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            items.to_numpy(dtype=np.int32)[order],
+            to_epoch_seconds(interactions['created_at'].to_numpy())[order],
+            interactions['kind'].to_numpy(dtype=np.int8)[order],
+        )
+
+    @classmethod
+    def from_arrays(cls, user_ids, offsets, items, timestamps, kinds):
+        index = cls.__new__(cls)
+        index._set_arrays(user_ids, offsets, items, timestamps, kinds)
+        return index
+
+    def _set_arrays(self, user_ids, offsets, items, timestamps, kinds):
+        self.user_ids = np.asarray(user_ids, dtype=object)
+        self.user_positions = {user_id: pos for pos, user_id in enumerate(self.user_ids)}
+        self.offsets = offsets
+        self.items = items
+        self.timestamps = timestamps
+        self.kinds = kinds
+        # Interactions ingested since the arrays were built: user_id -> (items, timestamps, kinds)
+        self.pending = {}
+
+    def __setstate__(self, state):
+        # Indexes pickled before ingestion existed have no pending rows
+        state.setdefault('pending', {})
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.items) + sum(len(extra[0]) for extra in self.pending.values())
+
+    def append(self, user_id, items, timestamps, kinds):
+        extra = (
+            np.asarray(items, dtype=np.int32),
+            np.asarray(timestamps, dtype=np.int64),
+            np.asarray(kinds, dtype=np.int8),
+        )
+        previous = self.pending.get(user_id)
+        if previous is not None:
+            extra = tuple(np.concatenate([old, new]) for old, new in zip(previous, extra))
+        # Swap in a new tuple so concurrent readers see either the old or new rows
+        self.pending[user_id] = extra
+
+    def compact(self):
+        # Fold pending interactions back into the contiguous per-user arrays
+        if not self.pending:
+            return
+        pending = self.pending
+        new_users = [user_id for user_id in pending if user_id not in self.user_positions]
+        user_ids = np.concatenate([self.user_ids, np.array(new_users, dtype=object)])
+        positions = {user_id: pos for pos, user_id in enumerate(user_ids)}
+
+        counts = np.diff(self.offsets)
+        user_rows = [np.repeat(np.arange(len(counts)), counts)]
+        items, timestamps, kinds = [self.items], [self.timestamps], [self.kinds]
+        for user_id, (extra_items, extra_timestamps, extra_kinds) in pending.items():
+            user_rows.append(np.full(len(extra_items), positions[user_id]))
+            items.append(extra_items)
+            timestamps.append(extra_timestamps)
+            kinds.append(extra_kinds)
+
+        user_rows = np.concatenate(user_rows)
+        order = np.argsort(user_rows, kind='stable')
+        counts = np.bincount(user_rows, minlength=len(user_ids))
+        self._set_arrays(
+            user_ids,
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            np.concatenate(items)[order],
+            np.concatenate(timestamps)[order],
+            np.concatenate(kinds)[order],
+        )
+
+    def gather(self, user_ids):
+        # (batch row, item, timestamp, kind) of every interaction of the given users
+        positions = np.array([self.user_positions.get(u, -1) for u in user_ids], dtype=np.int64)
+        known = np.flatnonzero(positions >= 0)
+        starts = self.offsets[positions[known]]
+        lengths = self.offsets[positions[known] + 1] - starts
+
+        rows = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows += np.repeat(starts, lengths)
+        batch_rows = [np.repeat(known, lengths)]
+        items, timestamps, kinds = [self.items[rows]], [self.timestamps[rows]], [self.kinds[rows]]
+
+        if self.pending:
+            for pos, user_id in enumerate(user_ids):
+                extra = self.pending.get(user_id)
+                if extra is not None:
+                    batch_rows.append(np.full(len(extra[0]), pos))
+                    items.append(extra[0])
+                    timestamps.append(extra[1])
+                    kinds.append(extra[2])
+
+        return (np.concatenate(batch_rows), np.concatenate(items),
+                np.concatenate(timestamps), np.concatenate(kinds))
+
+    def weight_matrix(self, user_ids, n_items, now=None):
+        # (users x items) matrix of normalised interaction weights; rows of
+        # unknown users stay empty so their profiles come out as zeros
+        batch_rows, items, timestamps, kinds = self.gather(user_ids)
+
+        age_days = (now_seconds(now) - timestamps) // SECONDS_PER_DAY
+        weights = BASE_WEIGHTS[kinds] * np.exp(-age_days / DECAY_DAYS[kinds])
+        totals = np.bincount(batch_rows, weights=weights, minlength=len(user_ids))
+        nonzero = totals[batch_rows] > 0
+        weights[nonzero] /= totals[batch_rows][nonzero]
+
+        return csr_matrix((weights, (batch_rows, items)), shape=(len(user_ids), n_items))
+
+    def purchase_mean(self, user_ids, item_values):
+        # Mean of item_values over each user's purchases, and whether they have any
+        batch_rows, items, _, kinds = self.gather(user_ids)
+        purchases = kinds == PURCHASE
+        batch_rows = batch_rows[purchases]
+        counts = np.bincount(batch_rows, minlength=len(user_ids))
+        sums = np.bincount(batch_rows, weights=item_values[items[purchases]], minlength=len(user_ids))
+        return sums / np.maximum(counts, 1), counts > 0
+
+    def profile(self, user_id, feature_matrix, now=None):
+        return self.profiles([user_id], feature_matrix, now)[0]
+
+    def profiles(self, user_ids, feature_matrix, now=None):
+        return weighted_sum(self.weight_matrix(user_ids, feature_matrix.shape[0], now), feature_matrix)
@@ -1,53 +1,19 @@
 import pandas as pd
 import numpy as np
 import joblib
+import time
 from flask import Flask, request, jsonify
 from datetime import datetime
 from sklearn.preprocessing import OneHotEncoder, MinMaxScaler
-from sentence_transformers import SentenceTransformer
+from embedding_store import EmbeddingStore
+from features import CompactFeatures
+from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, count_error, observe_request
+from profiler import from_env as profiler_from_env, maybe_profile
 from models import HybridRecommender, ContentRecommender, CollaborativeFiltering, SessionRecommender
 
 # === 1. LOAD DATA (REPLICATES COLAB MERGES) ===
-def load_data():
-    products = pd.read_csv('csv/products.csv')
-    variants = pd.read_csv('csv/variants.csv')
-    orders = pd.read_csv('csv/orders.csv')
-    order_items = pd.read_csv('csv/order_items.csv')
-    cart_events = pd.read_csv('csv/cart_events.csv')
-    product_categories = pd.read_csv('csv/product_categories.csv')
-
-    orders['created_at'] = pd.to_datetime(orders['created_at'])
-    cart_events['created_at'] = pd.to_datetime(cart_events['created_at'])
-
-    product_variants = (
-        pd.merge(pd.merge(products, variants, on='product_id'),
-                 product_categories, on='product_id')
-        .groupby('variant_id')
-        .agg({
-            'name': 'first',
-            'description': 'first',
-            'color': 'first',
-            'size': 'first',
-            'price': 'first',
-            'stock': 'first',
-            'category_id': lambda x: list(x.unique())
-        })
-        .reset_index()
-    )
-
-    user_purchases = pd.merge(
-        pd.merge(orders, order_items, on='order_id'),
-        product_variants,
-        on='variant_id'
-    )
-
-    user_carts = pd.merge(
-        cart_events,
-        product_variants,
-        on='variant_id'
-    )
-
-    return product_variants, user_purchases, user_carts
+# The merges run once and are cached as Parquet under data_cache/; see data_cache.py
+from data_cache import load_data
 
 # === 2. RECONSTRUCT RECOMMENDER ===
 class LocalHybridWrapper:
@@ -62,35 +28,53 @@ class LocalHybridWrapper:
         self.model.content_model.products = self.products
         self.model.content_model.encoder = OneHotEncoder(handle_unknown='ignore')
         self.model.content_model.scaler = MinMaxScaler()
-        self.model.content_model.text_model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
 
         cat = self.model.content_model.encoder.fit_transform(self.products[['color', 'size']])
         num = self.model.content_model.scaler.fit_transform(self.products[['price']])
-        txt = self.model.content_model.text_model.encode(self.products['description'].fillna(''))
+        txt = EmbeddingStore().encode(self.products['description'].fillna(''))
 
-        self.model.content_model.text_embeddings = txt
         self.model.content_model.variant_to_index = {
             vid: idx for idx, vid in enumerate(self.products['variant_id'])
         }
-        self.model.content_model.feature_matrix = np.hstack([cat.toarray(), num, txt])
+        self.model.content_model.feature_matrix = CompactFeatures.from_blocks(cat, num, txt)
+        self.model.content_model.build_index()
+        self.model.build_session_model()
+        self.model.build_interaction_index()
+        self.model.build_scorer()
 
-    def recommend(self, user_id, n): 
-        return self.model.recommend(user_id, n=n)
+    def recommend(self, user_id, n, session_history=None):
+        return self.model.recommend(user_id, session_history=session_history, n=n)
 
 # === 3. FLASK API ===
 app = Flask(__name__)
 recommender = LocalHybridWrapper('model.pkl')
+profiler = profiler_from_env()  # SLOW_PROFILE_MS, see profiler.py
 
 @app.route("/recommend/<user_id>", methods=["GET"])
 def recommend_endpoint(user_id):
+    start = time.perf_counter()
+    status = 200
     try:
         n = int(request.args.get('n', 10))  # default to 10 recommendations
-        recs = recommender.recommend(user_id, n=n)
+        # live session: ?session=<variant_id>,<variant_id>,... oldest first
+        session = request.args.get('session')
+        session_history = session.split(',') if session else None
+        with maybe_profile(profiler, 'recommend'):
+            recs = recommender.recommend(user_id, n=n, session_history=session_history)
         if recs is None:
+            status = 404
             return jsonify({"error": "User not found or no recommendations available."}), 404
         return jsonify({"user_id": user_id, "recommendations": recs})
     except Exception as e:
+        status = 500
+        count_error('/recommend/<user_id>', e)
         return jsonify({"error": str(e)}), 500
+    finally:
+        observe_request('/recommend/<user_id>', status, time.perf_counter() - start)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return REGISTRY.render(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
 
 # === 4. MAIN ===
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+# Bounded in-process cache of recommendation lists keyed by (user_id, params),
+# where params holds n, the fusion weights and filters. Entries expire after ttl_seconds
+# and the least recently used entry is evicted once max_entries is reached.
+# invalidate_user drops every entry of one user, e.g. after an order or cart event.
+# Lists are computed outside the lock, so callers read generation(user_id)
+# before computing and pass it to put: a list computed before an invalidation
+# (or clear) that finished after it is then not cached.
+class RecommendationCache:
+    def __init__(self, max_entries=10000, ttl_seconds=300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._entries = OrderedDict()  # (user_id, params) -> (expires_at, recommendations)
+        self._user_keys = defaultdict(set)
+        self._user_generations = defaultdict(int)  # bumped by invalidate_user
+        self._clears = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, params):
+        key = (user_id, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, recommendations = entry
+            if expires_at <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return recommendations
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._clears, self._user_generations.get(user_id, 0)
+
+    def put(self, user_id, params, recommendations, generation=None):
+        if self.max_entries <= 0:
+            return
+        key = (user_id, params)
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._user_generations.get(user_id, 0)):
+                return
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (self.clock() + self.ttl_seconds, recommendations)
+            self._user_keys[user_id].add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_compute(self, user_id, params, compute):
+        recommendations = self.get(user_id, params)
+        if recommendations is None:
+            generation = self.generation(user_id)
+            recommendations = compute()
+            self.put(user_id, params, recommendations, generation)
+        return recommendations
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._user_generations[user_id] += 1
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._user_generations.clear()
+            self._clears += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        user_keys = self._user_keys[key[0]]
+        user_keys.discard(key)
+        if not user_keys:
+            del self._user_keys[key[0]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,543 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from filters import AttributeIndex
+from metrics import stage
+from popularity import PopularityIndex
+from profiles import PURCHASE, now_seconds, to_epoch_seconds
+
+# Users scored per matrix multiply; bounds the (users x catalog) score buffers
+BATCH_CHUNK = 256
+
+# Each component contributes its top max(n * factor, minimum) items to fusion
+CANDIDATE_POOL_FACTOR = 5
+MIN_CANDIDATE_POOL = 50
+
+# Prices this many times above or below the user's typical purchase price are
+# one full tier away and get the whole price_tier_penalty
+PRICE_TIER_RATIO = 2.0
+
+
+def candidate_pool(n, n_items):
+    return min(max(n * CANDIDATE_POOL_FACTOR, MIN_CANDIDATE_POOL), n_items)
+
+
+def top_n(scores, n):
+    # Row-wise top n (indices, scores) in descending order without a full sort
+    scores = np.atleast_2d(scores)
+    n = min(n, scores.shape[1])
+    if n <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    idx = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind='stable')
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+def score_fusion(components, n_users, n_items):
+    # Weighted sum of component scores over a dense item axis. Each component
+    # gives (weight, item indices, scores) per user with -1 padding; its scores
+    # are min-max normalised per user so the signals are on one scale.
+    fused = np.zeros((n_users, n_items))
+    for weight, idx, scores in components:
+        if weight == 0 or idx.size == 0:
+            continue
+        valid = (idx >= 0) & np.isfinite(scores)
+        scores = np.where(valid, scores, 0.0)
+        has_valid = valid.any(axis=1, keepdims=True)
+        lo = np.where(has_valid, np.where(valid, scores, np.inf).min(axis=1, keepdims=True), 0.0)
+        hi = np.where(has_valid, np.where(valid, scores, -np.inf).max(axis=1, keepdims=True), 0.0)
+        span = hi - lo
+        # A component that scores every candidate the same can't rank them, so it
+        # adds nothing rather than its full weight to arbitrary items
+        normalised = np.where(span > 0, (scores - lo) / np.where(span > 0, span, 1.0), 0.0)
+
+        rows = np.broadcast_to(np.arange(n_users)[:, None], idx.shape)
+        # Items are unique within a row of one component, so no np.add.at needed
+        fused[rows[valid], idx[valid]] += weight * normalised[valid]
+    return fused
+
+
+def mmr_rerank(candidates, relevance, n, penalty, item_products, item_categories):
+    # Greedy maximal marginal relevance over (users x candidates): each step picks
+    # the candidate maximising (1 - penalty) * relevance - penalty * max similarity
+    # to the items already picked. Similarity is half same-product, half cosine of
+    # category membership. Invalid candidates have relevance -inf. Returns the
+    # picked items and their relevance, padded with -1 / -inf.
+    n_users, n_candidates = candidates.shape
+    n = min(n, n_candidates)
+    rows = np.arange(n_users)
+
+    available = np.isfinite(relevance)
+    top = np.where(available, relevance, -np.inf).max(axis=1, keepdims=True)
+    scores = relevance
+    relevance = np.where(available, relevance / np.where(top > 0, top, 1.0), 0.0)
+
+    products = item_products[candidates]
+    categories = item_categories[candidates]
+    max_similarity = np.zeros((n_users, n_candidates))
+    picked = np.full((n_users, n), -1, dtype=np.int64)
+    picked_scores = np.full((n_users, n), -np.inf)
+    for step in range(n):
+        mmr = np.where(available, (1 - penalty) * relevance - penalty * max_similarity, -np.inf)
+        choice = np.argmax(mmr, axis=1)
+        ok = available[rows, choice]
+        picked[ok, step] = candidates[rows, choice][ok]
+        picked_scores[ok, step] = scores[rows, choice][ok]
+        available[rows, choice] = False
+
+        similarity = 0.5 * (products == products[rows, choice][:, None])
+        similarity += 0.5 * np.einsum('umc,uc->um', categories, categories[rows, choice])
+        max_similarity = np.maximum(max_similarity, similarity)
+    return picked, picked_scores
+
+
+def item_attributes(products):
+    # Per catalog row: price, product code and L2-normalised category membership,
+    # plus the category ids of the membership columns. Frames without product_id
+    # fall back to the product name.
+    prices = products['price'].to_numpy(dtype=np.float64)
+    product_column = 'product_id' if 'product_id' in products else 'name'
+    product_codes = pd.factorize(products[product_column])[0].astype(np.int32)
+
+    if 'category_id' in products:
+        links = products['category_id'].reset_index(drop=True).explode().dropna()
+        category_codes, categories = pd.factorize(links)
+        membership = np.zeros((len(products), max(len(categories), 1)), dtype=np.float32)
+        membership[links.index.to_numpy(dtype=np.int64), category_codes] = 1.0
+        categories = np.asarray(categories).astype(str)
+    else:
+        membership = np.zeros((len(products), 1), dtype=np.float32)
+        categories = np.empty(0, dtype=str)
+    norms = np.linalg.norm(membership, axis=1, keepdims=True)
+    membership /= np.where(norms > 0, norms, 1.0)
+    return prices, product_codes, membership, categories
+
+
+# Array-only view of a trained HybridRecommender used to score many users at
+# once: content, ALS and LightFM signals become one matrix multiply each, are
+# fused at score level over a candidate pool and re-ranked for diversity and price.
+# Users with no interactions at all skip that and get the trending items.
+# Attribute filters (category, size, colour, in stock) become one boolean mask
+# over the catalog that every candidate source applies before its own top-n.
+class HybridScorer:
+    def __init__(self, variant_ids, feature_matrix, content_index, interaction_index,
+                 collab_user_ids, collab_to_content, liked_items,
+                 als_user_factors, als_item_factors,
+                 lfm_user_embeddings, lfm_user_biases, lfm_item_embeddings, lfm_item_biases,
+                 item_prices, item_products, item_categories,
+                 als_regularization=0.01, als_alpha=1.0, session_index=None, category_ids=None,
+                 attributes=None, neighbours=None):
+        self.variant_ids = np.asarray(variant_ids, dtype=object)
+        self.feature_matrix = feature_matrix
+        self.content_index = content_index
+        self.interaction_index = interaction_index
+        self.collab_user_index = pd.Index(collab_user_ids)
+        self.collab_to_content = np.asarray(collab_to_content, dtype=np.int64)
+        self.liked_items = liked_items
+        self.als_user_factors = als_user_factors
+        self.als_item_factors = als_item_factors
+        self.lfm_user_embeddings = lfm_user_embeddings
+        self.lfm_user_biases = lfm_user_biases
+        self.lfm_item_embeddings = lfm_item_embeddings
+        self.lfm_item_biases = lfm_item_biases
+        self.item_prices = item_prices
+        self.item_products = item_products
+        self.item_categories = item_categories
+        self.als_regularization = als_regularization
+        self.als_alpha = als_alpha
+        self.session_index = session_index
+        self.category_ids = pd.Index(category_ids if category_ids is not None else [], dtype=object)
+        self.attributes = attributes
+        self.neighbours = neighbours
+        self.popularity = PopularityIndex.from_interactions(interaction_index, len(self.variant_ids),
+                                                            item_categories)
+
+        self.variant_positions = {variant_id: pos for pos, variant_id in enumerate(self.variant_ids)}
+        self.content_to_collab = np.full(len(self.variant_ids), -1, dtype=np.int64)
+        valid = self.collab_to_content >= 0
+        self.content_to_collab[self.collab_to_content[valid]] = np.flatnonzero(valid)
+
+        # Users refitted from ingested purchases since the arrays were built:
+        # user_id -> {'items': collab item indices, 'quantities': ..., 'als_factors': ...}
+        self.user_updates = {}
+        self._als_gram = None
+
+    def __setstate__(self, state):
+        # Scorers pickled before the session index existed score without it;
+        # popularity is rebuilt from the interactions
+        state.setdefault('session_index', None)
+        state.setdefault('category_ids', pd.Index([], dtype=object))
+        state.setdefault('attributes', None)
+        state.setdefault('neighbours', None)
+        self.__dict__.update(state)
+        if 'popularity' not in state:
+            self.popularity = PopularityIndex.from_interactions(self.interaction_index, len(self.variant_ids),
+                                                                self.item_categories)
+
+    @classmethod
+    def from_model(cls, model):
+        content = model.content_model
+        collab = model.collab_model
+
+        als = collab.als_model
+        if hasattr(als, 'to_cpu'):
+            als = als.to_cpu()
+        lfm = collab.lfm_model
+        if getattr(content, 'index', None) is None:
+            content.build_index()
+
+        collab_to_content = np.array(
+            [content.variant_to_index.get(v, -1) for v in collab.variant_index], dtype=np.int64
+        )
+        item_prices, item_products, item_categories, category_ids = item_attributes(content.products)
+        return cls(
+            variant_ids=content.products['variant_id'].to_numpy(),
+            feature_matrix=content.feature_matrix,
+            content_index=content.index,
+            interaction_index=model.interaction_index,
+            collab_user_ids=collab.user_index,
+            collab_to_content=collab_to_content,
+            liked_items=collab.interaction_matrix.tocsr(),
+            als_user_factors=np.asarray(als.user_factors),
+            als_item_factors=np.asarray(als.item_factors),
+            lfm_user_embeddings=lfm.user_embeddings,
+            lfm_user_biases=lfm.user_biases,
+            lfm_item_embeddings=lfm.item_embeddings,
+            lfm_item_biases=lfm.item_biases,
+            item_prices=item_prices,
+            item_products=item_products,
+            item_categories=item_categories,
+            als_regularization=als.regularization,
+            als_alpha=getattr(als, 'alpha', 1.0),
+            session_index=model.session_model.index,
+            category_ids=category_ids,
+            attributes=AttributeIndex.from_products(content.products),
+            neighbours=getattr(model, 'neighbours', None),
+        )
+
+    def ingest(self, user_id, variant_ids, kind=PURCHASE, quantities=None, created_at=None):
+        # Append new interactions of one user. The content profile picks them up
+        # immediately; purchases also refit the user's ALS factors against the
+        # fixed item factors, which costs one small least-squares solve.
+        variant_ids = list(variant_ids)
+        quantities = np.ones(len(variant_ids)) if quantities is None else np.asarray(quantities, dtype=np.float64)
+        items = np.array([self.variant_positions.get(v, -1) for v in variant_ids], dtype=np.int64)
+        known = items >= 0
+        items, quantities = items[known], quantities[known]
+        if not len(items):
+            return 0
+
+        if created_at is None:
+            timestamps = np.full(len(items), now_seconds(), dtype=np.int64)
+        else:
+            timestamps = np.full(len(items), to_epoch_seconds([created_at])[0], dtype=np.int64)
+        kinds = np.full(len(items), kind)
+        self.interaction_index.append(user_id, items, timestamps, kinds)
+        self.popularity.add(items, timestamps, kinds)
+
+        if kind == PURCHASE:
+            collab_items = self.content_to_collab[items]
+            in_collab = collab_items >= 0
+            if in_collab.any():
+                self._refit_user(user_id, collab_items[in_collab], quantities[in_collab])
+        return len(items)
+
+    def _refit_user(self, user_id, collab_items, quantities):
+        update = self.user_updates.get(user_id)
+        if update is not None:
+            items = np.concatenate([update['items'], collab_items])
+            quantities = np.concatenate([update['quantities'], quantities])
+        else:
+            row = self.collab_user_index.get_indexer([user_id])[0]
+            if row >= 0:
+                start, end = self.liked_items.indptr[row], self.liked_items.indptr[row + 1]
+                items = np.concatenate([self.liked_items.indices[start:end], collab_items])
+                quantities = np.concatenate([self.liked_items.data[start:end], quantities])
+            else:
+                items = collab_items
+
+        items, inverse = np.unique(items, return_inverse=True)
+        quantities = np.bincount(inverse, weights=quantities, minlength=len(items))
+        self.user_updates[user_id] = {
+            'items': items,
+            'quantities': quantities,
+            'als_factors': self._solve_als_user(items, quantities),
+        }
+
+    def _solve_als_user(self, items, quantities):
+        # Same normal equations implicit solves for a user with item factors Y
+        # fixed: (Y'Y + reg*I + Y'(C - I)Y) x = Y'C p
+        if self._als_gram is None:
+            item_factors = np.asarray(self.als_item_factors, dtype=np.float64)
+            self._als_gram = item_factors.T @ item_factors
+        factors = np.asarray(self.als_item_factors[items], dtype=np.float64)
+        confidence = self.als_alpha * quantities
+        a = (self._als_gram + self.als_regularization * np.eye(factors.shape[1])
+             + (factors.T * (confidence - 1)) @ factors)
+        b = confidence @ factors
+        return np.linalg.solve(a, b).astype(self.als_user_factors.dtype)
+
+    def compact(self):
+        # Fold ingested interactions and refitted users back into the arrays.
+        # New users are appended after the users LightFM was trained on and get
+        # no LightFM candidates until the next retrain.
+        self.interaction_index.compact()
+        if not self.user_updates:
+            return
+        updates = self.user_updates
+
+        new_users = [user_id for user_id in updates if user_id not in self.collab_user_index]
+        user_ids = self.collab_user_index.append(pd.Index(new_users))
+        n_new = len(new_users)
+
+        als_user_factors = np.vstack([
+            self.als_user_factors, np.zeros((n_new, self.als_user_factors.shape[1]), self.als_user_factors.dtype)
+        ])
+        rows = user_ids.get_indexer(list(updates))
+        als_user_factors[rows] = np.stack([update['als_factors'] for update in updates.values()])
+
+        liked = self.liked_items.tocoo()
+        keep = ~np.isin(liked.row, rows)
+        update_rows = np.concatenate([np.full(len(u['items']), row) for row, u in zip(rows, updates.values())])
+        liked_items = csr_matrix((
+            np.concatenate([liked.data[keep], np.concatenate([u['quantities'] for u in updates.values()])]),
+            (np.concatenate([liked.row[keep], update_rows]),
+             np.concatenate([liked.col[keep], np.concatenate([u['items'] for u in updates.values()])]))
+        ), shape=(len(user_ids), liked.shape[1]))
+
+        self.collab_user_index = user_ids
+        self.als_user_factors = als_user_factors
+        self.liked_items = liked_items
+        self.user_updates = {}
+
+    def build_content_index(self, kind='exact', **params):
+        from ann import build_index  # ann imports top_n from this module
+        self.content_index = build_index(self.feature_matrix, kind, **params)
+
+    def recommend(self, user_id, content_weight=0.4, als_weight=0.3, lfm_weight=0.15, session_weight=0.1,
+                  popularity_weight=0.05, diversity_penalty=0.3, price_tier_penalty=0.5, n=10, now=None,
+                  session_history=None, filters=None):
+        return self.recommend_batch(
+            [user_id], content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+            session_weight=session_weight, popularity_weight=popularity_weight,
+            diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty, n=n, now=now,
+            sessions=None if session_history is None else [session_history], filters=filters
+        )[0]
+
+    def recommend_batch(self, user_ids, content_weight=0.4, als_weight=0.3, lfm_weight=0.15, session_weight=0.1,
+                        popularity_weight=0.05, diversity_penalty=0.3, price_tier_penalty=0.5, n=10, now=None,
+                        sessions=None, filters=None):
+        # sessions: optional per-user live session histories (variant ids, oldest
+        # first, or None) that add transition-based candidates. filters: optional
+        # dict of category, size, color (a value or a list of alternatives) and
+        # in_stock; only matching variants are recommended
+        picked, _ = self.rank_batch(
+            user_ids, content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+            session_weight=session_weight, popularity_weight=popularity_weight,
+            diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty, n=n, now=now,
+            sessions=sessions, filters=filters
+        )
+        return [self.variant_ids[row[row >= 0]].tolist() for row in picked]
+
+    def rank_batch(self, user_ids, content_weight=0.4, als_weight=0.3, lfm_weight=0.15, session_weight=0.1,
+                   popularity_weight=0.05, diversity_penalty=0.3, price_tier_penalty=0.5, n=10, now=None,
+                   sessions=None, filters=None):
+        # recommend_batch as (catalog rows, scores) arrays of shape (users, n),
+        # padded with -1 / -inf
+        params = dict(content_weight=content_weight, als_weight=als_weight, lfm_weight=lfm_weight,
+                      session_weight=session_weight, popularity_weight=popularity_weight,
+                      diversity_penalty=diversity_penalty, price_tier_penalty=price_tier_penalty)
+        user_ids = list(user_ids)
+        sessions = list(sessions) if sessions is not None else [None] * len(user_ids)
+        picked = np.full((len(user_ids), n), -1, dtype=np.int64)
+        scores = np.full((len(user_ids), n), -np.inf)
+        allowed = self.filter_mask(filters)
+
+        cold = self._cold_users(user_ids, sessions)
+        if cold.any():
+            with stage('popular'):
+                cold_picked, cold_scores = self._popular_ranking(n, diversity_penalty, allowed)
+                picked[cold, :cold_picked.shape[1]] = cold_picked
+                scores[cold, :cold_scores.shape[1]] = cold_scores
+
+        warm = np.flatnonzero(~cold)
+        for start in range(0, len(warm), BATCH_CHUNK):
+            rows = warm[start:start + BATCH_CHUNK]
+            chunk_picked, chunk_scores = self._recommend_chunk(
+                [user_ids[row] for row in rows], [sessions[row] for row in rows], n, now, allowed, **params
+            )
+            picked[rows, :chunk_picked.shape[1]] = chunk_picked
+            scores[rows, :chunk_scores.shape[1]] = chunk_scores
+        return picked, scores
+
+    def filter_mask(self, filters):
+        # Catalog rows passing the attribute filters, or None without filters
+        if not filters:
+            return None
+        if self.attributes is None:
+            raise ValueError('Model was built without attribute filters; retrain it to filter')
+        return self.attributes.mask(**filters)
+
+    def popular(self, n=10, category=None):
+        # Trending variant ids, overall or within a category id
+        column = None
+        if category is not None:
+            column = self.category_ids.get_indexer([category])[0]
+            if column < 0:
+                return []
+        idx, _ = self.popularity.top(n, column)
+        return self.variant_ids[idx].tolist()
+
+    def similar(self, variant_id, n=10):
+        # Variants similar to one variant from the precomputed neighbour lists
+        # (neighbours.py); None for a variant they don't know
+        if self.neighbours is None:
+            raise ValueError('Model has no neighbour lists; build them with neighbours.py')
+        return self.neighbours.similar(variant_id, n)
+
+    def _cold_users(self, user_ids, sessions):
+        # Users without interactions, ALS factors or a live session: their content
+        # profile is all zeros and no collaborative model knows them
+        interactions = self.interaction_index
+        collab_rows = self.collab_user_index.get_indexer(user_ids)
+        return np.array([
+            row < 0 and not session and user_id not in interactions.user_positions
+            and user_id not in interactions.pending and user_id not in self.user_updates
+            for user_id, session, row in zip(user_ids, sessions, collab_rows)
+        ], dtype=bool)
+
+    def _popular_ranking(self, n, diversity_penalty, allowed=None):
+        # The one list every cold user gets: trending candidates, diversified
+        # like any other user's
+        idx, popularity = self.popularity.top(candidate_pool(n, len(self.variant_ids)), allowed=allowed)
+        candidates, relevance = idx[None, :], popularity[None, :]
+        if diversity_penalty and len(idx):
+            return mmr_rerank(candidates, relevance, n, diversity_penalty, self.item_products, self.item_categories)
+        return candidates[:, :n], relevance[:, :n]
+
+    def _recommend_chunk(self, user_ids, sessions, n, now, allowed, content_weight, als_weight, lfm_weight,
+                         session_weight, popularity_weight, diversity_penalty, price_tier_penalty):
+        n_users = len(user_ids)
+        n_items = len(self.variant_ids)
+        pool = candidate_pool(n, n_items)
+        collab_allowed = None
+        if allowed is not None:
+            collab_allowed = (self.collab_to_content >= 0) & allowed[np.maximum(self.collab_to_content, 0)]
+
+        with stage('profile'):
+            profiles = self.interaction_index.profiles(user_ids, self.feature_matrix, now)
+        # Users known only by their live session have an all-zero profile; a content
+        # search with it would rank arbitrary items, so they get trending items in
+        # its place and are scored on session plus popularity
+        has_profile = np.asarray(abs(profiles).sum(axis=1)).ravel() > 0
+        components = []
+        if has_profile.any():
+            with stage('content'):
+                found_idx, found_scores = self.content_index.search(profiles[has_profile], pool, allowed)
+                content_idx = np.full((n_users, found_idx.shape[1]), -1, dtype=np.int64)
+                content_scores = np.full((n_users, found_idx.shape[1]), -np.inf)
+                content_idx[has_profile], content_scores[has_profile] = found_idx, found_scores
+                components.append((content_weight, content_idx, content_scores))
+
+        if session_weight and self.session_index is not None and any(sessions):
+            with stage('session'):
+                histories = [[self.variant_positions[v] for v in session or () if v in self.variant_positions]
+                             for session in sessions]
+                components.append((session_weight, *self.session_index.search(histories, pool, allowed)))
+
+        if popularity_weight or not has_profile.all():
+            with stage('popular'):
+                idx, popularity = self.popularity.top(pool, allowed=allowed)
+                idx = np.broadcast_to(idx, (n_users, len(popularity)))
+                popularity = np.broadcast_to(popularity, idx.shape)
+                components.append((popularity_weight, idx, popularity))
+                if not has_profile.all():
+                    components.append((content_weight, np.where(has_profile[:, None], -1, idx), popularity))
+
+        # ALS and LightFM only know users with purchases; others get no collab candidates.
+        # Users refitted from ingested purchases use their fresh ALS factors.
+        collab_rows = self.collab_user_index.get_indexer(user_ids)
+        updated = [pos for pos, user_id in enumerate(user_ids) if user_id in self.user_updates]
+        als_known = collab_rows >= 0
+        als_known[updated] = True
+        als_known = np.flatnonzero(als_known)
+        if len(als_known):
+            with stage('als'):
+                rows = collab_rows[als_known]
+                als_users = self.als_user_factors[np.maximum(rows, 0)]
+                for i, pos in enumerate(als_known):
+                    update = self.user_updates.get(user_ids[pos])
+                    if update is not None:
+                        als_users[i] = update['als_factors']
+
+                als_scores = als_users @ self.als_item_factors.T
+                self._mask_liked(als_scores, [user_ids[pos] for pos in als_known], rows)
+                candidates = self._collab_candidates(als_scores, als_known, n_users, pool, collab_allowed)
+                components.append((als_weight, *candidates))
+
+        known = np.flatnonzero((collab_rows >= 0) & (collab_rows < len(self.lfm_user_biases)))
+        if len(known):
+            with stage('lfm'):
+                rows = collab_rows[known]
+                lfm_scores = (self.lfm_user_embeddings[rows] @ self.lfm_item_embeddings.T
+                              + self.lfm_user_biases[rows, None] + self.lfm_item_biases)
+                candidates = self._collab_candidates(lfm_scores, known, n_users, pool, collab_allowed)
+                components.append((lfm_weight, *candidates))
+
+        with stage('fusion'):
+            fused = score_fusion(components, n_users, n_items)
+            candidates, relevance = top_n(fused, pool)
+            relevance = np.where(relevance > 0, relevance, -np.inf)
+
+        with stage('rerank'):
+            if price_tier_penalty:
+                factor = self._price_tier_factor(user_ids, candidates, price_tier_penalty, now)
+                relevance = np.where(np.isfinite(relevance), relevance * factor, -np.inf)
+
+            if diversity_penalty:
+                return mmr_rerank(candidates, relevance, n, diversity_penalty,
+                                  self.item_products, self.item_categories)
+            order, top_relevance = top_n(relevance, n)
+            picked = np.take_along_axis(candidates, order, axis=1)
+            picked[~np.isfinite(top_relevance)] = -1
+            return picked, top_relevance
+
+    def _price_tier_factor(self, user_ids, candidates, penalty, now):
+        # Scale candidates down by how many price tiers they sit from the user's
+        # mean purchase price; users without purchases are not penalised
+        user_log_price, has_purchases = self.interaction_index.purchase_mean(
+            user_ids, np.log(np.maximum(self.item_prices, 0.01))
+        )
+        distance = np.abs(np.log(np.maximum(self.item_prices[candidates], 0.01)) - user_log_price[:, None])
+        tiers = np.minimum(distance / np.log(PRICE_TIER_RATIO), 1.0)
+        return np.where(has_purchases[:, None], 1.0 - penalty * tiers, 1.0)
+
+    def _mask_liked(self, scores, user_ids, rows):
+        # ALS recommend filters items the user already bought
+        liked = self.liked_items[np.maximum(rows, 0)]
+        counts = np.diff(liked.indptr)
+        counts[rows < 0] = 0
+        for i, user_id in enumerate(user_ids):
+            update = self.user_updates.get(user_id)
+            if update is not None:
+                counts[i] = 0
+                scores[i, update['items']] = -np.inf
+        keep = np.repeat(counts > 0, np.diff(liked.indptr))
+        scores[np.repeat(np.arange(len(rows)), counts), liked.indices[keep]] = -np.inf
+
+    def _collab_candidates(self, scores, known, n_users, pool, allowed=None):
+        # allowed: boolean mask over collab items; the rest never become candidates
+        if allowed is not None:
+            scores[:, ~allowed] = -np.inf
+        idx, top_scores = top_n(scores, pool)
+        idx = self.collab_to_content[idx]
+        idx[~np.isfinite(top_scores)] = -1
+
+        candidates = np.full((n_users, idx.shape[1]), -1, dtype=np.int64)
+        candidate_scores = np.full((n_users, idx.shape[1]), -np.inf)
+        candidates[known] = idx
+        candidate_scores[known] = top_scores
+        return candidates, candidate_scores
@@ -0,0 +1,141 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from profiles import to_epoch_seconds
+
+# Item-to-item transitions mined from cart events. Each user's events are taken
+# in created_at order and every event links to the next SESSION_WINDOW events:
+# forward links count fully, backward links BACKWARD_WEIGHT, both divided by the
+# step distance and halved for every TRANSITION_HALF_LIFE_DAYS between the two
+# events. Rows keep their MAX_NEIGHBOURS strongest links, scaled so the top one
+# is 1, and are stored as CSR arrays over the content feature rows.
+SESSION_WINDOW = 3
+BACKWARD_WEIGHT = 0.5
+TRANSITION_HALF_LIFE_DAYS = 7.0
+MAX_NEIGHBOURS = 50
+
+# A live session is scored from its last MAX_HISTORY items; each step back in
+# the session multiplies an item's weight by HISTORY_DECAY
+MAX_HISTORY = 10
+HISTORY_DECAY = 0.7
+
+SECONDS_PER_DAY = 86400.0
+
+
+class SessionIndex:
+    def __init__(self, user_carts, variant_to_index, n_items=None):
+        n_items = n_items if n_items is not None else len(variant_to_index)
+        rows = user_carts['variant_id'].astype(object).map(variant_to_index)
+        known = rows.notna().to_numpy()
+        events = user_carts[known]
+        items = rows[known].to_numpy(dtype=np.int64)
+        users = events['user_id'].astype('category').cat.codes.to_numpy()
+        seconds = to_epoch_seconds(events['created_at'].to_numpy())
+
+        order = np.lexsort((seconds, users))
+        items, users, seconds = items[order], users[order], seconds[order]
+
+        sources, targets, weights = [], [], []
+        half_life = TRANSITION_HALF_LIFE_DAYS * SECONDS_PER_DAY
+        for step in range(1, SESSION_WINDOW + 1):
+            same_user = users[step:] == users[:-step]
+            a, b = items[:-step][same_user], items[step:][same_user]
+            gap = (seconds[step:] - seconds[:-step])[same_user]
+            weight = 0.5 ** (gap / half_life) / step
+            distinct = a != b
+            a, b, weight = a[distinct], b[distinct], weight[distinct]
+            sources += [a, b]
+            targets += [b, a]
+            weights += [weight, BACKWARD_WEIGHT * weight]
+
+        transitions = csr_matrix(
+            (np.concatenate(weights) if weights else np.empty(0),
+             (np.concatenate(sources) if sources else np.empty(0, np.int64),
+              np.concatenate(targets) if targets else np.empty(0, np.int64))),
+            shape=(n_items, n_items)
+        )
+        transitions.sum_duplicates()
+        self._set_arrays(*self._prune(transitions, MAX_NEIGHBOURS))
+
+    @staticmethod
+    def _prune(transitions, k):
+        # Keep the k largest entries of every row and scale each row to max 1
+        counts = np.diff(transitions.indptr)
+        entry_rows = np.repeat(np.arange(transitions.shape[0]), counts)
+        order = np.lexsort((-transitions.data, entry_rows))
+        rank = np.arange(len(order)) - np.repeat(transitions.indptr[:-1], counts)
+        keep = order[rank < k]
+
+        kept_rows = entry_rows[keep]
+        data = transitions.data[keep]
+        row_max = np.zeros(transitions.shape[0])
+        np.maximum.at(row_max, kept_rows, data)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(kept_rows, minlength=transitions.shape[0]))])
+        return (indptr.astype(np.int64), transitions.indices[keep].astype(np.int32),
+                (data / row_max[kept_rows]).astype(np.float32))
+
+    @classmethod
+    def from_arrays(cls, indptr, indices, data):
+        index = cls.__new__(cls)
+        index._set_arrays(indptr, indices, data)
+        return index
+
+    def _set_arrays(self, indptr, indices, data):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    def get_state(self):
+        return {'indptr': self.indptr, 'indices': self.indices, 'data': self.data}
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def search(self, histories, n, allowed=None):
+        # histories: per query a list of feature rows, oldest first. Returns
+        # (indices, scores) of shape (len(histories), n), padded with -1 / -inf;
+        # items already in a query's history, or outside the optional boolean
+        # mask allowed, are not returned for it.
+        n_queries = len(histories)
+        idx = np.full((n_queries, n), -1, dtype=np.int64)
+        scores = np.full((n_queries, n), -np.inf)
+        if n_queries == 0 or n <= 0:
+            return idx, scores
+
+        recent = [np.asarray(history[-MAX_HISTORY:], dtype=np.int64) for history in histories]
+        lengths = np.array([len(history) for history in recent])
+        if not lengths.sum():
+            return idx, scores
+        history_items = np.concatenate(recent)
+        history_queries = np.repeat(np.arange(n_queries), lengths)
+        # the most recent item of a session has age 0
+        age = np.repeat(np.cumsum(lengths), lengths) - np.arange(len(history_items)) - 1
+        history_weights = HISTORY_DECAY ** age
+
+        starts = self.indptr[history_items]
+        counts = self.indptr[history_items + 1] - starts
+        total = counts.sum()
+        if not total:
+            return idx, scores
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        entry_queries = np.repeat(history_queries, counts)
+        n_rows = len(self)
+        keys = entry_queries * n_rows + self.indices[positions]
+        weights = self.data[positions] * np.repeat(history_weights, counts)
+
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights)
+        fresh = ~np.isin(keys, history_queries * n_rows + history_items)
+        if allowed is not None:
+            fresh &= allowed[keys % n_rows]
+        keys, sums = keys[fresh], sums[fresh]
+
+        queries, items = keys // n_rows, keys % n_rows
+        order = np.lexsort((-sums, queries))
+        queries, items, sums = queries[order], items[order], sums[order]
+        first = np.searchsorted(queries, queries, side='left')
+        rank = np.arange(len(queries)) - first
+        top = rank < n
+        idx[queries[top], rank[top]] = items[top]
+        scores[queries[top], rank[top]] = sums[top]
+        return idx, scores
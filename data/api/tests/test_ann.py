@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ann import ExactIndex, IVFIndex
+from features import CompactFeatures
+
+
+def clustered_vectors(n_items=400, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(8, dim))
+    return centres[rng.integers(0, 8, n_items)] + 0.1 * rng.normal(size=(n_items, dim))
+
+
+@pytest.fixture
+def vectors():
+    return clustered_vectors()
+
+
+@pytest.fixture
+def queries():
+    return np.random.default_rng(1).normal(size=(6, 16))
+
+
+def test_ivf_search_only_returns_allowed_items(vectors, queries):
+    allowed = np.random.default_rng(2).random(len(vectors)) < 0.3
+    index = IVFIndex(vectors, n_lists=20, n_probe=3)
+    idx, scores = index.search(queries, 10, allowed)
+    assert (idx >= 0).all()
+    assert allowed[idx].all()
+    np.testing.assert_allclose(scores, np.take_along_axis(queries @ vectors.T, idx, axis=1))
+
+
+def test_ivf_full_probe_with_allowed_matches_exact(vectors, queries):
+    allowed = np.random.default_rng(3).random(len(vectors)) < 0.5
+    index = IVFIndex(vectors, n_lists=20, n_probe=20)
+    idx, scores = index.search(queries, 10, allowed)
+    exact_idx, exact_scores = ExactIndex(vectors).search(queries, 10, allowed)
+    np.testing.assert_array_equal(idx, exact_idx)
+    np.testing.assert_allclose(scores, exact_scores)
+
+
+def test_ivf_pads_when_fewer_items_are_allowed(vectors, queries):
+    allowed = np.zeros(len(vectors), dtype=bool)
+    allowed[[5, 50, 300]] = True
+    idx, scores = IVFIndex(vectors, n_lists=20, n_probe=2).search(queries, 5, allowed)
+    assert set(idx[:, :3].ravel()) == {5, 50, 300}
+    assert (idx[:, 3:] == -1).all()
+    assert np.isneginf(scores[:, 3:]).all()
+
+
+def test_ivf_allowed_on_compact_features(queries):
+    dense = clustered_vectors()
+    features = CompactFeatures.from_blocks(np.zeros((len(dense), 0)), dense[:, :1], dense[:, 1:], 'float32')
+    allowed = np.random.default_rng(4).random(len(dense)) < 0.4
+    idx, _ = IVFIndex(features, n_lists=20, n_probe=4).search(queries, 8, allowed)
+    assert allowed[idx[idx >= 0]].all()
+
+
+def test_ivf_state_round_trip_keeps_results(vectors, queries):
+    index = IVFIndex(vectors, n_lists=20, n_probe=3)
+    params, arrays = index.get_state()
+    loaded = IVFIndex.from_state(vectors, params, arrays)
+    allowed = np.random.default_rng(5).random(len(vectors)) < 0.5
+    for mask in (None, allowed):
+        expected, _ = index.search(queries, 10, mask)
+        actual, _ = loaded.search(queries, 10, mask)
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_ivf_state_holds_ids_into_the_one_feature_matrix(vectors):
+    index = IVFIndex(vectors, n_lists=20, n_probe=3)
+    params, arrays = index.get_state()
+    assert set(arrays) == {'centroids', 'list_items', 'list_offsets'}
+    # list_items is a permutation of the catalog rows
+    np.testing.assert_array_equal(np.sort(arrays['list_items']), np.arange(len(vectors)))
+    assert arrays['list_offsets'][-1] == len(vectors)
+
+
+def test_ivf_centroids_are_unit_length_and_lists_follow_cosine(vectors):
+    # scaling some items must not move them to another list
+    scaled = vectors * np.random.default_rng(6).uniform(0.2, 5.0, size=(len(vectors), 1))
+    index = IVFIndex(scaled, n_lists=20, n_probe=3)
+    np.testing.assert_allclose(np.linalg.norm(index.centroids, axis=1), 1.0)
+    lists = np.repeat(np.arange(index.n_lists), np.diff(index.list_offsets))
+    cosine = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)) @ index.centroids.T
+    np.testing.assert_array_equal(lists, np.argmax(cosine[index.list_items], axis=1))
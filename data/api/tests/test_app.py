@@ -0,0 +1,47 @@
+import importlib
+import sys
+
+import joblib
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+from test_scoring import small_scorer
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    # app.py loads model.pkl from the working directory at import time
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('MODEL_STORE', raising=False)
+    monkeypatch.setenv('MODEL_ARTIFACT', str(tmp_path / 'no-artifact'))
+    joblib.dump(small_scorer(), tmp_path / 'model.pkl')
+    sys.modules.pop('app', None)
+    module = importlib.import_module('app')
+    yield module
+    sys.modules.pop('app', None)
+
+
+@pytest.fixture
+def client(app_module):
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize('n', [0, -1, 10_000])
+def test_recommend_rejects_n_out_of_range(client, n):
+    assert client.get(f'/recommend/buyer?n={n}').status_code == 422
+    assert client.post('/recommend/batch', json={'user_ids': ['buyer'], 'n': n}).status_code == 422
+    assert client.get(f'/popular?n={n}').status_code == 422
+    assert client.get(f'/similar/v0?n={n}').status_code == 422
+
+
+def test_recommend_accepts_n_in_range(client):
+    response = client.get('/recommend/buyer?n=3')
+    assert response.status_code == 200
+    assert len(response.json()['recommendations']) == 3
+    response = client.post('/recommend/batch', json={'user_ids': ['buyer', 'nobody'], 'n': 2})
+    assert response.status_code == 200
+    assert [len(result['recommendations']) for result in response.json()['results']] == [2, 2]
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingScore:
+    # score() that answers every user with (user, params, context) and records its calls
+    def __init__(self, fail_for=None):
+        self.calls = []
+        self.fail_for = fail_for
+
+    def __call__(self, user_ids, params, contexts):
+        self.calls.append((list(user_ids), params))
+        if params == self.fail_for:
+            raise ValueError('scoring failed')
+        return [(user_id, params, context) for user_id, context in zip(user_ids, contexts)]
+
+
+async def submit_all(batcher, requests):
+    return await asyncio.gather(*(batcher.submit(*request) for request in requests))
+
+
+def test_concurrent_requests_share_one_scoring_call():
+    score = RecordingScore()
+    batcher = MicroBatcher(score, max_batch_size=64, max_wait_ms=50)
+    results = asyncio.run(submit_all(batcher, [(f'u{i}', 'p', i) for i in range(5)]))
+    # every request gets its own result back
+    assert results == [(f'u{i}', 'p', i) for i in range(5)]
+    assert score.calls == [([f'u{i}' for i in range(5)], 'p')]
+    assert batcher.stats()['batches'] == 1 and batcher.stats()['largest_batch'] == 5
+
+
+def test_batches_close_at_max_batch_size():
+    score = RecordingScore()
+    batcher = MicroBatcher(score, max_batch_size=2, max_wait_ms=50)
+    asyncio.run(submit_all(batcher, [(f'u{i}', 'p', None) for i in range(5)]))
+    assert [len(user_ids) for user_ids, _ in score.calls] == [2, 2, 1]
+    assert batcher.stats()['mean_batch_size'] == pytest.approx(5 / 3)
+
+
+def test_requests_with_different_params_are_scored_separately():
+    score = RecordingScore()
+    batcher = MicroBatcher(score, max_wait_ms=50)
+    results = asyncio.run(submit_all(batcher, [('a', 'p', None), ('b', 'q', None), ('c', 'p', None)]))
+    assert [result[:2] for result in results] == [('a', 'p'), ('b', 'q'), ('c', 'p')]
+    assert sorted(score.calls) == [(['a', 'c'], 'p'), (['b'], 'q')]
+
+
+def test_a_lone_request_is_sent_after_max_wait():
+    score = RecordingScore()
+    batcher = MicroBatcher(score, max_wait_ms=1)
+
+    async def two_apart():
+        first = await batcher.submit('a', 'p')
+        await asyncio.sleep(0.02)
+        return first, await batcher.submit('b', 'p')
+
+    asyncio.run(two_apart())
+    assert score.calls == [(['a'], 'p'), (['b'], 'p')]
+
+
+def test_a_failed_group_fails_only_its_own_requests():
+    batcher = MicroBatcher(RecordingScore(fail_for='bad'), max_wait_ms=50)
+
+    async def mixed():
+        return await asyncio.gather(batcher.submit('a', 'bad'), batcher.submit('b', 'good'),
+                                    return_exceptions=True)
+
+    failed, ok = asyncio.run(mixed())
+    assert isinstance(failed, ValueError)
+    assert ok == ('b', 'good', None)
+
+
+def test_batcher_restarts_on_a_new_event_loop():
+    batcher = MicroBatcher(RecordingScore(), max_wait_ms=1)
+    assert asyncio.run(batcher.submit('a', 'p')) == ('a', 'p', None)
+    assert asyncio.run(batcher.submit('b', 'p')) == ('b', 'p', None)
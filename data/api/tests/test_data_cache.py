@@ -0,0 +1,95 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from data_cache import MODEL_COLUMNS, cache_is_fresh, load_data
+
+TABLES = {
+    'categories.csv': pd.DataFrame({'category_id': ['c-men', 'c-sale', 'c-unused'],
+                                    'name': ['Men', 'Sale', 'Unused']}),
+    'products.csv': pd.DataFrame({'product_id': ['p1', 'p2', 'p3'], 'name': ['Shirt', 'Jeans', 'Hat'],
+                                  'description': ['A shirt', 'Blue jeans', 'Uncategorised hat']}),
+    'product_categories.csv': pd.DataFrame({'product_id': ['p1', 'p1', 'p2'],
+                                            'category_id': ['c-men', 'c-sale', 'c-men']}),
+    'variants.csv': pd.DataFrame({'variant_id': ['v-b', 'v-a', 'v-c', 'v-hat'],
+                                  'product_id': ['p1', 'p1', 'p2', 'p3'],
+                                  'size': ['M', 'L', '32', 'S'], 'color': ['red', 'red', 'blue', 'black'],
+                                  'price': [20.0, 22.0, 50.0, 9.0], 'stock': [3, 0, 7, 1]}),
+    'orders.csv': pd.DataFrame({'order_id': ['o1', 'o2'], 'user_id': ['u1', 'u2'],
+                                'status': ['delivered', 'pending'],
+                                'created_at': ['2024-05-01 10:00:00', '2024-05-03 12:00:00']}),
+    'order_items.csv': pd.DataFrame({'order_id': ['o1', 'o1', 'o2', 'o2'],
+                                     'variant_id': ['v-a', 'v-c', 'v-b', 'v-hat'],
+                                     'quantity': [1, 2, 1, 4], 'price_at_purchase': [22.0, 45.0, 20.0, 9.0]}),
+    'cart_events.csv': pd.DataFrame({'user_id': ['u3', 'u1'], 'variant_id': ['v-c', 'v-b'], 'quantity': [1, 1],
+                                     'created_at': ['2024-05-02 09:00:00', '2024-05-04 08:00:00']}),
+}
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    path = tmp_path / 'csv'
+    path.mkdir()
+    for name, frame in TABLES.items():
+        frame.to_csv(path / name, index=False)
+    return str(path)
+
+
+def plain(frame):
+    # categoricals back to plain values, rows in a comparable order
+    frame = frame.apply(lambda column: column.astype(object) if column.dtype == 'category' else column)
+    return frame.sort_values(list(frame.columns[:2])).reset_index(drop=True)
+
+
+def test_load_data_matches_the_csv_merges(csv_dir, tmp_path):
+    product_variants, user_purchases, user_carts = load_data(csv_dir, str(tmp_path / 'cache'))
+
+    # one row per categorised variant, ordered by variant_id; the hat has no category
+    assert list(product_variants['variant_id'].astype(str)) == ['v-a', 'v-b', 'v-c']
+    assert list(product_variants.columns) == MODEL_COLUMNS['product_variants']
+    assert [sorted(ids) for ids in product_variants['category_id']] == [['c-men', 'c-sale']] * 2 + [['c-men']]
+    assert sorted(product_variants['category_name'][0]) == ['Men', 'Sale']
+
+    assert plain(user_purchases[['user_id', 'variant_id', 'quantity', 'price', 'created_at']]).to_dict('list') == {
+        'user_id': ['u1', 'u1', 'u2'],
+        'variant_id': ['v-a', 'v-c', 'v-b'],
+        'quantity': [1, 2, 1],
+        'price': [22.0, 50.0, 20.0],
+        'created_at': list(pd.to_datetime(['2024-05-01 10:00', '2024-05-01 10:00', '2024-05-03 12:00'])),
+    }
+    assert plain(user_carts[['user_id', 'variant_id', 'color']]).to_dict('list') == {
+        'user_id': ['u1', 'u3'], 'variant_id': ['v-b', 'v-c'], 'color': ['red', 'blue'],
+    }
+    # id columns come back as categoricals that only keep the ids each table uses
+    assert user_carts['user_id'].dtype == 'category'
+    assert sorted(user_carts['user_id'].cat.categories) == ['u1', 'u3']
+
+
+def test_load_data_reads_only_the_requested_columns(csv_dir, tmp_path):
+    product_variants, user_purchases, _ = load_data(
+        csv_dir, str(tmp_path / 'cache'),
+        columns={'product_variants': ['category_name', 'price'], 'user_purchases': ['status']},
+    )
+    assert list(product_variants.columns) == ['category_name', 'price']
+    assert list(user_purchases.columns) == ['status']
+
+
+def test_cache_is_rebuilt_when_a_source_file_changes(csv_dir, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    assert not cache_is_fresh(csv_dir, cache_dir)
+    load_data(csv_dir, cache_dir)
+    assert cache_is_fresh(csv_dir, cache_dir)
+
+    manifest = os.path.join(cache_dir, 'manifest.json')
+    built_at = os.stat(manifest).st_mtime_ns
+    load_data(csv_dir, cache_dir)
+    assert os.stat(manifest).st_mtime_ns == built_at
+
+    with open(os.path.join(csv_dir, 'cart_events.csv'), 'a') as f:
+        f.write('u4,v-a,1,2024-05-05 10:00:00\n')
+    assert not cache_is_fresh(csv_dir, cache_dir)
+    _, _, user_carts = load_data(csv_dir, cache_dir)
+    assert 'u4' in set(user_carts['user_id'].astype(str))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+import features
+from features import CompactFeatures
+
+
+def blocks(n_items=300, n_text=24, seed=0):
+    rng = np.random.default_rng(seed)
+    categorical = np.zeros((n_items, 9))
+    categorical[np.arange(n_items), rng.integers(0, 4, n_items)] = 1.0
+    categorical[np.arange(n_items), 4 + rng.integers(0, 5, n_items)] = 1.0
+    numeric = rng.random((n_items, 1))
+    text = rng.normal(size=(n_items, n_text))
+    return categorical, numeric, text
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # several item blocks even for a small catalog
+    monkeypatch.setattr(features, 'BLOCK_ROWS', 64)
+
+
+def test_float32_similarities_match_dense_baseline():
+    categorical, numeric, text = blocks()
+    matrix = CompactFeatures.from_blocks(csr_matrix(categorical), numeric, text, 'float32')
+    dense = np.hstack([categorical, numeric, text])
+    queries = np.random.default_rng(1).normal(size=(5, dense.shape[1]))
+    np.testing.assert_allclose(matrix.similarities(queries), queries @ dense.T, rtol=1e-4, atol=1e-4)
+
+
+def test_int8_similarities_match_their_dense_rows():
+    categorical, numeric, text = blocks()
+    matrix = CompactFeatures.from_blocks(csr_matrix(categorical), numeric, text)
+    assert matrix.text.dtype == np.int8
+    queries = np.random.default_rng(2).normal(size=(5, matrix.shape[1]))
+    np.testing.assert_allclose(matrix.similarities(queries), queries @ matrix.toarray().T, rtol=1e-4, atol=1e-3)
+
+
+def test_int8_quantisation_stays_close_to_float():
+    categorical, numeric, text = blocks()
+    quantised = CompactFeatures.from_blocks(csr_matrix(categorical), numeric, text)
+    dense = np.hstack([categorical, numeric, text])
+    queries = np.random.default_rng(3).normal(size=(5, dense.shape[1]))
+    exact = queries @ dense.T
+    error = np.abs(quantised.similarities(queries) - exact)
+    assert error.max() < 0.02 * np.abs(exact).max()
+
+
+def test_similarities_of_row_subset():
+    categorical, numeric, text = blocks()
+    matrix = CompactFeatures.from_blocks(csr_matrix(categorical), numeric, text, 'float32')
+    rows = np.array([3, 70, 150, 299])
+    query = np.random.default_rng(4).normal(size=matrix.shape[1])
+    np.testing.assert_allclose(matrix[rows].similarities(query), matrix.similarities(query)[:, rows], rtol=1e-5)
+
+
+def test_state_round_trip():
+    categorical, numeric, text = blocks()
+    matrix = CompactFeatures.from_blocks(csr_matrix(categorical), numeric, text)
+    params, arrays = matrix.get_state()
+    loaded = CompactFeatures.from_state(params, arrays)
+    np.testing.assert_array_equal(loaded.toarray(), matrix.toarray())
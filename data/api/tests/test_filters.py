@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filters import AttributeIndex
+from test_scoring import NOW, small_scorer
+
+PRODUCTS = pd.DataFrame({
+    'size': ['S', 'M', 'M', 'L', 'S', 'XL'],
+    'color': ['Red', 'red', 'Blue', 'blue', 'green', 'red'],
+    'stock': [1, 0, 3, 0, 2, 5],
+    'category_id': [['c-men'], ['c-men', 'c-sale'], ['c-women'], [], ['c-women', 'c-sale'], None],
+    'category_name': [['Men'], ['Men', 'Sale'], ['Women'], [], ['Women', 'Sale'], None],
+})
+
+
+def rows(mask):
+    return np.flatnonzero(mask).tolist()
+
+
+def test_mask_ors_within_a_field_and_ands_across_fields():
+    index = AttributeIndex.from_products(PRODUCTS)
+    assert index.mask() is None
+    assert rows(index.mask(size='M')) == [1, 2]
+    assert rows(index.mask(size=['S', 'XL'])) == [0, 4, 5]
+    assert rows(index.mask(size=['S', 'M'], color='red')) == [0, 1]
+    assert rows(index.mask(color='red', in_stock=True)) == [0, 5]
+    assert rows(index.mask(in_stock=True)) == [0, 2, 4, 5]
+
+
+def test_values_are_case_insensitive_and_categories_match_id_or_name():
+    index = AttributeIndex.from_products(PRODUCTS)
+    assert rows(index.mask(color=' RED ')) == [0, 1, 5]
+    assert rows(index.mask(category='Sale')) == rows(index.mask(category='c-sale')) == [1, 4]
+    assert rows(index.mask(category=['men', 'c-women'])) == [0, 1, 2, 4]
+
+
+def test_unknown_values_match_nothing():
+    index = AttributeIndex.from_products(PRODUCTS)
+    assert not index.mask(size='XXL').any()
+    assert not index.mask(size='M', color='purple').any()
+    assert rows(index.mask(size=['M', 'XXL'])) == [1, 2]
+
+
+def test_products_without_attribute_columns():
+    index = AttributeIndex.from_products(pd.DataFrame(index=range(3)))
+    assert index.mask() is None
+    assert rows(index.mask(size='M')) == []
+    assert len(index.mask(size='M')) == 3
+
+
+def test_state_round_trip_keeps_masks():
+    # more than one byte of bits per key
+    index = AttributeIndex.from_products(pd.concat([PRODUCTS] * 3, ignore_index=True))
+    loaded = AttributeIndex.from_state(*index.get_state())
+    for filters in [{'size': 'M'}, {'category': 'sale', 'in_stock': True}, {'color': ['blue', 'green']}]:
+        np.testing.assert_array_equal(loaded.mask(**filters), index.mask(**filters))
+    assert len(loaded.mask(size='S')) == 18
+
+
+def test_scorer_only_recommends_matching_variants():
+    scorer = small_scorer()
+    with pytest.raises(ValueError):
+        scorer.recommend('buyer', n=3, now=NOW, filters={'size': 'M'})
+
+    scorer.attributes = AttributeIndex.from_products(PRODUCTS)
+    for user_id in ['buyer', 'browser', 'nobody']:
+        picked = scorer.recommend(user_id, n=6, now=NOW, filters={'color': 'red'})
+        assert picked and set(picked) <= {'v0', 'v1', 'v5'}
+    assert scorer.recommend('buyer', n=6, now=NOW, filters={'size': 'XXL'}) == []
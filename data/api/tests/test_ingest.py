@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from profiles import CART, PURCHASE
+from test_scoring import NOW, small_scorer
+
+
+def weighted_least_squares(item_factors, quantities_by_item, regularization, alpha):
+    # The ALS user objective written out over every item: confidence 1 + (c - 1)
+    # where c = alpha * quantity for bought items, preference 1 for them and 0 else
+    confidence = np.ones(len(item_factors))
+    preference = np.zeros(len(item_factors))
+    for item, quantity in quantities_by_item.items():
+        confidence[item] = alpha * quantity
+        preference[item] = 1.0
+    weighted = item_factors.T * confidence
+    a = weighted @ item_factors + regularization * np.eye(item_factors.shape[1])
+    return np.linalg.solve(a, weighted @ preference)
+
+
+def test_solve_als_user_matches_the_dense_objective():
+    scorer = small_scorer()
+    scorer.als_regularization, scorer.als_alpha = 0.1, 2.0
+    solved = scorer._solve_als_user(np.array([1, 4]), np.array([1.0, 3.0]))
+    expected = weighted_least_squares(scorer.als_item_factors, {1: 1.0, 4: 3.0}, 0.1, 2.0)
+    np.testing.assert_allclose(solved, expected)
+
+
+def test_solve_als_user_matches_implicit_recalculate_user():
+    implicit_als = pytest.importorskip('implicit.cpu.als')
+    scorer = small_scorer()
+    scorer.als_regularization, scorer.als_alpha = 0.1, 2.0
+    model = implicit_als.AlternatingLeastSquares(factors=3, regularization=0.1, alpha=2.0)
+    model.item_factors = scorer.als_item_factors.astype(np.float32)
+    model.user_factors = scorer.als_user_factors.astype(np.float32)
+    user_items = csr_matrix(([1.0, 3.0], ([0, 0], [1, 4])), shape=(1, 6))
+    expected = model.recalculate_user(0, user_items)
+    solved = scorer._solve_als_user(np.array([1, 4]), np.array([1.0, 3.0]))
+    np.testing.assert_allclose(solved, np.ravel(expected), rtol=1e-3, atol=1e-4)
+
+
+def test_ingest_purchase_refits_a_known_user_with_their_history():
+    scorer = small_scorer()
+    assert scorer.ingest('buyer', ['v3', 'v3', 'unknown'], PURCHASE, [1, 2, 5], created_at=NOW) == 2
+    update = scorer.user_updates['buyer']
+    # the bought v0 and v1 from liked_items plus three units of v3
+    np.testing.assert_array_equal(update['items'], [0, 1, 3])
+    np.testing.assert_array_equal(update['quantities'], [1.0, 1.0, 3.0])
+    np.testing.assert_allclose(update['als_factors'],
+                               scorer._solve_als_user(np.array([0, 1, 3]), np.array([1.0, 1.0, 3.0])))
+    assert list(scorer.interaction_index.pending['buyer'][0]) == [3, 3]
+
+    # a second purchase adds to the refitted history instead of liked_items
+    scorer.ingest('buyer', ['v2'], PURCHASE, created_at=NOW)
+    np.testing.assert_array_equal(scorer.user_updates['buyer']['items'], [0, 1, 2, 3])
+
+
+def test_ingest_warms_up_a_new_user():
+    scorer = small_scorer()
+    before = scorer.popularity.weights.copy()
+    scorer.ingest('newcomer', ['v2'], CART, created_at=NOW)
+    # carts change the profile and popularity but don't refit ALS
+    assert 'newcomer' not in scorer.user_updates
+    assert scorer.popularity.weights[2] > before[2]
+    assert not scorer._cold_users(['newcomer'], [None])[0]
+
+    scorer.ingest('newcomer', ['v4'], PURCHASE, created_at=NOW)
+    np.testing.assert_array_equal(scorer.user_updates['newcomer']['items'], [4])
+    recs = scorer.recommend('newcomer', n=3, now=NOW)
+    # the new ALS factors are used and the bought item is not recommended back
+    assert len(recs) == 3 and 'v4' not in recs
+
+
+def test_ingest_without_known_variants_changes_nothing():
+    scorer = small_scorer()
+    assert scorer.ingest('buyer', ['unknown']) == 0
+    assert scorer.interaction_index.pending == {}
+    assert scorer.user_updates == {}
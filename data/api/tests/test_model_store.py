@@ -0,0 +1,170 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from model_store import (CURRENT_LINK, FOLDED_LOG_NAME, VERSIONS_DIR, ModelHandle, append_event, carry_events,
+                         checkpoint, current_version, event_log_path, ingest_record, publish_artifact, read_events)
+from test_scoring import NOW, small_scorer
+
+
+def small_model():
+    # what export_artifact reads from a trained HybridRecommender
+    encoder = SimpleNamespace(feature_names_in_=np.array(['color']), categories_=[np.array(['red', 'blue'])])
+    scaler = SimpleNamespace(min_=np.zeros(1), scale_=np.ones(1))
+    return SimpleNamespace(scorer=small_scorer(), content_model=SimpleNamespace(encoder=encoder, scaler=scaler))
+
+
+def event(user_id, variant_ids, kind=0, created_at=NOW):
+    return {'op': 'event', 'user_id': user_id, 'variant_ids': variant_ids, 'kind': kind,
+            'quantities': [1] * len(variant_ids), 'created_at': created_at.isoformat()}
+
+
+def apply_record(scorer, record):
+    # app.apply_update without the result cache
+    if record['op'] == 'event':
+        ingest_record(scorer, record)
+    if scorer.topk is not None:
+        scorer.topk.mark_stale(record['user_id'])
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = str(tmp_path / 'store')
+    publish_artifact(small_model(), root, topk_size=3)
+    return root
+
+
+def handle(root, **kwargs):
+    return ModelHandle(root, check_interval=kwargs.pop('check_interval', 0.0), on_event=apply_record,
+                       event_interval=0.0, **kwargs)
+
+
+def test_append_event_reaches_every_handle_once(root):
+    first, second = handle(root), handle(root)
+    first.append_event(event('newcomer', ['v2', 'v3']))
+    # applied on the appending worker before append_event returns
+    assert list(first.scorer.interaction_index.pending['newcomer'][0]) == [2, 3]
+    assert second.sync_events() == 1
+    assert list(second.scorer.interaction_index.pending['newcomer'][0]) == [2, 3]
+    assert second.sync_events() == 0
+
+    # a record logged twice, e.g. across a publish, is applied once
+    log = event_log_path(root, current_version(root))
+    with open(log, 'rb') as f:
+        duplicate = f.read()
+    with open(log, 'ab') as f:
+        f.write(duplicate)
+    assert second.sync_events() == 0
+
+
+def test_refresh_replays_the_new_versions_log_before_swapping(root):
+    swaps = []
+    worker = handle(root, on_swap=lambda scorer, version: swaps.append((scorer, version)))
+    worker.append_event(event('buyer', ['v3']))
+    assert worker.scorer.topk.lookup('buyer', 3) is None
+
+    version = publish_artifact(small_model(), root, topk_size=3)
+    assert worker.get() is swaps[-1][0] and worker.version == version
+    # the event is newer than the published training data, so it carried over
+    assert list(worker.scorer.interaction_index.pending['buyer'][0]) == [3]
+    assert 'buyer' in worker.scorer.topk.stale
+
+
+def test_publish_drops_events_already_in_the_training_data(root):
+    worker = handle(root)
+    worker.append_event(event('buyer', ['v3'], created_at=NOW.replace(year=2020)))
+    version = publish_artifact(small_model(), root)
+    assert read_events(event_log_path(root, version)) == ([], 0)
+
+
+def test_get_without_wait_refreshes_in_the_background(root):
+    worker = handle(root, check_interval=0.01)
+    old_scorer = worker.scorer
+    version = publish_artifact(small_model(), root)
+    # the scorer in use comes back right away; the load happens on another thread
+    assert worker.get(wait=False) is old_scorer
+    for _ in range(500):
+        if worker.version == version:
+            break
+        time.sleep(0.01)
+    assert worker.version == version and worker.get(wait=False) is not old_scorer
+
+
+def test_carry_events_filters_by_op_time_and_offsets(tmp_path):
+    source, target = str(tmp_path / 'source.jsonl'), str(tmp_path / 'target.jsonl')
+    records = [
+        {**event('a', ['v1'], created_at=NOW.replace(year=2020)), 'id': '1'},
+        {**event('b', ['v2']), 'id': '2'},
+        {'op': 'invalidate', 'user_id': 'c', 'id': '3'},
+    ]
+    with open(source, 'w') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in records) + '{"partial')
+    since = int(np.datetime64(NOW.replace(year=2021), 's').astype(np.int64))
+    offset = carry_events(source, target, since)
+    assert [record['id'] for record in read_events(target)[0]] == ['2']
+    # the incomplete last line is left for later
+    assert offset == os.path.getsize(source) - len('{"partial')
+    _, first_line_end = read_events(source, end=len(json.dumps(records[0])) + 1)
+    carry_events(source, target, offset=first_line_end, ops=None)
+    assert [record['id'] for record in read_events(target)[0]] == ['2', '2', '3']
+
+
+def test_checkpoint_folds_the_log_into_a_new_version(root):
+    worker = handle(root)
+    for record in [event('buyer', ['v3']), event('newcomer', ['v4']), event('newcomer', ['v2'], kind=1)]:
+        worker.append_event(record)
+    append_event(root, {'op': 'invalidate', 'user_id': 'visitor'})
+    expected = {user_id: worker.scorer.recommend(user_id, n=3, now=NOW) for user_id in ['buyer', 'newcomer']}
+    previous = worker.version
+
+    version = checkpoint(root)
+    assert current_version(root) == version != previous
+    # the new log only holds one invalidation per user; the events moved to the folded log
+    records, _ = read_events(event_log_path(root, version))
+    assert [(record['op'], record['user_id']) for record in records] == [
+        ('invalidate', 'buyer'), ('invalidate', 'newcomer'), ('invalidate', 'visitor')]
+    folded, _ = read_events(os.path.join(root, VERSIONS_DIR, version, FOLDED_LOG_NAME))
+    assert [record['user_id'] for record in folded] == ['buyer', 'newcomer', 'newcomer']
+    # top-k and neighbour files are shared with the previous version, not copied
+    topk = os.path.join(root, VERSIONS_DIR, version, 'topk')
+    assert os.path.islink(topk)
+    assert os.stat(os.path.join(topk, 'indices.npy')).st_nlink >= 2
+
+    fresh = handle(root)
+    scorer = fresh.scorer
+    assert scorer.interaction_index.pending == {} and scorer.user_updates == {}
+    assert 'newcomer' in scorer.collab_user_index
+    assert {user_id: scorer.recommend(user_id, n=3, now=NOW) for user_id in expected} == expected
+    assert scorer.topk.stale == {'buyer', 'newcomer', 'visitor'}
+
+    # a worker on the old version picks the new one up without applying anything twice
+    assert worker.get() is not None and worker.version == version
+    assert worker.scorer.interaction_index.pending == {}
+    assert os.path.realpath(os.path.join(root, CURRENT_LINK)).endswith(version)
+
+
+def test_checkpoint_of_an_empty_log_is_a_no_op(root):
+    assert checkpoint(root) is None
+
+
+def test_large_log_is_checkpointed_by_the_appending_worker(root):
+    worker = handle(root, max_log_bytes=1)
+    previous = worker.version
+    worker.append_event(event('buyer', ['v3']))
+    worker._background['checkpoint'].join()
+    assert worker.version != previous
+    assert read_events(event_log_path(root, worker.version))[0][0]['op'] == 'invalidate'
+
+
+def test_publish_carries_events_folded_by_a_checkpoint(root):
+    worker = handle(root)
+    worker.append_event(event('buyer', ['v3']))
+    checkpoint(root)
+    version = publish_artifact(small_model(), root)
+    records, _ = read_events(event_log_path(root, version))
+    assert [(record['op'], record['user_id'], record['variant_ids']) for record in records] == [
+        ('event', 'buyer', ['v3'])]
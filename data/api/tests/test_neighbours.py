@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from features import CompactFeatures
+from neighbours import NeighbourTable
+
+K = 8
+
+
+def make_scorer(catalog, content, products, collab_ids, factors):
+    # The parts of a HybridScorer NeighbourTable.build reads. catalog: variant ids in
+    # row order; content / products: per variant id; collab_ids: variant id of each
+    # ALS item row
+    rows = np.array([content[v] for v in catalog])
+    positions = {v: row for row, v in enumerate(catalog)}
+    return SimpleNamespace(
+        variant_ids=np.array(catalog, dtype=object),
+        feature_matrix=CompactFeatures.from_blocks(csr_matrix((len(catalog), 0)), rows[:, :1], rows[:, 1:]),
+        item_products=np.array([products[v] for v in catalog]),
+        als_item_factors=factors,
+        collab_to_content=np.array([positions.get(v, -1) for v in collab_ids], dtype=np.int64),
+    )
+
+
+@pytest.fixture
+def catalog():
+    rng = np.random.default_rng(0)
+    ids = [f'v{i}' for i in range(120)]
+    content = {v: rng.normal(size=12) for v in ids}
+    products = {v: i // 3 for i, v in enumerate(ids)}
+    collab_ids = ids[:100]  # the last 20 variants were never bought
+    factors = rng.normal(size=(len(collab_ids), 6)).astype(np.float32)
+    return ids, content, products, collab_ids, factors
+
+
+def changed_catalog(ids, content, products):
+    # two variants removed, two edited, ten added, rows reordered
+    rng = np.random.default_rng(1)
+    content = dict(content)
+    products = dict(products)
+    for v in ('v10', 'v77'):
+        content[v] = rng.normal(size=12)
+    added = [f'n{i}' for i in range(10)]
+    for i, v in enumerate(added):
+        content[v] = rng.normal(size=12)
+        products[v] = 1000 + i // 2
+    kept = [v for v in ids if v not in ('v5', 'v40')]
+    new_ids = list(np.array(kept + added, dtype=object)[rng.permutation(len(kept) + len(added))])
+    return new_ids, content, products
+
+
+def assert_same_lists(table, other):
+    np.testing.assert_array_equal(table.variant_ids, other.variant_ids)
+    np.testing.assert_array_equal(table.indices, other.indices)
+    np.testing.assert_allclose(table.scores, other.scores, rtol=1e-5)
+
+
+def test_incremental_build_matches_full_rebuild(catalog):
+    ids, content, products, collab_ids, factors = catalog
+    previous = NeighbourTable.build(make_scorer(ids, content, products, collab_ids, factors), K)
+
+    new_ids, new_content, new_products = changed_catalog(ids, content, products)
+    scorer = make_scorer(new_ids, new_content, new_products, collab_ids, factors)
+    incremental = NeighbourTable.build(scorer, K, previous=previous)
+    full = NeighbourTable.build(scorer, K)
+
+    assert_same_lists(incremental, full)
+    assert incremental.build_stats['reused'] > 0
+    assert incremental.build_stats['recomputed'] < len(new_ids)
+
+
+def test_unchanged_catalog_reuses_every_list(catalog):
+    ids, content, products, collab_ids, factors = catalog
+    scorer = make_scorer(ids, content, products, collab_ids, factors)
+    previous = NeighbourTable.build(scorer, K)
+    again = NeighbourTable.build(scorer, K, previous=previous)
+    assert again.build_stats == {'variants': len(ids), 'recomputed': 0, 'reused': len(ids)}
+    assert_same_lists(again, previous)
+
+
+def test_new_als_factors_mean_a_full_rebuild(catalog):
+    ids, content, products, collab_ids, factors = catalog
+    previous = NeighbourTable.build(make_scorer(ids, content, products, collab_ids, factors), K)
+    retrained = make_scorer(ids, content, products, collab_ids, factors[::-1].copy())
+    table = NeighbourTable.build(retrained, K, previous=previous)
+    assert table.build_stats['reused'] == 0
+    assert_same_lists(table, NeighbourTable.build(retrained, K))
+
+
+def test_similar_skips_same_product_and_unknown_variants(catalog):
+    ids, content, products, collab_ids, factors = catalog
+    table = NeighbourTable.build(make_scorer(ids, content, products, collab_ids, factors), K)
+    similar = table.similar('v0', 5)
+    assert len(similar) == 5
+    assert not {'v0', 'v1', 'v2'} & set(similar)
+    assert table.similar('missing') is None
+
+
+def test_save_and_open_round_trip(catalog, tmp_path):
+    ids, content, products, collab_ids, factors = catalog
+    scorer = make_scorer(ids, content, products, collab_ids, factors)
+    table = NeighbourTable.build(scorer, K)
+    for _ in range(2):
+        table.save(str(tmp_path / 'neighbours'))
+    opened = NeighbourTable.open(str(tmp_path))
+    assert_same_lists(opened, table)
+    assert opened.collab_fingerprint == table.collab_fingerprint
+    # the opened table is a valid previous table for the next build
+    assert NeighbourTable.build(scorer, K, previous=opened).build_stats['reused'] == len(ids)
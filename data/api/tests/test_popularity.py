@@ -0,0 +1,68 @@
+import numpy as np
+
+from popularity import KIND_WEIGHTS, REBASE_EXPONENT, SECONDS_PER_DAY, PopularityIndex
+from profiles import CART, PURCHASE
+
+DAY = int(SECONDS_PER_DAY)
+T0 = 1_700_000_000
+
+
+def expected_weights(n_items, events, anchor, half_life_days):
+    weights = np.zeros(n_items)
+    for item, timestamp, kind in events:
+        weights[item] += KIND_WEIGHTS[kind] * 2.0 ** ((timestamp - anchor) / (half_life_days * DAY))
+    return weights
+
+
+def add_all(index, events):
+    for item, timestamp, kind in events:
+        index.add([item], [timestamp], [kind])
+
+
+def test_add_decays_against_the_anchor():
+    index = PopularityIndex(4, half_life_days=7)
+    events = [(0, T0, PURCHASE), (1, T0 + 7 * DAY, PURCHASE), (2, T0 + 7 * DAY, CART)]
+    add_all(index, events)
+    assert index.anchor == T0
+    np.testing.assert_allclose(index.weights, expected_weights(4, events, T0, 7))
+    # one half life apart: the later purchase counts twice as much
+    assert index.weights[1] == 2 * index.weights[0]
+
+
+def test_add_rebases_when_exponents_grow_large():
+    half_life_days = 1.0
+    events = [(0, T0, PURCHASE), (1, T0 + DAY, CART)]
+    late = T0 + int((REBASE_EXPONENT + 2) * DAY)
+    index = PopularityIndex(3, half_life_days=half_life_days)
+    add_all(index, events)
+    index.add([2, 1], [late, late], [PURCHASE, PURCHASE])
+
+    assert index.anchor == late
+    all_events = events + [(2, late, PURCHASE), (1, late, PURCHASE)]
+    np.testing.assert_allclose(index.weights, expected_weights(3, all_events, late, half_life_days), rtol=1e-12)
+    assert np.isfinite(index.weights).all()
+
+
+def test_rebase_keeps_the_ranking_of_an_index_without_rebase():
+    rng = np.random.default_rng(0)
+    n_items = 20
+    times = np.sort(rng.integers(T0, T0 + 200 * DAY, 300))
+    events = list(zip(rng.integers(0, n_items, 300), times, rng.choice([PURCHASE, CART], 300)))
+    rebased = PopularityIndex(n_items, half_life_days=2.0)
+    add_all(rebased, events)
+    assert rebased.anchor > T0
+
+    reference = expected_weights(n_items, events, rebased.anchor, 2.0)
+    np.testing.assert_allclose(rebased.weights, reference, rtol=1e-9)
+    top, scores = rebased.top(5)
+    np.testing.assert_array_equal(top, np.argsort(-reference, kind='stable')[:5])
+
+
+def test_top_leaves_out_items_without_events_and_applies_allowed():
+    index = PopularityIndex(5)
+    index.add([3, 3, 1], [T0, T0, T0], [PURCHASE, PURCHASE, CART])
+    top, scores = index.top(5)
+    np.testing.assert_array_equal(top, [3, 1])
+    allowed = np.array([True, True, True, False, True])
+    top, _ = index.top(5, allowed=allowed)
+    np.testing.assert_array_equal(top, [1])
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from profiles import (BASE_WEIGHTS, CART, DECAY_DAYS, PURCHASE, SECONDS_PER_DAY, UserInteractionIndex,
+                      to_epoch_seconds)
+
+NOW = datetime(2024, 6, 1)
+VARIANT_TO_INDEX = {f'v{i}': i for i in range(5)}
+
+
+def build_index():
+    purchases = pd.DataFrame({'user_id': ['a', 'b', 'a'], 'variant_id': ['v0', 'v1', 'v2'],
+                              'created_at': pd.to_datetime(['2024-05-31', '2024-05-25', '2024-05-18'])})
+    carts = pd.DataFrame({'user_id': ['b', 'a', 'c'], 'variant_id': ['v3', 'unknown', 'v4'],
+                          'created_at': pd.to_datetime(['2024-05-30', '2024-05-30', '2024-05-29'])})
+    return UserInteractionIndex(purchases, carts, VARIANT_TO_INDEX)
+
+
+def interactions(index, user_id):
+    # (item, timestamp, kind) of one user, in a comparable order
+    _, items, timestamps, kinds = index.gather([user_id])
+    return sorted(zip(items.tolist(), timestamps.tolist(), kinds.tolist()))
+
+
+def test_groups_interactions_per_user_and_drops_unknown_variants():
+    index = build_index()
+    assert len(index) == 5
+    assert [item for item, _, _ in interactions(index, 'a')] == [0, 2]
+    assert interactions(index, 'b') == [
+        (1, to_epoch_seconds(np.array(['2024-05-25'], dtype='datetime64[s]'))[0], PURCHASE),
+        (3, to_epoch_seconds(np.array(['2024-05-30'], dtype='datetime64[s]'))[0], CART),
+    ]
+    assert interactions(index, 'nobody') == []
+
+
+def test_weight_matrix_decays_by_kind_and_normalises_rows():
+    index = build_index()
+    weights = index.weight_matrix(['b', 'nobody'], 5, NOW).toarray()
+    expected = np.zeros(5)
+    expected[1] = BASE_WEIGHTS[PURCHASE] * np.exp(-7 / DECAY_DAYS[PURCHASE])
+    expected[3] = BASE_WEIGHTS[CART] * np.exp(-2 / DECAY_DAYS[CART])
+    np.testing.assert_allclose(weights[0], expected / expected.sum())
+    np.testing.assert_array_equal(weights[1], np.zeros(5))
+
+
+def test_profiles_match_a_dense_weighted_sum():
+    index = build_index()
+    features = np.random.default_rng(0).normal(size=(5, 3))
+    users = ['a', 'b', 'c', 'nobody']
+    np.testing.assert_allclose(index.profiles(users, features, NOW),
+                               index.weight_matrix(users, 5, NOW).toarray() @ features)
+
+
+def test_appended_interactions_are_pending_until_compacted():
+    index = build_index()
+    seconds = SECONDS_PER_DAY * 19875
+    index.append('a', [4], [seconds], [CART])
+    index.append('d', [1, 2], [seconds, seconds], [PURCHASE, CART])
+    index.append('a', [3], [seconds], [PURCHASE])
+
+    assert set(index.pending) == {'a', 'd'}
+    assert len(index) == 9
+    assert [item for item, _, _ in interactions(index, 'a')] == [0, 2, 3, 4]
+    assert 'd' not in index.user_positions
+    before = {user_id: interactions(index, user_id) for user_id in ['a', 'b', 'c', 'd']}
+    weights = index.weight_matrix(['a', 'd'], 5, NOW).toarray()
+
+    index.compact()
+    assert index.pending == {}
+    assert len(index) == 9
+    assert 'd' in index.user_positions
+    assert {user_id: interactions(index, user_id) for user_id in before} == before
+    np.testing.assert_allclose(index.weight_matrix(['a', 'd'], 5, NOW).toarray(), weights)
+    # every user's rows stay one contiguous slice
+    assert np.all(np.diff(index.offsets) >= 0) and index.offsets[-1] == len(index.items)
+
+
+def test_compact_without_pending_rows_is_a_no_op():
+    index = build_index()
+    items = index.items
+    index.compact()
+    assert index.items is items
@@ -0,0 +1,82 @@
+from result_cache import RecommendationCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+PARAMS = (10, (), ())
+
+
+def test_invalidate_user_drops_only_that_users_entries():
+    cache = RecommendationCache()
+    cache.put('a', PARAMS, ['x'])
+    cache.put('a', (5, (), ()), ['y'])
+    cache.put('b', PARAMS, ['z'])
+    assert cache.invalidate_user('a') == 2
+    assert cache.get('a', PARAMS) is None
+    assert cache.get('a', (5, (), ())) is None
+    assert cache.get('b', PARAMS) == ['z']
+    assert cache.stats()['invalidations'] == 2
+    assert cache.invalidate_user('a') == 0
+
+
+def test_put_is_skipped_after_invalidation_during_compute():
+    cache = RecommendationCache()
+    generation = cache.generation('a')
+    cache.invalidate_user('a')  # an event arrives while the list is computed
+    cache.put('a', PARAMS, ['stale'], generation)
+    assert cache.get('a', PARAMS) is None
+
+    cache.put('a', PARAMS, ['fresh'], cache.generation('a'))
+    assert cache.get('a', PARAMS) == ['fresh']
+
+
+def test_other_users_generation_is_unaffected():
+    cache = RecommendationCache()
+    generation = cache.generation('a')
+    cache.invalidate_user('b')
+    cache.put('a', PARAMS, ['x'], generation)
+    assert cache.get('a', PARAMS) == ['x']
+
+
+def test_clear_invalidates_lists_in_flight():
+    cache = RecommendationCache()
+    cache.put('a', PARAMS, ['x'])
+    generation = cache.generation('b')
+    cache.clear()
+    assert cache.get('a', PARAMS) is None
+    cache.put('b', PARAMS, ['old model'], generation)
+    assert cache.get('b', PARAMS) is None
+
+
+def test_get_or_compute_does_not_cache_across_invalidation():
+    cache = RecommendationCache()
+
+    def compute():
+        cache.invalidate_user('a')
+        return ['computed']
+
+    assert cache.get_or_compute('a', PARAMS, compute) == ['computed']
+    assert cache.get('a', PARAMS) is None
+    assert cache.get_or_compute('a', PARAMS, lambda: ['again']) == ['again']
+    assert cache.get('a', PARAMS) == ['again']
+
+
+def test_entries_expire_and_evict():
+    clock = FakeClock()
+    cache = RecommendationCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.put('a', PARAMS, ['a'])
+    cache.put('b', PARAMS, ['b'])
+    cache.put('c', PARAMS, ['c'])
+    assert cache.get('a', PARAMS) is None
+    assert cache.stats()['evictions'] == 1
+    clock.now = 11
+    assert cache.get('b', PARAMS) is None
+    assert cache.stats()['expirations'] == 1
+    # expired and evicted entries no longer count for their user
+    assert cache.invalidate_user('b') == 0
@@ -0,0 +1,177 @@
+import inspect
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from ann import ExactIndex
+from profiles import CART, PURCHASE, UserInteractionIndex, to_epoch_seconds
+from scoring import HybridScorer, mmr_rerank, score_fusion, top_n
+from session import SessionIndex
+from topk_store import DEFAULT_PARAMS
+
+NOW = datetime(2024, 6, 1)
+VARIANTS = [f'v{i}' for i in range(6)]
+
+
+class RecordingIndex(ExactIndex):
+    # ExactIndex that remembers the query batches it was asked
+    def __init__(self, vectors):
+        super().__init__(vectors)
+        self.queries = []
+
+    def search(self, queries, n, allowed=None):
+        self.queries.append(queries)
+        return super().search(queries, n, allowed)
+
+
+def small_scorer():
+    # Six variants of six products. 'buyer' bought v0 and v1 and is the only user
+    # the collaborative models know; 'browser' only has carts, which make v5 the
+    # most popular item. A session at v2 leads to v3, then v4.
+    rng = np.random.default_rng(0)
+    features = np.eye(6)[:, :4] + 0.1
+    timestamp = to_epoch_seconds(np.array([NOW], dtype='datetime64[s]'))[0] - 86400
+    interactions = UserInteractionIndex.from_arrays(
+        ['buyer', 'browser'], np.array([0, 2, 8]),
+        np.array([0, 1, 5, 5, 5, 5, 5, 4], dtype=np.int32), np.full(8, timestamp),
+        np.array([PURCHASE] * 2 + [CART] * 6, dtype=np.int8),
+    )
+    carts = pd.DataFrame({'user_id': ['browser'] * 3, 'variant_id': ['v2', 'v3', 'v4'],
+                          'created_at': pd.to_datetime(['2024-05-01 10:00', '2024-05-01 10:05',
+                                                        '2024-05-01 10:10'])})
+    return HybridScorer(
+        variant_ids=VARIANTS, feature_matrix=features, content_index=RecordingIndex(features),
+        interaction_index=interactions, collab_user_ids=['buyer'], collab_to_content=np.arange(6),
+        liked_items=csr_matrix(([1.0, 1.0], ([0, 0], [0, 1])), shape=(1, 6)),
+        als_user_factors=rng.normal(size=(1, 3)), als_item_factors=rng.normal(size=(6, 3)),
+        lfm_user_embeddings=rng.normal(size=(1, 3)), lfm_user_biases=np.zeros(1),
+        lfm_item_embeddings=rng.normal(size=(6, 3)), lfm_item_biases=np.zeros(6),
+        item_prices=np.ones(6), item_products=np.arange(6), item_categories=np.eye(6)[:, :2],
+        session_index=SessionIndex(carts, {v: i for i, v in enumerate(VARIANTS)}),
+    )
+
+
+def test_top_n_matches_full_sort():
+    rng = np.random.default_rng(0)
+    scores = rng.normal(size=(5, 40))
+    idx, top_scores = top_n(scores, 7)
+    expected = np.argsort(-scores, axis=1, kind='stable')[:, :7]
+    np.testing.assert_array_equal(idx, expected)
+    np.testing.assert_array_equal(top_scores, np.take_along_axis(scores, expected, axis=1))
+
+
+def test_top_n_clamps_n_and_handles_zero():
+    scores = np.array([[0.1, 0.5, 0.3]])
+    idx, top_scores = top_n(scores, 10)
+    np.testing.assert_array_equal(idx, [[1, 2, 0]])
+    np.testing.assert_array_equal(top_scores, [[0.5, 0.3, 0.1]])
+    idx, top_scores = top_n(scores, 0)
+    assert idx.shape == (1, 0) and idx.dtype == np.int64
+    assert top_scores.shape == (1, 0)
+
+
+def test_top_n_accepts_one_row():
+    idx, _ = top_n(np.array([3.0, 1.0, 2.0]), 2)
+    np.testing.assert_array_equal(idx, [[0, 2]])
+
+
+def test_score_fusion_normalises_each_component_per_user():
+    # user 0: component scores 1..3 map to 0, 0.5, 1; user 1 has one padded slot
+    idx = np.array([[0, 1, 2], [3, 1, -1]])
+    scores = np.array([[1.0, 2.0, 3.0], [10.0, 0.0, np.nan]])
+    fused = score_fusion([(2.0, idx, scores)], n_users=2, n_items=4)
+    np.testing.assert_allclose(fused, [[0.0, 1.0, 2.0, 0.0], [0.0, 0.0, 0.0, 2.0]])
+
+
+def test_score_fusion_sums_weighted_components():
+    first = (0.5, np.array([[0, 1]]), np.array([[1.0, 0.0]]))
+    second = (1.0, np.array([[1, 2]]), np.array([[4.0, 2.0]]))
+    fused = score_fusion([first, second], n_users=1, n_items=3)
+    np.testing.assert_allclose(fused, [[0.5, 1.0, 0.0]])
+
+
+def test_score_fusion_flat_component_adds_nothing():
+    # a row whose candidates all score the same can't rank them; another user's
+    # row of the same component still counts
+    idx = np.array([[2, 0], [1, 2]])
+    scores = np.array([[5.0, 5.0], [1.0, 3.0]])
+    fused = score_fusion([(0.3, idx, scores)], n_users=2, n_items=3)
+    np.testing.assert_allclose(fused, [[0.0, 0.0, 0.0], [0.0, 0.0, 0.3]])
+
+
+def test_score_fusion_skips_zero_weight_and_empty_components():
+    empty = (1.0, np.empty((1, 0), dtype=np.int64), np.empty((1, 0)))
+    zero = (0.0, np.array([[0]]), np.array([[1.0]]))
+    np.testing.assert_array_equal(score_fusion([empty, zero], 1, 2), np.zeros((1, 2)))
+
+
+def test_mmr_rerank_without_penalty_orders_by_relevance():
+    candidates = np.array([[4, 2, 7, 1]])
+    relevance = np.array([[0.2, 0.9, 0.5, -np.inf]])
+    products = np.arange(8)
+    categories = np.zeros((8, 1))
+    picked, scores = mmr_rerank(candidates, relevance, 4, 0.0, products, categories)
+    np.testing.assert_array_equal(picked, [[2, 7, 4, -1]])
+    np.testing.assert_array_equal(scores, [[0.9, 0.5, 0.2, -np.inf]])
+
+
+def test_mmr_rerank_penalty_demotes_same_product():
+    # items 0 and 1 are variants of one product; 2 is another product
+    candidates = np.array([[0, 1, 2]])
+    relevance = np.array([[1.0, 0.95, 0.8]])
+    products = np.array([0, 0, 1])
+    categories = np.zeros((3, 1))
+    plain, _ = mmr_rerank(candidates, relevance, 3, 0.0, products, categories)
+    diverse, diverse_scores = mmr_rerank(candidates, relevance, 3, 0.5, products, categories)
+    np.testing.assert_array_equal(plain, [[0, 1, 2]])
+    np.testing.assert_array_equal(diverse, [[0, 2, 1]])
+    # reported scores stay the original relevance
+    np.testing.assert_array_equal(diverse_scores, [[1.0, 0.8, 0.95]])
+
+
+def test_mmr_rerank_rows_are_independent():
+    candidates = np.array([[0, 1, 2], [2, 1, 0]])
+    relevance = np.array([[1.0, 0.95, 0.8], [0.1, 0.2, 0.3]])
+    products = np.array([0, 0, 1])
+    categories = np.zeros((3, 1))
+    picked, _ = mmr_rerank(candidates, relevance, 2, 0.5, products, categories)
+    np.testing.assert_array_equal(picked[0], [0, 2])
+    np.testing.assert_array_equal(picked[1], [0, 2])
+
+
+def test_session_only_visitor_gets_session_and_popular_items():
+    scorer = small_scorer()
+    recs = scorer.recommend('visitor', session_history=['v2'], diversity_penalty=0.0,
+                            price_tier_penalty=0.0, n=6, now=NOW)
+    # trending items with the content weight, then the session's next item; v4 is
+    # the least popular item and the weaker transition, so it gets no votes
+    assert recs[0] == 'v5' and set(recs[1:3]) == {'v0', 'v1'} and recs[3:] == ['v3']
+    # no content search ran with the visitor's empty profile
+    assert all(len(queries) == 0 for queries in scorer.content_index.queries)
+
+
+def test_content_search_only_runs_for_users_with_a_profile():
+    scorer = small_scorer()
+    scorer.rank_batch(['buyer', 'visitor'], sessions=[None, ['v2']], n=3, now=NOW)
+    assert [len(queries) for queries in scorer.content_index.queries] == [1]
+
+
+def test_popularity_weight_adds_to_the_fused_scores():
+    scorer = small_scorer()
+    params = dict(diversity_penalty=0.0, price_tier_penalty=0.0, n=6, now=NOW)
+    without, without_scores = scorer.rank_batch(['buyer'], popularity_weight=0.0, **params)
+    picked, scores = scorer.rank_batch(['buyer'], popularity_weight=0.05, **params)
+    before = dict(zip(without[0], np.where(np.isfinite(without_scores[0]), without_scores[0], 0.0)))
+    after = dict(zip(picked[0], scores[0]))
+    # v5 is the most popular item and gets the full popularity weight
+    assert after[5] == pytest.approx(before.get(5, 0.0) + 0.05)
+
+
+def test_default_fusion_params_match_the_topk_store():
+    # top-k lists only serve requests whose params equal the ones they were built with
+    defaults = inspect.signature(HybridScorer.rank_batch).parameters
+    assert DEFAULT_PARAMS == {name: defaults[name].default for name in DEFAULT_PARAMS}
+    assert DEFAULT_PARAMS['popularity_weight'] > 0
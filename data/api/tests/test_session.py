@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from session import BACKWARD_WEIGHT, HISTORY_DECAY, MAX_HISTORY, SessionIndex
+
+VARIANT_TO_INDEX = {name: i for i, name in enumerate('abcdefg')}
+
+
+def carts(*sessions):
+    # one user per session of (variant, minutes after the first event)
+    rows = [(f'user{user}', variant, pd.Timestamp('2024-05-01') + pd.Timedelta(minutes=minutes))
+            for user, session in enumerate(sessions) for variant, minutes in session]
+    return pd.DataFrame(rows, columns=['user_id', 'variant_id', 'created_at'])
+
+
+def weights(index, row):
+    start, end = index.indptr[row], index.indptr[row + 1]
+    return dict(zip(index.indices[start:end].tolist(), index.data[start:end].tolist()))
+
+
+def test_transitions_weight_steps_and_direction():
+    index = SessionIndex(carts([('a', 0), ('b', 5), ('c', 10)]), VARIANT_TO_INDEX)
+    assert len(index) == len(VARIANT_TO_INDEX)
+    # from a: b one step ahead, c two steps ahead at about half the weight
+    # (minutes apart, so time decay barely matters)
+    assert weights(index, 0) == pytest.approx({1: 1.0, 2: 0.5}, rel=1e-3)
+    # from c: only backward transitions, b one step and a two steps back
+    assert weights(index, 2) == pytest.approx({1: 1.0, 0: 0.5}, rel=1e-3)
+    # b: forward to c, backward to a; rows are scaled to a maximum of 1
+    assert weights(index, 1) == pytest.approx({2: 1.0, 0: BACKWARD_WEIGHT}, rel=1e-3)
+
+
+def test_transitions_decay_with_the_gap_and_stay_within_a_user():
+    week = 7 * 24 * 60
+    index = SessionIndex(carts([('a', 0), ('b', 1)], [('a', 0), ('c', week)], [('d', 0), ('unknown', 1)]),
+                         VARIANT_TO_INDEX)
+    # a -> c a transition half life later counts half as much as a -> b
+    assert weights(index, 0) == pytest.approx({1: 1.0, 2: 0.5}, rel=1e-3)
+    assert weights(index, 3) == {}
+
+
+def test_search_ranks_by_decayed_history_and_skips_seen_items():
+    index = SessionIndex(carts([('a', 0), ('b', 5)], [('c', 0), ('d', 5)]), VARIANT_TO_INDEX)
+    idx, scores = index.search([[0, 2], [2], []], 3)
+    # the most recent item counts fully, the one before it HISTORY_DECAY times
+    np.testing.assert_array_equal(idx, [[3, 1, -1], [3, -1, -1], [-1, -1, -1]])
+    np.testing.assert_allclose(scores[0, :2], [1.0, HISTORY_DECAY])
+    assert np.isneginf(scores[0, 2]) and np.isneginf(scores[2]).all()
+
+    # items already in the session are not recommended back
+    idx, _ = index.search([[0, 1]], 3)
+    assert not set(idx[0]) & {0, 1}
+
+
+def test_search_respects_allowed_and_history_length():
+    index = SessionIndex(carts([('a', 0), ('b', 5), ('c', 10)]), VARIANT_TO_INDEX)
+    allowed = np.ones(len(VARIANT_TO_INDEX), dtype=bool)
+    allowed[1] = False
+    idx, _ = index.search([[0]], 2, allowed)
+    np.testing.assert_array_equal(idx, [[2, -1]])
+    # only the last MAX_HISTORY items of a session are scored
+    idx, _ = index.search([[0] + [6] * MAX_HISTORY], 2)
+    np.testing.assert_array_equal(idx, [[-1, -1]])
+
+
+def test_rows_keep_their_strongest_transitions():
+    transitions = pd.DataFrame({'user_id': 'u', 'variant_id': list('abcde')})
+    transitions['created_at'] = pd.Timestamp('2024-05-01') + pd.to_timedelta(np.arange(5), unit='min')
+    full = SessionIndex(transitions, VARIANT_TO_INDEX)
+    matrix = csr_matrix((full.data, full.indices, full.indptr), shape=(len(full), len(full)))
+    indptr, indices, data = SessionIndex._prune(matrix, 2)
+    pruned = SessionIndex.from_arrays(indptr, indices, data)
+    assert all(len(weights(pruned, row)) <= 2 for row in range(len(pruned)))
+    # what survives are each row's two largest entries
+    for row in range(len(full)):
+        kept = sorted(weights(full, row).values(), reverse=True)[:2]
+        assert sorted(weights(pruned, row).values(), reverse=True) == pytest.approx(kept)
+
+
+def test_state_round_trip_keeps_results():
+    index = SessionIndex(carts([('a', 0), ('b', 5), ('c', 10)], [('b', 0), ('d', 1)]), VARIANT_TO_INDEX)
+    loaded = SessionIndex.from_arrays(**index.get_state())
+    histories = [[0], [1], [3, 2]]
+    for expected, actual in zip(index.search(histories, 4), loaded.search(histories, 4)):
+        np.testing.assert_array_equal(actual, expected)
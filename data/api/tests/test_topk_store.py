@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+
+from test_scoring import NOW, VARIANTS, small_scorer
+from topk_store import DEFAULT_PARAMS, TOPK_DIR, TopKStore, materialize
+from versioned_dir import new_version, prune_versions, publish_version, versions_dir
+
+
+def test_materialized_lists_match_live_scoring(tmp_path):
+    scorer = small_scorer()
+    path = str(tmp_path / TOPK_DIR)
+    manifest = materialize(scorer, path, k=4, now=NOW)
+    assert manifest['users'] == 1 and manifest['params'] == DEFAULT_PARAMS
+
+    store = TopKStore.open(str(tmp_path), scorer.variant_ids)
+    assert store.lookup('buyer', 4) == scorer.recommend('buyer', n=4, now=NOW)
+    assert store.lookup('buyer', 2) == store.lookup('buyer', 4)[:2]
+    assert store.lookup('nobody', 4) is None
+    assert (store.hits, store.misses) == (3, 1)
+
+
+def test_stale_users_and_other_params_are_scored_live(tmp_path):
+    scorer = small_scorer()
+    materialize(scorer, str(tmp_path / TOPK_DIR), k=4, now=NOW)
+    store = TopKStore.open(str(tmp_path), scorer.variant_ids)
+
+    assert store.serves(4, DEFAULT_PARAMS)
+    assert not store.serves(5, DEFAULT_PARAMS)
+    assert not store.serves(4, {**DEFAULT_PARAMS, 'als_weight': 0.9})
+    assert not store.serves(4, DEFAULT_PARAMS, session=['v1'])
+
+    store.mark_stale('buyer')
+    assert store.lookup('buyer', 4) is None
+    assert store.stats()['stale_users'] == 1
+
+
+def test_open_without_lists_returns_none(tmp_path):
+    assert TopKStore.open(str(tmp_path), np.asarray(VARIANTS)) is None
+
+
+def test_rebuild_swaps_the_link_and_keeps_old_files_readable(tmp_path):
+    scorer = small_scorer()
+    path = str(tmp_path / TOPK_DIR)
+    materialize(scorer, path, k=4, now=NOW)
+    first = TopKStore.open(str(tmp_path), scorer.variant_ids)
+    before = first.lookup('buyer', 4)
+
+    materialize(scorer, path, k=3, now=NOW)
+    assert os.path.islink(path)
+    second = TopKStore.open(str(tmp_path), scorer.variant_ids)
+    assert second.k == 3
+    # a reader that opened the previous build keeps reading it
+    assert first.lookup('buyer', 4) == before
+
+
+def test_publish_version_prunes_all_but_the_live_and_newest(tmp_path):
+    path = str(tmp_path / 'lists')
+    targets = []
+    for i in range(4):
+        target = new_version(path)
+        with open(os.path.join(target, 'data'), 'w') as f:
+            f.write(str(i))
+        publish_version(path, target, keep=2)
+        targets.append(target)
+        with open(os.path.join(path, 'data')) as f:
+            assert f.read() == str(i)
+
+    assert sorted(os.listdir(versions_dir(path))) == [os.path.basename(t) for t in targets[-2:]]
+    assert os.path.realpath(path) == os.path.realpath(targets[-1])
+    # the link is relative, so the artifact can be moved as a whole
+    assert not os.path.isabs(os.readlink(path))
+    moved = str(tmp_path.parent / f'{tmp_path.name}-moved')
+    os.rename(str(tmp_path), moved)
+    with open(os.path.join(moved, 'lists', 'data')) as f:
+        assert f.read() == '3'
+
+
+def test_publish_version_replaces_a_legacy_directory(tmp_path):
+    path = str(tmp_path / 'lists')
+    os.makedirs(path)
+    with open(os.path.join(path, 'data'), 'w') as f:
+        f.write('old')
+    target = new_version(path)
+    publish_version(path, target)
+    assert os.path.islink(path) and os.listdir(path) == []
+
+
+def test_prune_versions_never_removes_the_live_version(tmp_path):
+    path = str(tmp_path / 'lists')
+    live = new_version(path)
+    publish_version(path, live)
+    newer = new_version(path)
+    prune_versions(path, keep=0)
+    assert os.path.isdir(live) and not os.path.exists(newer)
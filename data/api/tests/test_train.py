@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from train import precision_at_k
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(os.path.dirname(API_DIR), 'scripts')
+
+
+def test_precision_at_k_counts_hits_and_is_json_serialisable():
+    # item 0 scores highest for both users; user 0 bought it 5 times
+    model = SimpleNamespace(
+        user_embeddings=np.ones((2, 1), dtype=np.float32),
+        item_embeddings=np.array([[3.0], [2.0], [1.0]], dtype=np.float32),
+        user_biases=np.zeros(2, dtype=np.float32),
+        item_biases=np.zeros(3, dtype=np.float32),
+    )
+    train = csr_matrix((2, 3), dtype=np.float32)
+    validation = csr_matrix(np.array([[5.0, 0.0, 0.0], [0.0, 0.0, 3.0]], dtype=np.float32))
+    score = precision_at_k(model, train, validation, k=1)
+    assert type(score) is float
+    assert score == 0.5
+    json.dumps({'score': score})
+
+
+def test_train_entry_point_end_to_end(tmp_path):
+    # python train.py on a small mock dataset must finish and print its JSON report
+    for module in ('implicit', 'lightfm', 'sentence_transformers', 'threadpoolctl'):
+        pytest.importorskip(module)
+    sys.path.insert(0, SCRIPTS_DIR)
+    try:
+        from mock_data import generate
+    finally:
+        sys.path.remove(SCRIPTS_DIR)
+    generate(str(tmp_path / 'csv'), n_users=60, n_products=20)
+
+    result = subprocess.run(
+        [sys.executable, os.path.join(API_DIR, 'train.py'), '--csv-dir', 'csv', '--workers', '1',
+         '--max-epochs', '2', '--topk', '3', '--neighbours', '5'],
+        cwd=tmp_path, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout[result.stdout.index('{'):])
+    assert report['lightfm']['best_epoch'] >= 1
+    assert (tmp_path / 'model.pkl').exists()
+    assert (tmp_path / 'artifact' / 'manifest.json').exists()
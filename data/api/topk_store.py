@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from scoring import candidate_pool
+from versioned_dir import new_version, publish_version
+
+# Precomputed recommendations for every user the collaborative models know,
+# stored next to the serving arrays of an artifact:
+#
+#   <artifact>/topk/indices.npy   (users, k) int32 catalog rows, -1 padded
+#   <artifact>/topk/scores.npy    (users, k) float32 fused scores
+#   <artifact>/topk/user_ids.npy  row -> user id
+#   <artifact>/topk/manifest.json k, fusion params, build time
+#
+# where topk is a link to the latest build (see versioned_dir.py).
+#
+# Lists are computed with one fixed set of fusion params and only change on
+# retrain, so the API answers those requests with one hash lookup and a slice of
+# the memory-mapped arrays. Users with events since the build, unknown users and
+# requests with other params or a live session are scored live. The first n of a
+# stored list equal a live top n only when both draw from the same candidate
+# pool (scoring.candidate_pool), which with the defaults holds for n <= 10.
+TOPK_DIR = 'topk'
+TOPK_SIZE = 10
+MANIFEST_NAME = 'manifest.json'
+MATERIALIZE_CHUNK = 4096
+
+DEFAULT_PARAMS = {'content_weight': 0.4, 'als_weight': 0.3, 'lfm_weight': 0.15, 'session_weight': 0.1,
+                  'popularity_weight': 0.05, 'diversity_penalty': 0.3, 'price_tier_penalty': 0.5}
+
+
+def materialize(scorer, path, k=TOPK_SIZE, params=None, now=None, chunk=MATERIALIZE_CHUNK):
+    # Scores every user in the scorer's collaborative user index in chunks and
+    # streams the lists into memory-mapped files; returns the manifest. The files
+    # are written to a new version that `path` links to at the end, so workers
+    # still mapping the old lists are unaffected.
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    user_ids = np.asarray(scorer.collab_user_index).astype(str)
+    staged = new_version(path)
+    indices = np.lib.format.open_memmap(os.path.join(staged, 'indices.npy'), mode='w+',
+                                        dtype=np.int32, shape=(len(user_ids), k))
+    scores = np.lib.format.open_memmap(os.path.join(staged, 'scores.npy'), mode='w+',
+                                       dtype=np.float32, shape=(len(user_ids), k))
+
+    start = time.perf_counter()
+    for offset in range(0, len(user_ids), chunk):
+        end = offset + chunk
+        picked, picked_scores = scorer.rank_batch(list(user_ids[offset:end]), n=k, now=now, **params)
+        indices[offset:end] = picked
+        scores[offset:end] = picked_scores
+    indices.flush()
+    scores.flush()
+    del indices, scores
+    np.save(os.path.join(staged, 'user_ids.npy'), user_ids)
+
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'k': k,
+        'params': params,
+        'users': len(user_ids),
+        'build_seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(staged, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    publish_version(path, staged)
+    return manifest
+
+
+class TopKStore:
+    def __init__(self, path, variant_ids, mmap_mode='r'):
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            self.manifest = json.load(f)
+        self.k = self.manifest['k']
+        self.params = self.manifest['params']
+        self.created_at = datetime.fromisoformat(self.manifest['created_at'])
+        self.indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode=mmap_mode)
+        self.scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode=mmap_mode)
+        self.user_index = pd.Index(np.load(os.path.join(path, 'user_ids.npy')))
+        self.variant_ids = variant_ids
+
+        # users with events after the build; their stored lists are out of date
+        self.stale = set()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, artifact_path, variant_ids, mmap_mode='r'):
+        # None when the artifact was exported without top-k lists
+        path = os.path.realpath(os.path.join(artifact_path, TOPK_DIR))
+        if not os.path.exists(os.path.join(path, MANIFEST_NAME)):
+            return None
+        return cls(path, variant_ids, mmap_mode)
+
+    def serves(self, n, params, session=None):
+        n_items = len(self.variant_ids)
+        return (session is None and n <= self.k
+                and candidate_pool(n, n_items) == candidate_pool(self.k, n_items)
+                and all(self.params.get(name) == value for name, value in params.items()))
+
+    def lookup(self, user_id, n):
+        # First n stored variant ids, or None when the user has to be scored live
+        try:
+            if user_id in self.stale:
+                raise KeyError(user_id)
+            row = self.user_index.get_loc(user_id)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        items = self.indices[row, :n]
+        return self.variant_ids[items[items >= 0]].tolist()
+
+    def mark_stale(self, user_id):
+        self.stale.add(user_id)
+
+    def age_seconds(self):
+        return (datetime.now() - self.created_at).total_seconds()
+
+    def stats(self):
+        return {
+            'created_at': self.manifest['created_at'],
+            'age_seconds': self.age_seconds(),
+            'users': len(self.user_index),
+            'k': self.k,
+            'params': self.params,
+            'stale_users': len(self.stale),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Usage: python topk_store.py [artifact_dir] [--k 10]
+# (re)builds the lists of an exported artifact; train.py and model_store.py
+# can write them as part of the export instead
+if __name__ == "__main__":
+    from artifact import load_artifact
+
+    parser = argparse.ArgumentParser(description='Precompute top-k recommendations for all known users')
+    parser.add_argument('artifact', nargs='?', default='artifact')
+    parser.add_argument('--k', type=int, default=TOPK_SIZE)
+    args = parser.parse_args()
+
+    manifest = materialize(load_artifact(args.artifact), os.path.join(args.artifact, TOPK_DIR), args.k)
+    print(f"Materialized top {manifest['k']} for {manifest['users']} users "
+          f"in {manifest['build_seconds']:.1f}s")
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import joblib
+import numpy as np
+
+from neighbours import NEIGHBOUR_K
+from topk_store import TOPK_SIZE
+
+# Training entry point for the nightly retrain. The three expensive stages don't
+# depend on each other and run in separate processes, each with its share of
+# the machine's cores: description embeddings, ALS and LightFM. LightFM trains
+# epoch by epoch on a random split of the interactions and stops once validation
+# precision@k hasn't improved for `patience` epochs, then (by default) is refit
+# on all interactions for the best epoch count. The similar-variant lists are
+# built last, from scratch: a retrain changes every ALS factor.
+# Writes model.pkl and the serving artifact, and optionally publishes the
+# artifact to a model store.
+#
+# --catalog-only skips training: it loads the existing model.pkl, swaps in the
+# current catalog and interactions (see HybridRecommender.update_catalog) and
+# updates the similar-variant lists incrementally, recomputing only what the
+# catalog change touched.
+#
+# Usage: python train.py [--csv-dir csv] [--model model.pkl] [--artifact artifact] [--store model_store] [--topk 10]
+#                        [--neighbours 20] [--catalog-only]
+
+VALIDATION_FRACTION = 0.1
+VALIDATION_K = 10
+MAX_EPOCHS = 50
+PATIENCE = 3
+
+
+def limit_threads(threads):
+    # BLAS pools (numpy, implicit) and torch (sentence-transformers) default to
+    # every core, which oversubscribes when stages run side by side
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def encode_stage(product_variants, threads):
+    from models import encode_descriptions
+    limit_threads(threads)
+    start = time.perf_counter()
+    return encode_descriptions(product_variants), time.perf_counter() - start
+
+
+def als_stage(interaction_matrix, params, threads):
+    from implicit.als import AlternatingLeastSquares
+    from models import ALS_PARAMS
+    # implicit parallelises itself and asks for single-threaded BLAS
+    limit_threads(1)
+    start = time.perf_counter()
+    model = AlternatingLeastSquares(**{**ALS_PARAMS, **(params or {}), 'num_threads': threads})
+    model.fit(interaction_matrix, show_progress=False)
+    return model, time.perf_counter() - start
+
+
+def split_interactions(matrix, fraction, seed):
+    # Random (train, validation) split of the nonzero entries
+    matrix = matrix.tocoo()
+    held_out = np.random.default_rng(seed).random(matrix.nnz) < fraction
+    parts = []
+    for mask in (~held_out, held_out):
+        part = matrix.copy()
+        part.data = np.where(mask, part.data, 0)
+        part = part.tocsr()
+        part.eliminate_zeros()
+        parts.append(part)
+    return parts
+
+
+def precision_at_k(model, train, validation, k, chunk=1024):
+    # Mean precision@k over users with validation items; training items are
+    # excluded from the ranking like at serving time. The matrices hold summed
+    # quantities, so validation items count once however many units were bought.
+    validation = validation.copy()
+    validation.data = (validation.data > 0).astype(np.float32)
+    users = np.flatnonzero(np.diff(validation.indptr))
+    if not len(users):
+        return 0.0
+    hits = 0
+    for start in range(0, len(users), chunk):
+        rows = users[start:start + chunk]
+        scores = (model.user_embeddings[rows] @ model.item_embeddings.T
+                  + model.user_biases[rows, None] + model.item_biases)
+        seen = train[rows].tocoo()
+        scores[seen.row, seen.col] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        hits += validation[rows][np.arange(len(rows))[:, None], top].sum()
+    # a plain float, so the report stays JSON serialisable
+    return float(hits / (len(users) * k))
+
+
+def lfm_stage(interaction_matrix, params, threads, max_epochs=MAX_EPOCHS, patience=PATIENCE,
+              validation_fraction=VALIDATION_FRACTION, k=VALIDATION_K, refit=True, seed=0):
+    from lightfm import LightFM
+    from models import LFM_PARAMS
+    limit_threads(1)
+    start = time.perf_counter()
+    params = {**LFM_PARAMS, **(params or {}), 'random_state': seed}
+
+    train, validation = split_interactions(interaction_matrix, validation_fraction, seed)
+    model = LightFM(**params)
+    history = []
+    best_epoch, best_score, best_state = 0, -1.0, None
+    for epoch in range(1, max_epochs + 1):
+        model.fit_partial(train, epochs=1, num_threads=threads)
+        score = precision_at_k(model, train, validation, k)
+        history.append(score)
+        if score > best_score:
+            best_epoch, best_score = epoch, score
+            best_state = [a.copy() for a in (model.user_embeddings, model.user_biases,
+                                             model.item_embeddings, model.item_biases)]
+        elif epoch - best_epoch >= patience:
+            break
+
+    if refit:
+        model = LightFM(**params)
+        model.fit(interaction_matrix, epochs=best_epoch, num_threads=threads)
+    else:
+        model.user_embeddings, model.user_biases, model.item_embeddings, model.item_biases = best_state
+    report = {'best_epoch': best_epoch, f'validation_precision_at_{k}': best_score, 'history': history}
+    return model, time.perf_counter() - start, report
+
+
+def thread_shares(total, weights):
+    # Split `total` cores by weight, at least one each
+    return [max(1, int(total * w / sum(weights))) for w in weights]
+
+
+def train(csv_dir=None, workers=3, threads=None, als_params=None, lfm_params=None, max_epochs=MAX_EPOCHS,
+          patience=PATIENCE, refit=True, seed=0, neighbours=NEIGHBOUR_K):
+    from data_cache import CSV_DIR, load_data
+    from models import CollaborativeFiltering, ContentRecommender, HybridRecommender
+
+    timings = {}
+    start = time.perf_counter()
+    products, purchases, carts = load_data(csv_dir or CSV_DIR)
+    timings['load_data'] = time.perf_counter() - start
+
+    collab = CollaborativeFiltering(purchases, als_params, lfm_params, fit=False)
+    threads = threads or os.cpu_count() or 1
+    # encoding and LightFM are the long stages; ALS converges in a few sweeps
+    encode_threads, als_threads, lfm_threads = thread_shares(threads, [2, 1, 2]) if workers > 1 else [threads] * 3
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, 3), mp_context=get_context('spawn')) as pool:
+            encoded = pool.submit(encode_stage, products, encode_threads)
+            als = pool.submit(als_stage, collab.interaction_matrix, als_params, als_threads)
+            lfm = pool.submit(lfm_stage, collab.interaction_matrix, lfm_params, lfm_threads,
+                              max_epochs, patience, refit=refit, seed=seed)
+            (text_embeddings, timings['encode']), (collab.als_model, timings['als']) = encoded.result(), als.result()
+            collab.lfm_model, timings['lightfm'], lfm_report = lfm.result()
+    else:
+        text_embeddings, timings['encode'] = encode_stage(products, encode_threads)
+        collab.als_model, timings['als'] = als_stage(collab.interaction_matrix, als_params, als_threads)
+        collab.lfm_model, timings['lightfm'], lfm_report = lfm_stage(
+            collab.interaction_matrix, lfm_params, lfm_threads, max_epochs, patience, refit=refit, seed=seed)
+
+    assemble_start = time.perf_counter()
+    content = ContentRecommender(products, text_embeddings=text_embeddings)
+    model = HybridRecommender(products, purchases, carts, content_model=content, collab_model=collab)
+    timings['assemble'] = time.perf_counter() - assemble_start
+
+    neighbours_report = None
+    if neighbours:
+        neighbours_start = time.perf_counter()
+        neighbours_report = model.build_neighbours(neighbours).build_stats
+        timings['neighbours'] = time.perf_counter() - neighbours_start
+    timings['total'] = time.perf_counter() - start
+
+    report = {
+        'timings': timings,
+        'threads': {'encode': encode_threads, 'als': als_threads, 'lightfm': lfm_threads},
+        'lightfm': lfm_report,
+        'neighbours': neighbours_report,
+    }
+    return model, report
+
+
+def update_catalog(model, csv_dir=None, neighbours=NEIGHBOUR_K):
+    # Catalog-only refresh of a trained model, no retraining; neighbour lists are
+    # built from scratch when the model has none yet
+    from data_cache import CSV_DIR, load_data
+
+    timings = {}
+    start = time.perf_counter()
+    products, purchases, carts = load_data(csv_dir or CSV_DIR)
+    timings['load_data'] = time.perf_counter() - start
+    model.update_catalog(products, purchases, carts)
+    if neighbours and getattr(model, 'neighbours', None) is None:
+        model.build_neighbours(neighbours)
+    timings['total'] = time.perf_counter() - start
+    table = getattr(model, 'neighbours', None)
+    return model, {'timings': timings, 'neighbours': table.build_stats if table is not None else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the hybrid recommender and export the serving artifact')
+    parser.add_argument('--csv-dir')
+    parser.add_argument('--model', default='model.pkl')
+    parser.add_argument('--artifact', default='artifact')
+    parser.add_argument('--store', help='also publish the artifact to this model store (see model_store.py)')
+    parser.add_argument('--workers', type=int, default=3, help='1 runs the stages one after another')
+    parser.add_argument('--threads', type=int, help='cores to use in total (default: all)')
+    parser.add_argument('--max-epochs', type=int, default=MAX_EPOCHS)
+    parser.add_argument('--patience', type=int, default=PATIENCE)
+    parser.add_argument('--no-refit', action='store_true',
+                        help='keep the early-stopped LightFM fit on the training split')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--topk', type=int, default=TOPK_SIZE,
+                        help='recommendations to precompute per known user, 0 to skip (see topk_store.py)')
+    parser.add_argument('--neighbours', type=int, default=NEIGHBOUR_K,
+                        help='similar variants to precompute per variant, 0 to skip (see neighbours.py)')
+    parser.add_argument('--catalog-only', action='store_true',
+                        help='update the catalog of the existing --model without retraining')
+    args = parser.parse_args()
+
+    if args.catalog_only:
+        model, report = update_catalog(joblib.load(args.model), args.csv_dir, args.neighbours)
+    else:
+        model, report = train(args.csv_dir, args.workers, args.threads, max_epochs=args.max_epochs,
+                              patience=args.patience, refit=not args.no_refit, seed=args.seed,
+                              neighbours=args.neighbours)
+
+    from artifact import export_artifact
+    joblib.dump(model, args.model)
+    export_artifact(model, args.artifact, args.topk)
+    if args.store:
+        from model_store import publish_artifact
+        report['published_version'] = publish_artifact(model, args.store, topk_size=args.topk)
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,52 @@
+import os
+import shutil
+from datetime import datetime
+
+# Directories inside an artifact that are rebuilt while workers may be reading
+# them (top-k lists, neighbour lists), swapped like the versions of
+# model_store.py:
+#
+#   <parent>/.<name>/<version>/   one complete build each
+#   <parent>/<name> -> .<name>/<version>
+#
+# A build writes a new version and then repoints the link with a single
+# rename, so `<parent>/<name>` always resolves to a finished directory. The
+# link is relative, so an artifact can still be copied or moved as a whole.
+# Readers should resolve it once (os.path.realpath) and open every file from
+# the resolved directory, so they never mix two versions.
+KEEP_VERSIONS = 2
+
+
+def versions_dir(path):
+    parent, name = os.path.split(os.path.normpath(path))
+    return os.path.join(parent, f'.{name}')
+
+
+def new_version(path):
+    # Empty directory for the next build of `path`
+    version = datetime.now().strftime('%Y%m%dT%H%M%S%f') + f'-{os.getpid()}'
+    target = os.path.join(versions_dir(path), version)
+    os.makedirs(target)
+    return target
+
+
+def publish_version(path, target, keep=KEEP_VERSIONS):
+    # rename over the old link is atomic; a plain os.symlink on `path` is not
+    staged = f'{os.path.normpath(path)}.link-{os.getpid()}'
+    os.symlink(os.path.relpath(target, os.path.dirname(os.path.normpath(path))), staged)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # a plain directory written before versioning is replaced once, not atomically
+        shutil.rmtree(path)
+    os.replace(staged, path)
+    prune_versions(path, keep)
+
+
+def prune_versions(path, keep=KEEP_VERSIONS):
+    # Readers still mapping a removed version keep their pages, since unlinking
+    # a file doesn't invalidate existing mappings
+    root = versions_dir(path)
+    live = os.path.basename(os.path.realpath(path))
+    versions = sorted(os.listdir(root))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != live:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
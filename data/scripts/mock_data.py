@@ -0,0 +1,343 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Seeded mock dataset for the shop database, one CSV per table in the layout of the
+# export in data/api/csv, plus a load.sql that bulk-loads them with psql \copy.
+#   - products come in 2–6 variants and belong to 1–3 categories
+#   - every user has a cart with 1–6 distinct variants and 1–6 cart events over 240 days
+#   - 95% of users place 4–8 orders of 1–4 items over the last 180 days
+#   - 60% of users wishlist 2–6 distinct products
+# All columns are drawn in bulk with NumPy and the per-user tables are streamed
+# out in chunks of users, so memory stays bounded while the output reaches
+# millions of rows. The same seed and chunk size always produce the same files.
+#
+# For a database that is already seeded, --catalog-dir points at an export of it
+# (users.csv, products.csv and variants.csv, plus carts.csv when there is one):
+# activity is then generated for the existing users against the existing
+# catalog, and load.sql leaves out the categories, products, product_categories,
+# variants and users tables, whose unique names and SKUs would clash. Users that
+# already have a cart keep it (one cart per user) and get no cart items.
+#
+# Usage: python mock_data.py [out_dir] [--users N] [--products N] [--seed S]
+#        python mock_data.py [out_dir] --catalog-dir ../api/csv [--seed S]
+#        cd out_dir && psql -d <database> -f load.sql
+
+# Fixed so a given seed always produces the same file contents
+REFERENCE_TIME = np.datetime64('2025-05-01T00:00:00', 's')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+SECONDS_PER_DAY = 86400
+
+CATEGORY_NAMES = ['Men', 'Women', 'Kids', 'Formal', 'Activewear', 'Sleepwear', 'Underwear', 'Socks',
+                  'Outerwear', 'Accessories', 'Workwear', 'Footwear', 'FEATURED', 'NEW ARRIVALS', 'Casual']
+AUDIENCES = ["Men's", "Women's", "Kids'"]
+STYLES = ['Classic', 'Casual', 'Athletic', 'Formal', 'Slim Fit', 'Relaxed', 'Vintage', 'Lightweight',
+          'Premium', 'Everyday', 'Performance', 'Cozy']
+GARMENTS = ['T-Shirt', 'Polo Shirt', 'Hoodie', 'Sweater', 'Jacket', 'Jeans', 'Chinos', 'Shorts',
+            'Dress', 'Skirt', 'Pajama Set', 'Boxer Shorts', 'Socks', 'Sneakers', 'Dress Shoes',
+            'Blazer', 'Leggings', 'Cap']
+MATERIALS = ['100% cotton', 'soft fleece', 'breathable mesh', 'stretch denim', 'merino wool',
+             'moisture-wicking fabric', 'premium leather', 'recycled polyester']
+OCCASIONS = ['everyday wear', 'the gym', 'formal occasions', 'lounging at home', 'weekend outings',
+             'the office', 'outdoor adventures', 'travel']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', 'XXXL']
+COLORS = ['Black', 'Grey', 'White', 'Blue', 'Brown', 'Navy', 'Green', 'Red', 'Khaki', 'Olive']
+STATUSES = ['pending', 'completed', 'cancelled']
+FIRST_NAMES = ['James', 'Mary', 'Oliver', 'Emma', 'Liam', 'Ava', 'Noah', 'Sophia', 'Lucas', 'Mia',
+               'Ethan', 'Chloe', 'Mason', 'Grace', 'Logan', 'Ella', 'Alex', 'Stacy', 'Melinda', 'Catherine']
+LAST_NAMES = ['Smith', 'Johnson', 'Brown', 'Taylor', 'Anderson', 'Thomas', 'Jackson', 'White', 'Harris',
+              'Martin', 'Thompson', 'Garcia', 'Nelson', 'Foley', 'Douglas', 'Henderson']
+
+ORDER_USER_SHARE = 0.95
+ORDERS_PER_USER = (4, 8)
+ITEMS_PER_ORDER = (1, 4)
+CART_EVENTS_PER_USER = (1, 6)
+CART_ITEMS_PER_CART = (1, 6)
+WISHLIST_USER_SHARE = 0.6
+WISHLIST_ITEMS_PER_USER = (2, 6)
+VARIANTS_PER_PRODUCT = (2, 6)
+EXTRA_CATEGORIES = (0, 2)
+
+
+def hex_digits(rng, n, n_bytes):
+    return np.frombuffer(rng.bytes(n_bytes * n).hex().encode(), dtype=np.uint8).reshape(n, 2 * n_bytes)
+
+
+def uuids(rng, n):
+    # Random version-4 UUID strings, built as one (n, 36) byte array
+    digits = hex_digits(rng, n, 16)
+    out = np.full((n, 36), ord('-'), dtype=np.uint8)
+    out[:, 0:8] = digits[:, 0:8]
+    out[:, 9:13] = digits[:, 8:12]
+    out[:, 14:18] = digits[:, 12:16]
+    out[:, 19:23] = digits[:, 16:20]
+    out[:, 24:36] = digits[:, 20:32]
+    out[:, 14] = ord('4')
+    out[:, 19] = np.frombuffer(b'89ab', dtype=np.uint8)[rng.integers(0, 4, n)]
+    return out.view('S36').ravel().astype(str)
+
+
+def timestamps(rng, n, days):
+    return REFERENCE_TIME - rng.integers(0, days * SECONDS_PER_DAY + 1, n).astype('timedelta64[s]')
+
+
+def counts(rng, n, bounds):
+    return rng.integers(bounds[0], bounds[1] + 1, n)
+
+
+def pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def sample_distinct(rng, population, sizes):
+    # sizes[i] distinct values from range(population) for every row i, uniformly and
+    # without replacement, flattened row by row. Each draw picks the r-th value not
+    # taken yet by shifting r past the row's earlier picks in ascending order.
+    k = int(sizes.max()) if len(sizes) else 0
+    chosen = np.empty((len(sizes), k), dtype=np.int64)
+    for j in range(k):
+        r = rng.integers(0, population - j, len(sizes))
+        for taken in np.sort(chosen[:, :j], axis=1).T:
+            r += r >= taken
+        chosen[:, j] = r
+    return chosen[np.arange(k) < sizes[:, None]]
+
+
+def generate_catalog(rng, n_products):
+    categories = pd.DataFrame({'category_id': uuids(rng, len(CATEGORY_NAMES)), 'name': CATEGORY_NAMES})
+
+    audience = rng.integers(0, len(AUDIENCES), n_products)
+    style = pick(rng, STYLES, n_products)
+    garment = pick(rng, GARMENTS, n_products)
+    names = np.asarray(AUDIENCES, dtype=object)[audience] + ' ' + style + ' ' + garment
+    descriptions = (style + ' ' + np.char.lower(garment.astype(str)).astype(object) + ' made from '
+                    + pick(rng, MATERIALS, n_products) + ', designed for ' + pick(rng, OCCASIONS, n_products) + '.')
+    products = pd.DataFrame({
+        'product_id': uuids(rng, n_products),
+        'name': names,
+        'description': descriptions,
+        'created_at': timestamps(rng, n_products, 365),
+        'is_archived': False,
+        'sku': [f'P{i:06d}' for i in range(n_products)],
+    })
+
+    # Audience category (Men/Women/Kids) plus up to two others, without repeats
+    extra = counts(rng, n_products, EXTRA_CATEGORIES)
+    product_rows = np.repeat(np.arange(n_products), extra)
+    offsets = np.repeat(np.cumsum(extra) - extra, extra)
+    first = rng.integers(0, len(CATEGORY_NAMES) - len(AUDIENCES), n_products)
+    step = np.arange(len(product_rows)) - offsets
+    others = len(AUDIENCES) + (first[product_rows] + step) % (len(CATEGORY_NAMES) - len(AUDIENCES))
+    product_categories = pd.DataFrame({
+        'product_id': products['product_id'].to_numpy()[np.concatenate([np.arange(n_products), product_rows])],
+        'category_id': categories['category_id'].to_numpy()[np.concatenate([audience, others])],
+    })
+
+    per_product = counts(rng, n_products, VARIANTS_PER_PRODUCT)
+    variant_products = np.repeat(np.arange(n_products), per_product)
+    size_start = rng.integers(0, len(SIZES) - VARIANTS_PER_PRODUCT[1] + 1, n_products)
+    size_step = np.arange(len(variant_products)) - np.repeat(np.cumsum(per_product) - per_product, per_product)
+    price = np.round(np.exp(rng.uniform(np.log(9), np.log(300), n_products))) - 0.01
+    variants = pd.DataFrame({
+        'variant_id': uuids(rng, len(variant_products)),
+        'product_id': products['product_id'].to_numpy()[variant_products],
+        'size': np.asarray(SIZES)[size_start[variant_products] + size_step],
+        'color': pick(rng, COLORS, len(variant_products)),
+        'price': price[variant_products],
+        'stock': rng.integers(15, 121, len(variant_products)),
+        'sku': [f'V{i:07d}' for i in range(len(variant_products))],
+        'bought_at': np.round(price[variant_products] * 0.65, 2),
+        'min_stock': 10,
+    })
+    return categories, products, product_categories, variants
+
+
+def generate_users(rng, start, size):
+    created_at = timestamps(rng, size, 180)
+    users = pd.DataFrame({
+        'user_id': uuids(rng, size),
+        'email': [f'user{i}@example.com' for i in range(start, start + size)],
+        'password': hex_digits(rng, size, 32).view('S64').ravel().astype(str),
+        'first_name': pick(rng, FIRST_NAMES, size),
+        'last_name': pick(rng, LAST_NAMES, size),
+        'created_at': created_at,
+        'is_email_verified': rng.random(size) < 0.5,
+        'role': 'customer',
+    })
+    carts = pd.DataFrame({'cart_id': uuids(rng, size), 'user_id': users['user_id'], 'created_at': created_at})
+    return users, carts
+
+
+def read_catalog(catalog_dir):
+    # Existing variants, products, users and carts of an export in the layout of data/api/csv
+    def read(name, columns):
+        return pd.read_csv(os.path.join(catalog_dir, f'{name}.csv'), usecols=columns)
+
+    variants = read('variants', ['variant_id', 'price'])
+    products = read('products', ['product_id'])
+    users = read('users', ['user_id', 'created_at'])
+    users['created_at'] = pd.to_datetime(users['created_at'], format='mixed')
+    carts_path = os.path.join(catalog_dir, 'carts.csv')
+    carts = read('carts', ['cart_id', 'user_id']) if os.path.exists(carts_path) else None
+    return variants, products, users, carts
+
+
+def new_carts(rng, users, carts):
+    # Carts for the users that don't have one yet
+    users = users if carts is None else users[~users['user_id'].isin(carts['user_id'])]
+    return pd.DataFrame({'cart_id': uuids(rng, len(users)), 'user_id': users['user_id'].to_numpy(),
+                         'created_at': users['created_at'].to_numpy()})
+
+
+def generate_activity(rng, users, carts, variant_ids, variant_prices, product_ids):
+    # carts: the carts to fill, at most one per user
+    user_ids = users['user_id'].to_numpy()
+    n_users = len(user_ids)
+
+    item_counts = counts(rng, len(carts), CART_ITEMS_PER_CART)
+    n_cart_items = int(item_counts.sum())
+    cart_items = pd.DataFrame({
+        'cart_item_id': uuids(rng, n_cart_items),
+        'cart_id': np.repeat(carts['cart_id'].to_numpy(), item_counts),
+        'variant_id': variant_ids[sample_distinct(rng, len(variant_ids), item_counts)],
+        'quantity': rng.integers(1, 4, n_cart_items),
+    })
+
+    wishing = rng.random(n_users) < WISHLIST_USER_SHARE
+    wish_counts = counts(rng, int(wishing.sum()), WISHLIST_ITEMS_PER_USER)
+    n_wishes = int(wish_counts.sum())
+    wishlist_items = pd.DataFrame({
+        'wishlist_item_id': uuids(rng, n_wishes),
+        'user_id': np.repeat(user_ids[wishing], wish_counts),
+        'product_id': product_ids[sample_distinct(rng, len(product_ids), wish_counts)],
+        'added_at': timestamps(rng, n_wishes, 180),
+    })
+
+    ordering = user_ids[rng.random(n_users) < ORDER_USER_SHARE]
+    order_counts = counts(rng, len(ordering), ORDERS_PER_USER)
+    n_orders = int(order_counts.sum())
+    orders = pd.DataFrame({
+        'order_id': uuids(rng, n_orders),
+        'user_id': np.repeat(ordering, order_counts),
+        'payment_intent_id': np.char.add('pi_', hex_digits(rng, n_orders, 6).view('S12').ravel().astype(str)),
+        'status': pick(rng, STATUSES, n_orders),
+        'created_at': timestamps(rng, n_orders, 180),
+    })
+
+    item_counts = counts(rng, n_orders, ITEMS_PER_ORDER)
+    n_items = int(item_counts.sum())
+    items = rng.integers(0, len(variant_ids), n_items)
+    order_items = pd.DataFrame({
+        'order_item_id': uuids(rng, n_items),
+        'order_id': np.repeat(orders['order_id'].to_numpy(), item_counts),
+        'variant_id': variant_ids[items],
+        'quantity': rng.integers(1, 4, n_items),
+        'price_at_purchase': variant_prices[items],
+    })
+
+    event_counts = counts(rng, n_users, CART_EVENTS_PER_USER)
+    n_events = int(event_counts.sum())
+    cart_events = pd.DataFrame({
+        'event_id': uuids(rng, n_events),
+        'user_id': np.repeat(user_ids, event_counts),
+        'variant_id': variant_ids[rng.integers(0, len(variant_ids), n_events)],
+        'quantity': rng.integers(1, 4, n_events),
+        'created_at': timestamps(rng, n_events, 240),
+    })
+    return cart_items, wishlist_items, orders, order_items, cart_events
+
+
+def write_csv(frame, out_dir, name, append=False):
+    frame.to_csv(os.path.join(out_dir, f'{name}.csv'), mode='a' if append else 'w', header=not append,
+                 index=False, date_format=TIMESTAMP_FORMAT, float_format='%.2f')
+
+
+# (csv file, table) in foreign-key order
+LOAD_ORDER = [
+    ('categories', 'public.categories'),
+    ('products', 'public.products'),
+    ('product_categories', 'public.product_categories'),
+    ('variants', 'public.product_variants'),
+    ('users', 'public.users'),
+    ('carts', 'public.carts'),
+    ('cart_items', 'public.cart_items'),
+    ('wishlist_items', 'public.wishlist_items'),
+    ('orders', 'public.orders'),
+    ('order_items', 'public.order_items'),
+    ('cart_events', 'public.cart_events'),
+]
+
+
+def write_load_script(out_dir, columns, seed):
+    # only the tables that were written, i.e. no catalog or users with --catalog-dir
+    lines = [f'-- Generated by mock_data.py with seed {seed}; run with psql from this directory', 'BEGIN;']
+    for name, table in LOAD_ORDER:
+        if name not in columns:
+            continue
+        lines.append(f"\\copy {table} ({', '.join(columns[name])}) FROM '{name}.csv' WITH (FORMAT csv, HEADER true)")
+    lines.append('COMMIT;')
+    with open(os.path.join(out_dir, 'load.sql'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def generate(out_dir, n_users=700, n_products=186, seed=0, chunk_users=50000, catalog_dir=None):
+    # catalog_dir: export of an already seeded database; n_users and n_products
+    # are then taken from it
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    rows, columns = {}, {}
+
+    def write(name, frame, append=False):
+        write_csv(frame, out_dir, name, append)
+        rows[name] = rows.get(name, 0) + len(frame)
+        columns[name] = list(frame.columns)
+
+    if catalog_dir is None:
+        catalog = dict(zip(['categories', 'products', 'product_categories', 'variants'],
+                           generate_catalog(rng, n_products)))
+        for name, frame in catalog.items():
+            write(name, frame)
+        variants, products, existing_users, existing_carts = catalog['variants'], catalog['products'], None, None
+    else:
+        variants, products, existing_users, existing_carts = read_catalog(catalog_dir)
+        n_users = len(existing_users)
+    variant_ids = variants['variant_id'].to_numpy()
+    variant_prices = variants['price'].to_numpy()
+    product_ids = products['product_id'].to_numpy()
+
+    for start in range(0, n_users, chunk_users):
+        size = min(chunk_users, n_users - start)
+        names = ['carts', 'cart_items', 'wishlist_items', 'orders', 'order_items', 'cart_events']
+        if existing_users is None:
+            users, carts = generate_users(rng, start, size)
+            names = ['users', *names]
+            frames = [users, carts]
+        else:
+            users = existing_users.iloc[start:start + size]
+            carts = new_carts(rng, users, existing_carts)
+            frames = [carts]
+        activity = generate_activity(rng, users, carts, variant_ids, variant_prices, product_ids)
+        for name, frame in zip(names, [*frames, *activity]):
+            write(name, frame, append=start > 0)
+
+    write_load_script(out_dir, columns, seed)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a seeded mock dataset as CSV plus a psql load script')
+    parser.add_argument('out_dir', nargs='?', default='mock_csv')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-users', type=int, default=50000,
+                        help='users generated and written per chunk; bounds memory use')
+    parser.add_argument('--catalog-dir',
+                        help='export of a seeded database: generate activity for its users and catalog only')
+    args = parser.parse_args()
+    if args.catalog_dir and (args.users is not None or args.products is not None):
+        parser.error('--users and --products come from --catalog-dir')
+    rows = generate(args.out_dir, args.users or 700, args.products or 186, args.seed, args.chunk_users,
+                    args.catalog_dir)
+    print(f"✅ Generated {', '.join(f'{n} {name}' for name, n in rows.items())} in {args.out_dir}")